@@ -9,12 +9,18 @@ base_dir    = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Judgment_Knowled
 input_path  = os.path.join(base_dir, model_name, "predictions.jsonl")
 output_path = os.path.join(base_dir, model_name, "predictions_cleaned.jsonl")
 
+# 预编译的正则，避免每条记录重复查找编译缓存
+_THINK_BLOCK_RE = re.compile(r'<\s*think\b[^>]*>[\s\S]*?<\s*/\s*think\s*>', flags=re.IGNORECASE)
+_THINK_OPEN_TAIL_RE = re.compile(r'<\s*think\b[^>]*>[\s\S]*$', flags=re.IGNORECASE)
+_CHOICE_RE = re.compile(r'[A-Da-d]')
+_ANSWER_RE = re.compile(r'(?i)\b(A|B|C|D|True|False)\b')
+
 def strip_think(text: str) -> str:
     if not text:
         return ""
     t = html.unescape(text)
-    t = re.sub(r'<\s*think\b[^>]*>[\s\S]*?<\s*/\s*think\s*>', '', t, flags=re.IGNORECASE)
-    t = re.sub(r'<\s*think\b[^>]*>[\s\S]*$', '', t, flags=re.IGNORECASE)
+    t = _THINK_BLOCK_RE.sub('', t)
+    t = _THINK_OPEN_TAIL_RE.sub('', t)
     return t.strip()
 
 def tail(text: str, n: int = 200) -> str:
@@ -24,7 +30,7 @@ def tail(text: str, n: int = 200) -> str:
 def normalize_token(tok: str) -> Optional[str]:
     if not tok:
         return None
-    if re.fullmatch(r'[A-Da-d]', tok):
+    if _CHOICE_RE.fullmatch(tok):
         return tok.upper()
     low = tok.lower()
     if low == "true":
@@ -37,7 +43,7 @@ def extract_final_answer(raw: str) -> str:
     if not raw:
         return ""
     t = tail(strip_think(raw), 240)
-    matches = list(re.finditer(r'(?i)\b(A|B|C|D|True|False)\b', t))
+    matches = list(_ANSWER_RE.finditer(t))
     if not matches:
         return ""
     ans = matches[-1].group(1)
@@ -1,8 +1,16 @@
 import yaml
 import logging
 import time
+import asyncio
+import threading
+import random
+import email.utils
+import json
+import hashlib
+import sqlite3
 from typing import Optional, Dict, List, Union
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from openai.types.chat import ChatCompletion
 import base64
 # import ollama
@@ -13,6 +21,13 @@ import os
 # 支持流式调用，设置参数collect=True会将流式调用的结果收集后返回，False会将整个流返回
 # 流式调用时不支持统计token消耗
 # 使用大语言模型的入口函数为call_language_model
+# 大批量并发调用可使用AsyncModelClient（基于AsyncOpenAI），在一个事件循环中用agenerate/agenerate_many发起请求
+# 配置文件按(路径, 修改时间)在进程内缓存，OpenAI客户端（及其HTTP连接池）按(provider, base_url, api_key)复用
+# 每个(provider, base_url, api_key)有一个限流器：rpm/tpm令牌桶 + AIMD自适应并发上限，429/5xx/超时按指数退避（full jitter）重试，
+# 优先遵循服务端返回的Retry-After；限流参数为all_models条目中的可选字段，见下方示例配置
+# 可选的磁盘响应缓存：传入cache_path（或设置环境变量LLM_CACHE_PATH）后，相同的
+# (provider, model, system_prompt, user_prompt, temperature, max_tokens, enable_thinking, cache_seed)只请求一次，
+# 缓存为SQLite文件，超过LLM_CACHE_MAX_MB后按最近使用时间淘汰；带图片或真流式调用不缓存，出错的结果不缓存
 # 支持使用嵌入模型，需使用call_embedding_model函数调用，暂不支持多模态嵌入
 # 处理OpenAI真流式响应的示例代码
 #     is_first_chunk = True
@@ -48,6 +63,14 @@ import os
 #     model_name: ["gpt-4o","gpt-4o-mini"]
 #     api_key: "xxx"
 #     base_url: "https://api.openai.com/v1"
+#     # 以下限流字段均为可选：每分钟请求数、每分钟token数、并发上限/下限/初始值、目标延迟(秒)、最大尝试次数
+#     rpm: 500
+#     tpm: 200000
+#     max_concurrency: 64
+#     min_concurrency: 1
+#     initial_concurrency: 16
+#     latency_target: 60
+#     max_retries: 6
 #   - provider: "volcengine"
 #     model_name: ["deepseek-r1-250120","deepseek-v3-241226","doubao-1-5-pro-256k-250115"]
 #     api_key: "xxx"
@@ -97,8 +120,8 @@ class ModelConfig:
             for model_info in all_models:
                 if model_info.get('provider') == model_provider:
                     if model_name in model_info.get('model_name', []):
-                        model_info['model_name'] = model_name
-                        return model_info  # 返回匹配的模型配置
+                        # 返回副本，避免改写（进程内缓存的）配置中的模型列表
+                        return dict(model_info, model_name=model_name)  # 返回匹配的模型配置
 
             # 如果没有找到匹配的 provider 或 model_name，记录警告并返回空字典
             logging.warning(f"No valid configuration found for provider '{model_provider}' and model name '{model_name}'")
@@ -118,8 +141,8 @@ class ModelConfig:
             for model_info in embedding_models:
                 if model_info.get('provider') == model_provider:
                     if model_name in model_info.get('model_name', []):
-                        model_info['model_name'] = model_name
-                        return model_info  # 返回匹配的模型配置
+                        # 返回副本，避免改写（进程内缓存的）配置中的模型列表
+                        return dict(model_info, model_name=model_name)  # 返回匹配的模型配置
 
             # 如果没有找到匹配的 provider 或 model_name，记录警告并返回空字典
             logging.warning(f"No valid embedding configuration found for provider '{model_provider}' and model name '{model_name}'")
@@ -129,6 +152,406 @@ class ModelConfig:
             logging.error(f"Error in get_embedding_credentials: {str(e)}")
             return {}
 
+
+# ===== 进程级配置与客户端缓存 =====
+
+_config_cache = {}
+_sync_clients = {}
+_cache_lock = threading.Lock()
+
+
+def get_model_config(config_path: str) -> ModelConfig:
+    """按(绝对路径, 修改时间)缓存解析后的配置，配置文件改动后自动重新读取"""
+    path = os.path.abspath(config_path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _cache_lock:
+        cached = _config_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    config = ModelConfig(config_path)
+    with _cache_lock:
+        _config_cache[path] = (mtime, config)
+    return config
+
+
+def _client_key(credentials: Dict, base_url: str) -> tuple:
+    # 同一provider可能配置了多组api_key，因此api_key也参与区分
+    return credentials.get('provider'), base_url, credentials.get('api_key', '')
+
+
+def _openai_base_url(credentials: Dict) -> str:
+    base_url = credentials.get('base_url') or 'https://api.openai.com/v1'
+    if credentials.get('provider') == "ollama" and not base_url.rstrip('/').endswith('/v1'):
+        # Ollama 的 OpenAI 兼容接口位于 /v1
+        base_url = base_url.rstrip('/') + '/v1'
+    return base_url
+
+
+def get_openai_client(credentials: Dict) -> OpenAI:
+    """同一(provider, base_url, api_key)在进程内共用一个OpenAI客户端，线程安全"""
+    base_url = credentials.get('base_url', 'https://api.openai.com/v1')
+    key = _client_key(credentials, base_url)
+    with _cache_lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            # 重试由本模块的限流器统一处理，关闭SDK内置重试避免重复退避
+            client = OpenAI(api_key=credentials.get('api_key', ''), base_url=base_url, max_retries=0)
+            _sync_clients[key] = client
+    return client
+
+
+# ===== 限流与自适应并发 =====
+
+_rate_limiters = {}
+
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+
+
+class ProviderRateLimiter:
+    """
+    单个(provider, base_url, api_key)的限流器，线程与协程均可使用：
+    - rpm/tpm 两个令牌桶，容量为一分钟的预算，未配置则不限制；
+      请求前按prompt长度预估扣除token，完成后按实际用量多退少补
+    - 并发上限按AIMD调整：成功且延迟不超过latency_target时加性增长（约每轮+1），
+      遇到429/5xx/超时或延迟过高时乘性减半（冷却期内只减一次，避免一批失败把并发压到底）
+    - 429带Retry-After时，整个provider暂停到该时刻，不再让所有线程同时撞限
+    """
+
+    POLL_INTERVAL = 0.05
+    DECREASE_COOLDOWN = 2.0
+
+    def __init__(
+            self,
+            rpm: Optional[float] = None,
+            tpm: Optional[float] = None,
+            max_concurrency: int = 64,
+            min_concurrency: int = 1,
+            initial_concurrency: Optional[int] = None,
+            latency_target: Optional[float] = None,
+            max_retries: int = 6
+    ):
+        self.rpm = float(rpm) if rpm else None
+        self.tpm = float(tpm) if tpm else None
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        if initial_concurrency is None:
+            initial_concurrency = min(self.max_concurrency, 16)
+        self.limit = float(max(self.min_concurrency, min(int(initial_concurrency), self.max_concurrency)))
+        self.latency_target = float(latency_target) if latency_target else None
+        self.max_retries = max(1, int(max_retries))
+
+        self.in_flight = 0
+        self.request_level = self.rpm or 0.0
+        self.token_level = self.tpm or 0.0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.last_refill = time.monotonic()
+        self.stats = {"requests": 0, "rate_limited": 0, "overloaded": 0, "max_limit": self.limit}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_credentials(cls, credentials: Dict) -> "ProviderRateLimiter":
+        kwargs = {k: credentials[k] for k in (
+            'rpm', 'tpm', 'max_concurrency', 'min_concurrency', 'initial_concurrency', 'latency_target', 'max_retries'
+        ) if credentials.get(k) is not None}
+        return cls(**kwargs)
+
+    def _refill(self, now: float):
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        if self.rpm:
+            self.request_level = min(self.rpm, self.request_level + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self.token_level = min(self.tpm, self.token_level + elapsed * self.tpm / 60.0)
+
+    def try_acquire(self, cost: int) -> float:
+        """尝试占用一个并发名额并扣除预算；成功返回0，否则返回建议等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= int(self.limit):
+                return self.POLL_INTERVAL
+            self._refill(now)
+            if self.rpm and self.request_level < 1:
+                return max(self.POLL_INTERVAL, (1 - self.request_level) * 60.0 / self.rpm)
+            # 单个请求的预估超过整桶容量时只要求桶满，否则永远等不到
+            need = min(cost, self.tpm) if self.tpm else 0
+            if self.tpm and self.token_level < need:
+                return max(self.POLL_INTERVAL, (need - self.token_level) * 60.0 / self.tpm)
+            if self.rpm:
+                self.request_level -= 1
+            if self.tpm:
+                self.token_level -= cost
+            self.in_flight += 1
+            self.stats["requests"] += 1
+            return 0.0
+
+    def acquire(self, cost: int):
+        while True:
+            wait = self.try_acquire(cost)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, cost: int):
+        while True:
+            wait = self.try_acquire(cost)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _decrease(self, now: float):
+        if now - self.last_decrease >= self.DECREASE_COOLDOWN:
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self.last_decrease = now
+
+    def release(
+            self,
+            cost: int,
+            used_tokens: int,
+            latency: float,
+            overloaded: bool = False,
+            rate_limited: bool = False,
+            retry_after: Optional[float] = None
+    ):
+        """归还并发名额，按实际token用量校正令牌桶，并根据结果调整并发上限"""
+        with self._lock:
+            now = time.monotonic()
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.tpm:
+                self.token_level = min(self.tpm, self.token_level + cost - (used_tokens or 0))
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+            if overloaded or rate_limited:
+                self.stats["overloaded"] += int(overloaded)
+                self._decrease(now)
+            elif self.latency_target and latency > self.latency_target:
+                self._decrease(now)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / max(self.limit, 1.0))
+                self.stats["max_limit"] = max(self.stats["max_limit"], self.limit)
+
+
+def get_rate_limiter(credentials: Dict) -> ProviderRateLimiter:
+    key = _client_key(credentials, _openai_base_url(credentials))
+    with _cache_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = ProviderRateLimiter.from_credentials(credentials)
+            _rate_limiters[key] = limiter
+    return limiter
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """粗略估计prompt的token数（约4字符/token），仅用于tpm预扣"""
+    chars = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+    return chars // 4 + 1
+
+
+def _parse_retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value:
+            return float(value) / 1000.0
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def classify_api_error(e: Exception) -> (bool, bool, bool, Optional[float]):
+    """
+    判断异常是否值得重试
+    :return: (retryable, overloaded, rate_limited, retry_after)
+    """
+    status = getattr(e, 'status_code', None)
+    str_e = str(e).lower()
+    if status == 429 or "rate limit" in str_e or "too many requests" in str_e:
+        # 额度耗尽重试也没有意义
+        if "insufficient_quota" in str_e:
+            return False, False, False, None
+        return True, False, True, _parse_retry_after(e)
+    if status is not None and (status >= 500 or status in (408, 409)):
+        return True, True, False, _parse_retry_after(e)
+    if "timeout" in str_e or "timed out" in str_e or "connection error" in str_e:
+        return True, True, False, None
+    if "nonetype" in str_e:
+        return True, False, False, None
+    return False, False, False, None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """指数退避 + full jitter；服务端给出Retry-After时以其为准并加少量抖动"""
+    if retry_after:
+        return retry_after + random.uniform(0, 1.0)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _final_error_message(e: Exception, retryable: bool, attempts: int, prefix: str) -> str:
+    if retryable:
+        return f"API request failed after {attempts} attempts: {str(e)}"
+    return f"{prefix}: {str(e)}"
+
+
+# ===== 响应缓存 =====
+
+DEFAULT_CACHE_MAX_BYTES = int(float(os.environ.get("LLM_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+_response_caches = {}
+
+
+class ResponseCache:
+    """
+    以请求内容哈希为键的SQLite响应缓存，可被多线程、多进程共用（WAL）。
+    总大小超过max_bytes时淘汰最久未使用的条目，直到降到90%以下。
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key        TEXT PRIMARY KEY,
+                response   TEXT NOT NULL,
+                tokens     INTEGER NOT NULL,
+                size       INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used  REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def make_key(**fields) -> str:
+        payload = json.dumps(fields, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self.conn.execute("SELECT response, tokens FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            self.tokens_saved += row[1]
+            return row[0], row[1]
+
+    def put(self, key: str, response: str, tokens: int):
+        size = len(response.encode("utf-8")) + len(key)
+        now = time.time()
+        with self._lock:
+            try:
+                old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, response, int(tokens or 0), size, now, now)
+                )
+                self.conn.commit()
+                self.total_bytes += size - (old[0] if old else 0)
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+            except sqlite3.Error as e:
+                # 缓存写入失败不影响本次调用结果
+                logging.warning(f"Response cache write failed: {str(e)}")
+
+    def _evict(self):
+        # 其他进程也可能写入，淘汰前重新统计
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self.total_bytes <= target:
+            return
+        freed = 0
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            victims.append((key,))
+            freed += size
+            if self.total_bytes - freed <= target:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.conn.commit()
+        self.total_bytes -= freed
+        logging.info(f"Response cache evicted {len(victims)} entries ({freed} bytes) from {self.path}")
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "tokens_saved": self.tokens_saved,
+            "size_bytes": self.total_bytes
+        }
+
+
+def get_response_cache(cache_path: Optional[str] = None) -> Optional[ResponseCache]:
+    """返回cache_path（缺省取环境变量LLM_CACHE_PATH）对应的进程内共享缓存，未配置时返回None"""
+    cache_path = cache_path or os.environ.get("LLM_CACHE_PATH")
+    if not cache_path:
+        return None
+    path = os.path.abspath(cache_path)
+    with _cache_lock:
+        cache = _response_caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path)
+            _response_caches[path] = cache
+    return cache
+
+
+def get_cache_stats() -> List[Dict]:
+    """本进程中所有响应缓存的命中次数与节省的token数"""
+    with _cache_lock:
+        return [cache.stats() for cache in _response_caches.values()]
+
+
+def _response_cache_key(model_provider, model_name, system_prompt, user_prompt,
+                        temperature, max_tokens, enable_thinking, cache_seed) -> str:
+    return ResponseCache.make_key(
+        provider=model_provider,
+        model=model_name,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        enable_thinking=enable_thinking,
+        seed=cache_seed
+    )
+
+
 class BaseModel:
     """模型基类"""
 
@@ -152,10 +575,7 @@ class OpenAIModel(BaseModel):
 
     def __init__(self, credentials: Dict):
         super().__init__(credentials)
-        self.client = OpenAI(
-            api_key=credentials.get('api_key', ''),
-            base_url=credentials.get('base_url', 'https://api.openai.com/v1')
-        )
+        self.client = get_openai_client(credentials)
 
     def _encode_image(self, image_path: str) -> str:
         # 将图片编码为base64字符串，并且直接以openai api需要的格式返回
@@ -202,39 +622,34 @@ class OpenAIModel(BaseModel):
         messages = self._prepare_messages(**kwargs)
         params = self._prepare_params(messages, **kwargs)
 
-        max_retries = 3
-        retry_delay = 10
+        limiter = get_rate_limiter(self.credentials)
+        cost = estimate_prompt_tokens(messages)
+        max_retries = limiter.max_retries
         for attempt in range(max_retries):
+            limiter.acquire(cost)
+            start = time.monotonic()
+            used_tokens, outcome = 0, ()
             try:
                 response = self.client.chat.completions.create(**params)
-                return self._parse_response(response)
+                result = self._parse_response(response)
+                used_tokens = result[1]
+                return result
             except Exception as e:
-                str_e = str(e).lower()
-                if "timeout" in str_e or "connection error" in str_e:
-                    if attempt < max_retries - 1:
-                        logging.warning(f"Network error: {str(e)}, retrying in {retry_delay}s...")
-                        print(f"Network error: {str(e)}, retrying in {retry_delay}s...")
-                        time.sleep(retry_delay)
-                    else:
-                        error_msg = f"API request failed after {max_retries} attempts: {str(e)}"
-                        print(f"API request failed after {max_retries} attempts: {str(e)}")
-                        logging.error(error_msg)
-                        return "", 0, error_msg
-                elif "NoneType" in str_e:
-                    if attempt < max_retries - 1:
-                        logging.warning(f"Error: Did not receive response object, retrying in {retry_delay}s...")
-                        print(f"Network error: {str(e)}, retrying in {retry_delay}s...")
-                        time.sleep(retry_delay)
-                    else:
-                        error_msg = f"API request failed after {max_retries} attempts: {str(e)}"
-                        print(f"API request failed after {max_retries} attempts: {str(e)}")
-                        logging.error(error_msg)
-                        return "", 0, error_msg
-                else:
-                    error_msg = f"OpenAI API error: {str(e)}"
-                    print(f"OpenAI API error: {str(e)}")
-                    logging.error(error_msg)
-                    return "", 0, error_msg
+                retryable, overloaded, rate_limited, retry_after = classify_api_error(e)
+                outcome = (overloaded, rate_limited, retry_after)
+                error = e
+            finally:
+                # 每次acquire恰好对应一次release，异常未被捕获时同样归还名额
+                limiter.release(cost, used_tokens, time.monotonic() - start, *outcome)
+            if retryable and attempt < max_retries - 1:
+                delay = backoff_delay(attempt, retry_after)
+                logging.warning(f"API error: {str(error)}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+                time.sleep(delay)
+                continue
+            error_msg = _final_error_message(error, retryable, max_retries, "OpenAI API error")
+            print(error_msg)
+            logging.error(error_msg)
+            return "", 0, error_msg
 
     def generate_stream(self, **kwargs) -> (str, int, str):
         """流式生成回复，设置collect为True返回格式与非流式相同，否则返回整个流
@@ -248,8 +663,9 @@ class OpenAIModel(BaseModel):
         reasoning_content = ""
         estimated_tokens = 0
 
-        max_retries = 3
-        retry_delay = 10
+        limiter = get_rate_limiter(self.credentials)
+        cost = estimate_prompt_tokens(messages)
+        max_retries = limiter.max_retries
 
         collect_stream_answer = kwargs.get('collect', True)
 
@@ -258,11 +674,15 @@ class OpenAIModel(BaseModel):
             del kwargs['collect']
 
         for attempt in range(max_retries):
+            limiter.acquire(cost)
+            start = time.monotonic()
+            used_tokens, outcome = 0, ()
             try:
                 stream = self.client.chat.completions.create(**params)
 
                 if not collect_stream_answer:
-                    # 如果不收集流式结果，直接返回stream对象
+                    # 如果不收集流式结果，直接返回stream对象（无法得知用量，按预估计）
+                    used_tokens = cost
                     return stream, 0, None
                 else:
                     for chunk in stream:
@@ -285,22 +705,25 @@ class OpenAIModel(BaseModel):
                     if reasoning_content:
                         complete_response = f"<think>\n{reasoning_content}\n</think>\n\n{complete_response}"
 
+                    used_tokens = cost + len(complete_response) // 4
                     return complete_response, tokens, None
 
             except Exception as e:
-                str_e = str(e).lower()
-                if "timeout" in str_e or "connection error" in str_e:
-                    if attempt < max_retries - 1:
-                        logging.warning(f"Network error: {str(e)}, retrying in {retry_delay}s...")
-                        time.sleep(retry_delay)
-                    else:
-                        error_msg = f"API request failed after {max_retries} attempts: {str(e)}"
-                        logging.error(error_msg)
-                        return complete_response, int(estimated_tokens), error_msg
-                else:
-                    error_msg = f"OpenAI API error: {str(e)}"
-                    logging.error(error_msg)
-                    return complete_response, int(estimated_tokens), error_msg
+                retryable, overloaded, rate_limited, retry_after = classify_api_error(e)
+                outcome = (overloaded, rate_limited, retry_after)
+                error = e
+            finally:
+                limiter.release(cost, used_tokens, time.monotonic() - start, *outcome)
+            if retryable and attempt < max_retries - 1:
+                delay = backoff_delay(attempt, retry_after)
+                logging.warning(f"API error: {str(error)}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+                complete_response = ""
+                reasoning_content = ""
+                time.sleep(delay)
+                continue
+            error_msg = _final_error_message(error, retryable, max_retries, "OpenAI API error")
+            logging.error(error_msg)
+            return complete_response, int(estimated_tokens), error_msg
 
     def _parse_response(self, response: ChatCompletion) -> (str, int, str):
         complete_response = response.choices[0].message.content
@@ -467,6 +890,196 @@ class OllamaModel(BaseModel):
             None
         )
 
+class AsyncOpenAIModel(OpenAIModel):
+    """OpenAI 兼容接口的异步调用，客户端由AsyncModelClient提供"""
+
+    def __init__(self, credentials: Dict, client: AsyncOpenAI):
+        BaseModel.__init__(self, credentials)
+        self.client = client
+        self.is_ollama = credentials.get('provider') == "ollama"
+
+    def _prepare_params(self, messages, **kwargs) -> dict:
+        if not self.is_ollama:
+            return super()._prepare_params(messages, **kwargs)
+        # Ollama 不识别enable_thinking，与OllamaModel一样通过 /no_think 关闭推理
+        if "qwen3" in str(self.credentials.get('model_name')) and not kwargs.get('enable_thinking', True):
+            content = messages[-1]["content"]
+            if isinstance(content, str):
+                messages[-1]["content"] = content + " /no_think"
+            else:
+                content[0]["text"] += " /no_think"
+        params = {
+            "model": self.credentials.get('model_name', 'llama3.1:8b'),
+            "messages": messages,
+            "temperature": kwargs.get('temperature'),
+            "max_tokens": kwargs.get('max_tokens')
+        }
+        return {k: v for k, v in params.items() if v is not None}
+
+    def _parse_response(self, response: ChatCompletion, enable_thinking=None) -> (str, int, str):
+        complete_response, tokens, error = super()._parse_response(response)
+        if self.is_ollama:
+            if "qwen3" not in str(self.credentials.get('model_name')):
+                enable_thinking = None
+            if not enable_thinking:
+                complete_response = complete_response.replace("<think>\n", "").replace("\n</think>\n\n", "")
+        return complete_response, tokens, error
+
+    async def agenerate(self, **kwargs) -> (str, int, str):
+        """非流式生成回复（异步），重试与错误处理与generate一致"""
+        messages = self._prepare_messages(**kwargs)
+        params = self._prepare_params(messages, **kwargs)
+
+        limiter = get_rate_limiter(self.credentials)
+        cost = estimate_prompt_tokens(messages)
+        max_retries = limiter.max_retries
+        for attempt in range(max_retries):
+            await limiter.aacquire(cost)
+            start = time.monotonic()
+            used_tokens, outcome = 0, ()
+            try:
+                response = await self.client.chat.completions.create(**params)
+                result = self._parse_response(response, kwargs.get('enable_thinking', True))
+                used_tokens = result[1]
+                return result
+            except Exception as e:
+                retryable, overloaded, rate_limited, retry_after = classify_api_error(e)
+                outcome = (overloaded, rate_limited, retry_after)
+                error = e
+            finally:
+                # 任务被取消（CancelledError）时同样归还名额
+                limiter.release(cost, used_tokens, time.monotonic() - start, *outcome)
+            if retryable and attempt < max_retries - 1:
+                delay = backoff_delay(attempt, retry_after)
+                logging.warning(f"API error: {str(error)}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+                await asyncio.sleep(delay)
+                continue
+            error_msg = _final_error_message(error, retryable, max_retries, "OpenAI API error")
+            logging.error(error_msg)
+            return "", 0, error_msg
+
+
+class AsyncModelClient:
+    """
+    异步调用入口，适合成千上万个请求并发：所有请求在一个事件循环中完成，不再每个请求占用一个线程。
+    同一(provider, base_url, api_key)共用一个AsyncOpenAI客户端（httpx连接池，keep-alive复用TLS连接），
+    配置文件通过get_model_config在进程内缓存。
+
+    用法：
+        client = AsyncModelClient(config_path="./llm_config.yaml")
+        results = asyncio.run(client.run_many(requests))
+    其中requests的每一项为agenerate的关键字参数字典，results与requests一一对应，元素为(response_text, tokens_used, error_msg)
+    """
+
+    def __init__(
+            self,
+            config_path: str = r'./llm_config.yaml',
+            max_connections: int = 256,
+            timeout: float = 600.0,
+            cache_path: Optional[str] = None
+    ):
+        self.config_path = config_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cache = get_response_cache(cache_path)
+        self._clients = {}
+
+    def _get_client(self, credentials: Dict) -> AsyncOpenAI:
+        # httpx.AsyncClient 绑定创建它的事件循环，因此按事件循环区分
+        base_url = _openai_base_url(credentials)
+        key = _client_key(credentials, base_url) + (id(asyncio.get_running_loop()),)
+        client = self._clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=self.timeout
+            )
+            client = AsyncOpenAI(
+                api_key=credentials.get('api_key') or 'ollama',
+                base_url=base_url,
+                http_client=http_client,
+                max_retries=0
+            )
+            self._clients[key] = client
+        return client
+
+    async def agenerate(
+            self,
+            model_provider: str,
+            model_name: str,
+            system_prompt: str,
+            user_prompt: str,
+            enable_thinking: Optional[bool] = None,
+            temperature: Optional[float] = None,
+            max_tokens: Optional[int] = None,
+            files: Optional[List[str]] = None,
+            cache_seed: Optional[Union[int, str]] = None
+    ) -> (str, int, str):
+        """参数含义与call_language_model相同（不支持流式），返回(response_text, tokens_used, error_msg)"""
+        credentials = get_model_config(self.config_path).get_credentials(model_provider, model_name)
+        if not credentials:
+            error_msg = f"Model {model_name} not found in config"
+            logging.error(error_msg)
+            return "", 0, error_msg
+
+        cache_key = None
+        if self.cache is not None and not files:
+            cache_key = _response_cache_key(model_provider, model_name, system_prompt, user_prompt,
+                                            temperature, max_tokens, enable_thinking, cache_seed)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached[0], cached[1], None
+
+        model = AsyncOpenAIModel(credentials, self._get_client(credentials))
+        try:
+            result = await model.agenerate(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                enable_thinking=enable_thinking,
+                files=files
+            )
+            response_text, tokens, error = result
+            logging.info(f"API call succeeded. Model: {model_name}, Provider: {model_provider}, Tokens used: {tokens}")
+            if cache_key is not None and not error and response_text:
+                self.cache.put(cache_key, response_text, tokens)
+            return result
+        except Exception as e:
+            error_msg = f"Unexpected error: {str(e)}"
+            logging.error(error_msg)
+            return "", 0, error_msg
+
+    async def agenerate_many(self, requests: List[Dict], max_concurrency: int = 64) -> List[tuple]:
+        """
+        并发执行多个请求，最多max_concurrency个同时在途，结果顺序与requests一致；
+        实际在途数量还受各provider限流器的自适应并发上限约束
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def _run(req):
+            async with semaphore:
+                return await self.agenerate(**req)
+
+        return await asyncio.gather(*(_run(req) for req in requests))
+
+    async def aclose(self):
+        """关闭当前事件循环上创建的客户端及其连接池"""
+        loop_id = id(asyncio.get_running_loop())
+        for key in [k for k in self._clients if k[-1] == loop_id]:
+            await self._clients.pop(key).close()
+
+    async def run_many(self, requests: List[Dict], max_concurrency: int = 64) -> List[tuple]:
+        """agenerate_many结束后关闭连接池，便于在同步代码中用asyncio.run调用"""
+        try:
+            return await self.agenerate_many(requests, max_concurrency)
+        finally:
+            await self.aclose()
+
+
 # 添加嵌入模型基类
 class BaseEmbeddingModel:
     """嵌入模型基类"""
@@ -488,10 +1101,7 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
     
     def __init__(self, credentials: Dict):
         super().__init__(credentials)
-        self.client = OpenAI(
-            api_key=credentials.get('api_key'),
-            base_url=credentials.get('base_url')
-        )
+        self.client = get_openai_client(credentials)
         
     def _encode_image(self, image_path: str) -> str:
         """将图片编码为base64字符串，直接以OpenAI API需要的格式返回"""
@@ -515,9 +1125,6 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
         Returns:
             (embeddings, tokens_used, error_msg)
         """
-        max_retries = 3
-        retry_delay = 10
-        
         # 确保text是列表形式
         if isinstance(text, str):
             input_texts = [text]
@@ -525,8 +1132,15 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
             input_texts = text
             
         input_data = input_texts
+
+        limiter = get_rate_limiter(self.credentials)
+        cost = sum(len(t) for t in input_texts) // 4 + 1
+        max_retries = limiter.max_retries
             
         for attempt in range(max_retries):
+            limiter.acquire(cost)
+            start = time.monotonic()
+            used_tokens, outcome = 0, ()
             try:
                 
                 response = self.client.embeddings.create(
@@ -537,26 +1151,25 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
                 # 提取嵌入向量
                 embeddings = [data.embedding for data in response.data]
                 tokens_used = response.usage.total_tokens if hasattr(response, 'usage') else 0
+                used_tokens = tokens_used
                 
                 return embeddings, tokens_used, None
                 
             except Exception as e:
-                str_e = str(e).lower()
-                if "timeout" in str_e or "connection error" in str_e:
-                    if attempt < max_retries - 1:
-                        logging.warning(f"Network error: {str(e)}, retrying in {retry_delay}s...")
-                        print(f"Network error: {str(e)}, retrying in {retry_delay}s...")
-                        time.sleep(retry_delay)
-                    else:
-                        error_msg = f"API request failed after {max_retries} attempts: {str(e)}"
-                        print(f"API request failed after {max_retries} attempts: {str(e)}")
-                        logging.error(error_msg)
-                        return [], 0, error_msg
-                else:
-                    error_msg = f"OpenAI Embedding API error: {str(e)}"
-                    print(f"OpenAI Embedding API error: {str(e)}")
-                    logging.error(error_msg)
-                    return [], 0, error_msg
+                retryable, overloaded, rate_limited, retry_after = classify_api_error(e)
+                outcome = (overloaded, rate_limited, retry_after)
+                error = e
+            finally:
+                limiter.release(cost, used_tokens, time.monotonic() - start, *outcome)
+            if retryable and attempt < max_retries - 1:
+                delay = backoff_delay(attempt, retry_after)
+                logging.warning(f"API error: {str(error)}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+                time.sleep(delay)
+                continue
+            error_msg = _final_error_message(error, retryable, max_retries, "OpenAI Embedding API error")
+            print(error_msg)
+            logging.error(error_msg)
+            return [], 0, error_msg
 
 
 class OllamaEmbeddingModel(BaseEmbeddingModel):
@@ -656,7 +1269,9 @@ def call_language_model(
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         files: Optional[List[str]] = None,
-        config_path: str = r'./llm_config.yaml'
+        config_path: str = r'./llm_config.yaml',
+        cache_path: Optional[str] = None,
+        cache_seed: Optional[Union[int, str]] = None
 ) -> (str, int, str):
     """
     调用语言模型的统一入口函数，将此函数import到代码中即可使用，请勿通过此函数调用嵌入模型
@@ -671,12 +1286,14 @@ def call_language_model(
     :param max_tokens: 最大生成token数，可选
     :param files: 图片文件路径列表，可选
     :param config_path: 配置文件路径
+    :param cache_path: 响应缓存SQLite文件路径，可选，缺省取环境变量LLM_CACHE_PATH，都未设置则不缓存
+    :param cache_seed: 参与缓存键的附加值，如生成轮次，使不同轮次各自缓存
     :return: 
     一般：(response_text, tokens_used, error_msg)
     真流式输出时：(response_stream, tokens_used, error_msg)
     """
     # 初始化
-    config = ModelConfig(config_path)
+    config = get_model_config(config_path)
     credentials = config.get_credentials(model_provider, model_name)
 
     if not credentials:
@@ -696,6 +1313,17 @@ def call_language_model(
         print(error_msg)
         return "", 0, error_msg
 
+    # 真流式调用返回的是流对象，带图片的请求键中不含图片内容，二者都不缓存
+    cache = get_response_cache(cache_path)
+    cache_key = None
+    if cache is not None and not files and not (stream and not collect):
+        cache_key = _response_cache_key(model_provider, model_name, system_prompt, user_prompt,
+                                        temperature, max_tokens, enable_thinking, cache_seed)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Response cache hit. Model: {model_name}, Provider: {model_provider}, Tokens saved: {cached[1]}")
+            return cached[0], cached[1], None
+
     model = model_class(credentials)
 
     try:
@@ -719,8 +1347,10 @@ def call_language_model(
                 files=files
             )
         # 记录成功日志
-        _, tokens, _ = result
+        response_text, tokens, error = result
         logging.info(f"API call succeeded. Model: {model_name}, Provider: {model_provider}, Tokens used: {tokens}")
+        if cache_key is not None and not error and response_text:
+            cache.put(cache_key, response_text, tokens)
         return result
     except Exception as e:
         error_msg = f"Unexpected error: {str(e)}"
@@ -747,7 +1377,7 @@ def call_embedding_model(
     :return: (embeddings, tokens_used, error_msg)
     """
     # 初始化
-    config = ModelConfig(config_path)
+    config = get_model_config(config_path)
     credentials = config.get_embedding_credentials(model_provider, model_name)
 
     if not credentials:
@@ -15,6 +15,8 @@ base_dir = r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results"
 MODEL_PROVIDER = "JHY"
 MODEL_NAME     = "gpt-4o"
 CONFIG_PATH    = "./llm_config.yaml"
+# 相同的错误文本只请求一次分类，跨轮次、跨模型、跨重跑共用
+CACHE_PATH     = os.environ.get("LLM_CACHE_PATH", os.path.join(base_dir, "error_classify_cache.sqlite"))
 
 MAX_WORKERS   = 32
 TEMPERATURE   = 0.2
@@ -72,10 +74,96 @@ def classify_error(err_text: str) -> str:
         temperature=TEMPERATURE,
         max_tokens=MAX_TOKENS,
         config_path=CONFIG_PATH,
+        cache_path=CACHE_PATH,
     )
     label = clean_output(resp)
     return _normalize_label(label)
 
+# ===== 错误模板去重 + 规则预分类 =====
+# 相同模板（去掉行号、SQL片段、标识符、数字后相同）的错误只分类一次；
+# 能被下列规则直接判定的模板不调用LLM
+DEDUP_TEMPLATES = True
+
+_LINE_CONTEXT_RE = re.compile(r'^\s*(line \d+:.*|\^\s*)$', re.IGNORECASE | re.MULTILINE)
+_QUOTED_RE = re.compile(r'"[^"\n]*"|\'[^\'\n]*\'|`[^`\n]*`')
+_OBJECT_NAME_RE = re.compile(
+    r'\b(function|relation|column|table|schema|type|database|role|index|sequence|view|operator|'
+    r'constraint|extension|alias|entry for table)\s+(?!does\b|is\b|not\b|of\b|matches\b|with\b)[\w.$]+(\([^)]*\))?',
+    re.IGNORECASE
+)
+_NUMBER_RE = re.compile(r'(?<![a-z_])[-+]?\d+(\.\d+)?(e[-+]?\d+)?', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+RULES = [
+    ("Environment/Connection Errors", re.compile(
+        r'statement timeout|canceling statement|timeout expired|timed out|could not connect|connection (refused|reset|error)|'
+        r'server closed the connection|terminating connection|too many connections|password authentication|'
+        r'permission denied|out of memory|could not translate host', re.IGNORECASE)),
+    ("SRID/Dimension Mismatch", re.compile(
+        r'mixed srid|srids? .*(do not|does not|don\'t) match|coordinate dimension|dimension mismatch|'
+        r'geometry has z dimension but column does not|column has z dimension but geometry does not', re.IGNORECASE)),
+    ("Geometry Parsing Errors", re.compile(
+        r'parse error|invalid geometry|geometry requires more points|cannot mix dimensionality|unknown wkb type|'
+        r'invalid hex|non-closed rings|geometry contains|unknown geometry type|invalid wkt|lwgeom_', re.IGNORECASE)),
+    ("Result Mismatch Errors", re.compile(
+        r'row count mismatch|column count mismatch|column subset match failed|result mismatch|行数不一致|'
+        r'expected \d+ rows?', re.IGNORECASE)),
+    ("PostGIS Function Errors", re.compile(
+        r'function [\w.$"]+(\([^)]*\))? does not exist|no function matches|function [\w.$"]+(\([^)]*\))? is not unique|'
+        r'operator does not exist|operator is not unique|could not choose a best candidate function', re.IGNORECASE)),
+    ("Missing Objects", re.compile(
+        r'(relation|column|table|schema|view|alias) [\w.$"]+ does not exist|missing from-clause entry|'
+        r'column reference [\w."]+ is ambiguous|column [\w."]+ must appear in the group by', re.IGNORECASE)),
+    ("SQL Syntax Errors", re.compile(
+        r'syntax error at|unterminated quoted|unterminated dollar|unterminated /\*|zero-length delimited identifier|'
+        r'empty query', re.IGNORECASE)),
+]
+
+
+def error_template(err_text: str) -> str:
+    """去掉行号/SQL上下文、引号内容、对象名和数字，得到错误模板"""
+    t = _LINE_CONTEXT_RE.sub(" ", err_text or "")
+    t = _QUOTED_RE.sub("<id>", t)
+    t = _OBJECT_NAME_RE.sub(lambda m: m.group(1) + " <id>", t)
+    t = _NUMBER_RE.sub("<n>", t)
+    return _SPACE_RE.sub(" ", t).strip().lower()
+
+
+def rule_classify(err_text: str):
+    """确定性规则预分类，无法判定时返回None"""
+    for label, pattern in RULES:
+        if pattern.search(err_text):
+            return label
+    return None
+
+
+def classify_templates(err_texts: list, model_name: str) -> dict:
+    """按模板分组，规则能判定的直接判定，其余每个模板取一条原文调用一次LLM；返回 err_text -> (error_type, 来源, 异常原因)"""
+    groups = OrderedDict()
+    for t in err_texts:
+        groups.setdefault(error_template(t), []).append(t)
+
+    labels, llm_templates = {}, []
+    for tpl, texts in groups.items():
+        label = rule_classify(texts[0])
+        if label:
+            labels[tpl] = (label, "rule", None)
+        else:
+            llm_templates.append(tpl)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(classify_error, groups[tpl][0]): tpl for tpl in llm_templates}
+        for fut in tqdm(as_completed(futures), total=len(futures), desc=f"Templates [{model_name}]", ncols=100):
+            tpl = futures[fut]
+            try:
+                labels[tpl] = (fut.result(), MODEL_NAME, None)
+            except Exception as e:
+                labels[tpl] = ("Environment/Connection Errors", MODEL_NAME, f"exception: {type(e).__name__}")
+
+    print(f"{model_name}: {len(err_texts)} errors -> {len(groups)} templates, "
+          f"{len(groups) - len(llm_templates)} classified by rules, {len(llm_templates)} LLM calls")
+    return {t: labels[tpl] for tpl, texts in groups.items() for t in texts}
+
 def stable_key(rec: dict) -> str:
     if "unique_key" in rec and rec["unique_key"]:
         return rec["unique_key"]
@@ -133,6 +221,11 @@ def process_model(model_name: str):
     if not RESUME and os.path.exists(output_path):
         open(output_path, "w", encoding="utf-8").close()
 
+    label_map = {}
+    if DEDUP_TEMPLATES:
+        pending = [(rec.get("execution_error") or "").strip() for rec in data if stable_key(rec) not in done_keys]
+        label_map = classify_templates([t for t in pending if t], model_name)
+
     buffer, lock = [], threading.Lock()
     skipped, total = 0, len(data)
     pbar = tqdm(total=total, desc=f"Classifying [{model_name}]", ncols=100)
@@ -145,7 +238,11 @@ def process_model(model_name: str):
             pbar.update(1); return None
 
         err_text = (rec.get("execution_error") or "").strip()
-        if err_text:
+        if err_text and err_text in label_map:
+            rec["error_type"], rec["error_type_model"], reason = label_map[err_text]
+            if reason:
+                rec["error_type_reason"] = reason
+        elif err_text:
             try:
                 rec["error_type"] = classify_error(err_text)
                 rec["error_type_model"] = MODEL_NAME
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Shared psycopg2 connection pool for the DB-backed evaluators.
+
+One ConnectionPool per (db_id, autocommit) and per process, created on first
+use by get_pool(). Pools are bounded (maxsize connections checked out or
+idle), idle connections are closed after idle_timeout seconds and the
+process keeps at most MAX_IDLE_TOTAL idle connections across all pools.
+Every checkout runs a cheap "SELECT 1" on a reused connection and replaces
+it when the backend is gone (killed after a statement_timeout or by the OOM
+killer), so a dead connection no longer costs the next item. Connections
+are opened with "-c statement_timeout=..." as a startup option, so the
+timeout is a session default set once per connection that survives
+rollbacks, instead of a SET before every query.
+
+    from db_pool import get_pool
+    with get_pool("postgres").connection() as conn:
+        ...
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
+
+BASE_DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'user': 'postgres',
+    'password': '*******'
+}
+
+STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "5000"))
+POOL_MAXSIZE = int(os.environ.get("DB_POOL_MAXSIZE", "4"))
+IDLE_TIMEOUT_SEC = float(os.environ.get("DB_POOL_IDLE_TIMEOUT", "300"))
+# Table-Schema 级有几十个 db_id，限制整个进程保留的空闲连接数，避免占满 max_connections
+MAX_IDLE_TOTAL = int(os.environ.get("DB_POOL_MAX_IDLE_TOTAL", "16"))
+# 池满时等待归还的最长时间
+CHECKOUT_TIMEOUT_SEC = 30.0
+
+_lock = threading.RLock()
+_pools = {}
+# fork 时从父进程继承的连接对象，见 _forget_inherited_pools
+_inherited = []
+
+
+def is_usable(conn) -> bool:
+    """连接未关闭且 libpq 认为会话状态正常（后端被杀后状态为 UNKNOWN）"""
+    return (not conn.closed
+            and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN)
+
+
+def ping(conn) -> bool:
+    try:
+        if not conn.autocommit:
+            conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Bounded pool of connections to one database with liveness checks and idle eviction."""
+
+    def __init__(self, db_id: str, autocommit: bool = False, maxsize: int = POOL_MAXSIZE,
+                 idle_timeout: float = IDLE_TIMEOUT_SEC, statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+                 db_config: dict = None):
+        self.db_id = db_id
+        self.autocommit = autocommit
+        self.maxsize = max(1, maxsize)
+        self.idle_timeout = idle_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.db_config = dict(db_config or BASE_DB_CONFIG)
+        self._idle = []          # [(conn, last_used)]，末尾为最近归还
+        self._in_use = 0
+        self._cond = threading.Condition(_lock)
+        self.connects = 0
+        self.reconnects = 0
+
+    def _connect(self):
+        cfg = dict(self.db_config, dbname=self.db_id)
+        if self.statement_timeout_ms:
+            cfg["options"] = f"-c statement_timeout={int(self.statement_timeout_ms)}"
+        conn = psycopg2.connect(**cfg)
+        conn.set_client_encoding('UTF8')
+        conn.autocommit = self.autocommit
+        self.connects += 1
+        return conn
+
+    def _evict_expired(self, now: float):
+        keep = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout or conn.closed:
+                _close_quietly(conn)
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    def acquire(self):
+        with self._cond:
+            deadline = time.monotonic() + CHECKOUT_TIMEOUT_SEC
+            while True:
+                self._evict_expired(time.monotonic())
+                if self._idle or self._in_use < self.maxsize:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise PoolError(f"connection pool for {self.db_id} exhausted ({self.maxsize} in use)")
+            idle = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        # 网络往返放在锁外
+        try:
+            if idle is not None:
+                conn = idle[0]
+                if ping(conn):
+                    return conn
+                _close_quietly(conn)
+                self.reconnects += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard: bool = False):
+        with self._cond:
+            self._in_use -= 1
+            if discard or not is_usable(conn):
+                _close_quietly(conn)
+            else:
+                if not conn.autocommit:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        _close_quietly(conn)
+                if not conn.closed:
+                    self._idle.append((conn, time.monotonic()))
+                    _trim_idle()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                _close_quietly(conn)
+            self._idle = []
+
+    def stats(self) -> dict:
+        return {"db_id": self.db_id, "idle": len(self._idle), "in_use": self._in_use,
+                "connects": self.connects, "reconnects": self.reconnects}
+
+
+def _trim_idle():
+    """整个进程的空闲连接超过 MAX_IDLE_TOTAL 时关闭最久未用的"""
+    with _lock:
+        idle = [(last_used, id(pool), pool, conn)
+                for pool in _pools.values() for conn, last_used in pool._idle]
+        excess = len(idle) - MAX_IDLE_TOTAL
+        if excess <= 0:
+            return
+        idle.sort(key=lambda t: (t[0], t[1]))
+        for _, _, pool, conn in idle[:excess]:
+            pool._idle = [(c, t) for c, t in pool._idle if c is not conn]
+            _close_quietly(conn)
+
+
+def get_pool(db_id: str, autocommit: bool = False) -> ConnectionPool:
+    key = (db_id, autocommit)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_id, autocommit=autocommit)
+        return pool
+
+
+def close_all():
+    with _lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def _forget_inherited_pools():
+    # fork 出的子进程与父进程共享套接字：关闭（包括对象被回收时的自动关闭）
+    # 会断开父进程的会话，这里只把连接挪出池子并保持引用，子进程另建连接
+    global _lock
+    _lock = threading.RLock()
+    for pool in _pools.values():
+        _inherited.extend(conn for conn, _ in pool._idle)
+    _pools.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_pools)
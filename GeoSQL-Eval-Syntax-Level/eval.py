@@ -1,19 +1,20 @@
 import os
-import subprocess
 import re
+import traceback
 from collections import OrderedDict
 
-scripts = [
-    "reorder_data.py",
-    "clean.py",
-    "deduplicate.py",
-    "main_eval_execution_eval.py",
-    "main_eval_semantic_pgtype_eval.py",
-    "eval_summary_with_passn.py",
-    "eval_summary_execution.py",
-    "eval_summary_semantic_pgtype.py",
-    "eval_summary_resource_usage.py",
-]
+from pipeline import run_pipeline
+
+# 各阶段（与原先逐个运行的脚本一一对应）在 pipeline.py 中按顺序于同一进程内执行：
+#  reorder_data.py, clean.py, deduplicate.py, main_eval_execution_eval.py
+#  main_eval_semantic_pgtype_eval.py, eval_summary_with_passn.py
+#  eval_summary_execution.py, eval_summary_semantic_pgtype.py
+#  eval_summary_resource_usage.py
+# 中间文件（reorder/cleaned/deduplicated 等）默认不落盘，设置 KEEP_INTERMEDIATE=1 时写出
+KEEP_INTERMEDIATE = os.environ.get("KEEP_INTERMEDIATE", "0") == "1"
+EVAL_WORKERS = int(os.environ.get("EVAL_WORKERS", "1"))
+# EVAL_INCREMENTAL=1 时只重新评测新增或输入变化的记录（缓存见 incremental.py）
+EVAL_INCREMENTAL = os.environ.get("EVAL_INCREMENTAL", "0") == "1"
 
 model_block = """
 # model_name = "claude-3-7-sonnet"
@@ -60,25 +61,22 @@ if not models:
 
 BASE_DIR = r"./GeoSQL-Eval/GeoSQL_Syntax_Level_results"
 
-for model_name in models:
-    os.environ["MODEL_NAME"] = model_name
-    os.environ["BASE_DIR"] = BASE_DIR
 
-    print(f"\nStart full evaluation for model: {model_name}")
-    for script in scripts:
-        print(f"Running script: {script}")
-        result = subprocess.run(
-            ["python", script],
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-        )
-        print(result.stdout)
-        if result.returncode != 0:
-            print(f"Error in script: {script}")
-            print(result.stderr)
-            break
-    else:
-        print(f"Evaluation finished for model: {model_name}")
+def main():
+    for model_name in models:
+        print(f"\nStart full evaluation for model: {model_name}")
+        try:
+            run_pipeline(model_name, BASE_DIR, keep_intermediate=KEEP_INTERMEDIATE, workers=EVAL_WORKERS,
+                         incremental=EVAL_INCREMENTAL)
+        except Exception:
+            print(f"Error in evaluation for model: {model_name}")
+            traceback.print_exc()
+        else:
+            print(f"Evaluation finished for model: {model_name}")
+
+    print("\nAll evaluations completed.")
+
 
-print("\nAll evaluations completed.")
+# 执行评测可能使用多进程，入口需放在 __main__ 保护下
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,47 @@
 import os
 import json
 
+from jsonl_io import iter_jsonl
+
 model_name = os.environ.get("MODEL_NAME", "default-model")
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Syntax_Level_results")
 input_path = os.path.join(base_dir, model_name, "predictions_execution_eval.jsonl")
 output_path = os.path.join(base_dir, model_name, "eval_summary_resource_usage.json")
 
-with open(input_path, "r", encoding="utf-8") as f:
-    lines = [json.loads(line.strip()) for line in f]
-
-sample_count = len(lines)
-
-durations = [item["duration"] for item in lines if "duration" in item]
-tokens_list = [item["tokens_used"] for item in lines if "tokens_used" in item]
-
-total_duration = sum(durations)
-average_duration = total_duration / (sample_count - 1)
-total_tokens = sum(tokens_list)
-average_tokens = total_tokens / sample_count
-
-summary = {
-    "model_name": model_name,
-    "sample_count": sample_count,
-    "total_duration_sec": round(total_duration, 3),
-    "average_duration_sec": round(average_duration, 3),
-    "total_tokens_used": total_tokens,
-    "average_tokens_per_sample": round(average_tokens, 3)
-}
-
-print("====== Evaluation Resource Usage Summary ======")
-for k, v in summary.items():
-    print(f"{k}: {v}")
 
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(summary, f, indent=2, ensure_ascii=False)
-print(f"\nSummary written to {output_path}")
\ No newline at end of file
+def summarize_resource_usage(lines, model_name=model_name, output_path=output_path):
+    # 单遍累加，lines 可以是流式读取的迭代器
+    sample_count = 0
+    total_duration = 0
+    total_tokens = 0
+    for item in lines:
+        sample_count += 1
+        if "duration" in item:
+            total_duration += item["duration"]
+        if "tokens_used" in item:
+            total_tokens += item["tokens_used"]
+
+    average_duration = total_duration / (sample_count - 1)
+    average_tokens = total_tokens / sample_count
+
+    summary = {
+        "model_name": model_name,
+        "sample_count": sample_count,
+        "total_duration_sec": round(total_duration, 3),
+        "average_duration_sec": round(average_duration, 3),
+        "total_tokens_used": total_tokens,
+        "average_tokens_per_sample": round(average_tokens, 3)
+    }
+
+    print("====== Evaluation Resource Usage Summary ======")
+    for k, v in summary.items():
+        print(f"{k}: {v}")
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f"\nSummary written to {output_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    summarize_resource_usage(iter_jsonl(input_path))
@@ -1,6 +1,13 @@
+import os
 import time
 import re
 from typing import Union, Dict, Any
+from psycopg2.extensions import QueryCanceledError
+from db_pool import STATEMENT_TIMEOUT_MS
+
+# 评测逻辑（比较规则、返回字段）变化时递增，使增量评测缓存中的旧结果失效
+EVALUATOR_VERSION = "5"
+
 
 def to_geom_4326_sql(value: str, param: str = "%s") -> str:
     if is_hex_wkb(value):
@@ -33,12 +40,211 @@ def is_hex_wkb(value: str) -> bool:
         return False
     return re.fullmatch(r"[0-9A-Fa-f]{16,}", value) is not None
 
+# 一条语句取出几何的规范 EWKT、类型、SRID、按 1e-5 网格吸附后 EWKB 的 md5 以及逐点 Z 值
+GEOMETRY_PROFILE_SQL = """
+    SELECT ST_AsEWKT(g), GeometryType(g), ST_SRID(g), md5(ST_AsEWKB(ST_SnapToGrid(g, 1e-5))),
+           ARRAY(SELECT ST_Z(dp.geom) FROM ST_DumpPoints(g) AS dp)
+    FROM (SELECT {geom} AS g) AS s
+"""
+
+def geometry_profile(cursor, value: str) -> dict:
+    """按 to_geom_4326_sql 解析 value，返回 ewkt / geom_type / srid / snap_hash / z；解析失败时抛出异常"""
+    cursor.execute(GEOMETRY_PROFILE_SQL.format(geom=to_geom_4326_sql(value)), (value,))
+    ewkt, geom_type, srid, snap_hash, z = cursor.fetchone()
+    return {"ewkt": ewkt, "geom_type": geom_type, "srid": srid, "snap_hash": snap_hash, "z": list(z or [])}
+
+def _z_values_match(z_model, z_expected) -> bool:
+    # 与逐点比较的 SQL 一致：两侧点做笛卡尔积后逐对比较（都为 None 视为一致），任一侧没有点时不通过
+    if not z_model or not z_expected:
+        return False
+    return all(
+        (a is None and b is None) or (a is not None and b is not None and abs(a - b) <= 1e-6)
+        for a in z_model for b in z_expected
+    )
+
+def _compare_geometry_cell(cursor, model_str: str, expected_str: str, expected_geom: dict) -> "tuple[bool, bool, bool]":
+    """
+    Compare one geometry cell against the precomputed profile of the
+    expected value (see precompute_expected_geometry.py); only the model
+    side goes through PostGIS. Returns whether st_astext, st_equals and
+    st_z pass. Identical snapped EWKB implies ST_Equals, so ST_Equals only
+    runs when the hashes differ (and always for GEOMETRYCOLLECTION). As in
+    the per-cell queries, a failing step fails the steps after it.
+    """
+    astext_ok = equals_ok = z_ok = False
+    try:
+        model_geom = geometry_profile(cursor, model_str)
+        astext_ok = model_geom["ewkt"].strip().lower() == expected_geom["ewkt"].strip().lower()
+
+        if (model_geom["snap_hash"] == expected_geom["snap_hash"]
+                and not (expected_geom["geom_type"] or "").startswith("GEOMETRYCOLLECTION")):
+            equals_ok = True
+        else:
+            cursor.execute(f"""
+                SELECT ST_Equals(
+                    ST_SnapToGrid({to_geom_4326_sql(model_str)}, 1e-5),
+                    ST_SnapToGrid({to_geom_4326_sql(expected_str)}, 1e-5)
+                )
+            """, (model_str, expected_str))
+            equals_ok = cursor.fetchone()[0] is True
+
+        z_ok = _z_values_match(model_geom["z"], expected_geom["z"])
+    except Exception:
+        pass
+    return astext_ok, equals_ok, z_ok
+
+def expected_size(expected_result) -> int:
+    """_rows_size 口径下期望结果的大约字节数；JSON 中的数字可能写成短字符串，每个单元格至少按 8 字节计"""
+    if isinstance(expected_result, dict):
+        cells = expected_result.values()
+    elif isinstance(expected_result, list):
+        cells = [v for row in expected_result for v in (row.values() if isinstance(row, dict) else
+                                                          row if isinstance(row, list) else [row])]
+    else:
+        cells = [expected_result]
+    return sum(max(8, len(str(v))) for v in cells)
+
+def expected_row_count(expected_result):
+    """normalize_expected_result 给出的期望行数；无法事先确定时返回 None"""
+    if isinstance(expected_result, (str, dict)):
+        return 1
+    if isinstance(expected_result, list) and (all(isinstance(row, list) for row in expected_result)
+                                              or all(isinstance(row, dict) for row in expected_result)):
+        return len(expected_result)
+    return None
+
+# 预测 SQL 结果集的保护阈值（0 表示不限制）：超过时停止取数，不再构造完整结果。
+# PRED_MAX_ROWS 只在 gold 行数未知时使用；gold 已知时字节上限至少为 gold 大小的 PRED_BYTES_FACTOR 倍
+PRED_MAX_ROWS = int(os.environ.get("PRED_MAX_ROWS", "100000"))
+PRED_MAX_BYTES = int(os.environ.get("PRED_MAX_BYTES", str(64 * 1024 * 1024)))
+PRED_BYTES_FACTOR = 4
+# 服务端游标每次 FETCH 的行数
+FETCH_ITERSIZE = int(os.environ.get("PRED_FETCH_ITERSIZE", "2000"))
+# 取数前先执行 SELECT count(*) FROM (pred) q，行数超出时不再取数（预测 SQL 会多执行一次）
+PRED_COUNT_PROBE = os.environ.get("PRED_COUNT_PROBE", "0") == "1"
+
+_LEADING_COMMENTS = re.compile(r"^(\s*(--[^\n]*(\n|$)|/\*.*?\*/))*", re.DOTALL)
+_QUERY_START = re.compile(r"^[\s(]*(SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+_NOT_STREAMABLE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|INTO)\b", re.IGNORECASE)
+
+def _streamable_query(sql_text: str):
+    """单条只读查询返回去掉首部注释与末尾分号的 SQL（可用于 DECLARE CURSOR 和子查询），否则返回 None"""
+    body = _LEADING_COMMENTS.sub("", sql_text or "", count=1).strip().rstrip(";").rstrip()
+    if not body or ";" in body or not _QUERY_START.match(body) or _NOT_STREAMABLE.search(body):
+        return None
+    return body
+
+def _rows_size(rows) -> int:
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for row in rows for v in row)
+
+def _pred_limits(gold_rows, gold_bytes: int = 0):
+    """
+    (row_limit, max_bytes) for fetch_pred_rows. With a known gold result
+    the row limit is its row count and the byte cap is never below
+    PRED_BYTES_FACTOR times its size, so a prediction identical to gold is
+    always compared; the absolute caps only bound predictions whose gold
+    size is unknown.
+    """
+    if gold_rows is None:
+        return PRED_MAX_ROWS or None, PRED_MAX_BYTES
+    max_bytes = max(PRED_MAX_BYTES, PRED_BYTES_FACTOR * gold_bytes) if PRED_MAX_BYTES else 0
+    return gold_rows, max_bytes
+
+def _probe_row_count(db_conn, query: str):
+    """SELECT count(*) FROM (query) q；失败时返回 None（事务内用保存点隔离错误）"""
+    in_tx = not db_conn.autocommit
+    with db_conn.cursor() as cursor:
+        if in_tx:
+            cursor.execute("SAVEPOINT pred_count_probe")
+        try:
+            cursor.execute(f"SELECT count(*) FROM ({query}\n) AS q")
+            count = cursor.fetchone()[0]
+        except Exception:
+            if in_tx:
+                cursor.execute("ROLLBACK TO SAVEPOINT pred_count_probe")
+            return None
+        if in_tx:
+            cursor.execute("RELEASE SAVEPOINT pred_count_probe")
+        return count
+
+def fetch_pred_rows(db_conn, sql_text: str, row_limit: int = None, max_bytes: int = PRED_MAX_BYTES,
+                    itersize: int = FETCH_ITERSIZE, count_probe: bool = PRED_COUNT_PROBE,
+                    timeout_sec: float = None):
+    """
+    Execute sql_text and fetch at most row_limit rows (None: no limit).
+    Returns (rows, description, exceeded): exceeded is "" when the whole
+    result was read, otherwise "rows" or "bytes" and rows holds what was
+    read before stopping. A single read-only query runs through a named
+    server-side cursor and is fetched itersize rows at a time, so an
+    oversized result is abandoned on the server; other statements (and
+    autocommit connections) use a plain cursor, where libpq buffers the
+    whole result and only the row limit is checked (via rowcount) before
+    the rows are converted. With count_probe, SELECT count(*) over the
+    query runs first and the fetch is skipped when it exceeds row_limit.
+
+    statement_timeout applies to every FETCH of the server-side cursor
+    separately, so timeout_sec (None: no limit) bounds the wall time of the
+    whole streamed fetch: once it is exceeded between two FETCHes the
+    fetch stops with QueryCanceledError, as a statement timeout would.
+    """
+    query = _streamable_query(sql_text)
+    if query is not None and count_probe and row_limit is not None:
+        count = _probe_row_count(db_conn, query)
+        if count is not None and count > row_limit:
+            return [], None, "rows"
+
+    if query is None or db_conn.autocommit:
+        with db_conn.cursor() as cursor:
+            cursor.execute(sql_text)
+            if row_limit is not None and cursor.description is not None and cursor.rowcount > row_limit:
+                return [], cursor.description, "rows"
+            return cursor.fetchall(), cursor.description, ""
+
+    itersize = max(1, itersize)
+    deadline = time.monotonic() + timeout_sec if timeout_sec else None
+    with db_conn.cursor(name="pred_stream") as cursor:
+        cursor.itersize = itersize
+        cursor.execute(query)
+        rows, size = [], 0
+        while True:
+            want = itersize if row_limit is None else min(itersize, row_limit + 1 - len(rows))
+            chunk = cursor.fetchmany(want)
+            if not chunk:
+                return rows, cursor.description, ""
+            rows.extend(chunk)
+            if row_limit is not None and len(rows) > row_limit:
+                return rows[:row_limit], cursor.description, "rows"
+            if max_bytes:
+                size += _rows_size(chunk)
+                if size > max_bytes:
+                    return rows, cursor.description, "bytes"
+            if deadline is not None and time.monotonic() > deadline:
+                raise QueryCanceledError(
+                    f"canceling statement due to statement timeout (pred fetch took over {timeout_sec:g}s)"
+                )
+
 def evaluate_sql_execution(
         sql_text: str,
         db_conn,
-        timeout_sec: int = 5,
-        expected_result: Union[str, list, dict] = None
+        timeout_sec: int = None,
+        expected_result: Union[str, list, dict] = None,
+        count_probe: bool = PRED_COUNT_PROBE,
+        expected_geometry: Dict[str, dict] = None
 ) -> Dict[str, Union[bool, str, float, str, list]]:
+    """
+    expected_geometry: optional mapping from an expected cell (stripped
+    string) to its precomputed geometry profile, as written by
+    precompute_expected_geometry.py. Geometry cells found there are
+    compared with _compare_geometry_cell; the others go through PostGIS on
+    both sides as before.
+
+    The pred result is fetched through fetch_pred_rows: at most one row more
+    than expected_result holds is read, and at most PRED_BYTES_FACTOR times
+    its size (PRED_MAX_ROWS / PRED_MAX_BYTES when the expected row count is
+    unknown; see _pred_limits). More rows than expected is reported as
+    incorrect; hitting a byte or absolute cap leaves result_correct as
+    "unknown". Either way pred_truncated is set.
+    """
 
     result = {
         "executable": False,
@@ -52,7 +258,8 @@ def evaluate_sql_execution(
             "st_equals": 0.0,
             "st_z": 0.0,
             "value_match": 0.0
-        }
+        },
+        "pred_truncated": False
     }
 
     try:
@@ -61,16 +268,31 @@ def evaluate_sql_execution(
         except:
             pass
         with db_conn.cursor() as cursor:
-            cursor.execute(f"SET statement_timeout = {timeout_sec * 1000};")
+            # db_pool 的连接建立时已设置 statement_timeout，只在显式指定时覆盖（回滚后恢复）
+            if timeout_sec is not None:
+                cursor.execute(f"SET statement_timeout = {timeout_sec * 1000};")
+            fetch_timeout = timeout_sec if timeout_sec is not None else STATEMENT_TIMEOUT_MS / 1000
+            gold_rows = expected_row_count(expected_result)
+            row_limit, max_bytes = _pred_limits(gold_rows, expected_size(expected_result) if gold_rows is not None else 0)
             start_time = time.time()
-            cursor.execute(sql_text)
-            rows = cursor.fetchall()
-            col_desc = cursor.description
+            rows, col_desc, exceeded = fetch_pred_rows(db_conn, sql_text, row_limit, max_bytes,
+                                                       count_probe=count_probe, timeout_sec=fetch_timeout)
             end_time = time.time()
 
             result["executable"] = True
             result["execution_time"] = round(end_time - start_time, 6)
 
+            if exceeded:
+                result["pred_truncated"] = True
+                if exceeded == "rows" and gold_rows is not None:
+                    result["execution_error"] = f"行数不一致：模型返回超过{gold_rows}行，期望{gold_rows}行"
+                    result["result_correct"] = "incorrect"
+                elif exceeded == "rows":
+                    result["execution_error"] = f"结果集超过 {row_limit} 行上限，未比较"
+                else:
+                    result["execution_error"] = f"结果集超过 {max_bytes} 字节上限，未比较"
+                return result
+
             if not rows:
                 return result  # 无结果直接返回
 
@@ -108,7 +330,13 @@ def evaluate_sql_execution(
                     expected_str = str(expected_val).strip()
                     is_geom = is_wkt(expected_str) or is_hex_wkb(expected_str)
 
-                    if is_geom:
+                    expected_geom = expected_geometry.get(expected_str) if is_geom and expected_geometry else None
+                    if expected_geom is not None and expected_geom.get("ewkt") is not None:
+                        astext_ok, equals_ok, z_ok = _compare_geometry_cell(cursor, model_str, expected_str, expected_geom)
+                        st_astext_pass += astext_ok
+                        st_equals_pass += equals_ok
+                        st_z_pass += z_ok
+                    elif is_geom:
                         try:
                             # ST_AsText (EWKT) 比较
                             model_geom_sql = to_geom_4326_sql(model_str)
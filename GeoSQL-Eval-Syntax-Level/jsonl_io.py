@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming JSONL reader / writer shared by the evaluation stages.
+
+Records are parsed one line at a time, so a stage never holds a whole
+predictions file in memory. orjson is used for parsing and serialization when
+it is installed, the standard json module otherwise. external_sort() sorts a
+record stream of any size with bounded memory (sorted runs spilled to
+temporary files, then a k-way merge).
+"""
+import heapq
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+# 单个排序段在内存中的最大字节数（按序列化后的行长计算）
+SORT_BUFFER_BYTES = int(os.environ.get("JSONL_SORT_BUFFER_MB", "256")) * 1024 * 1024
+
+
+def loads(line):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def dumps(obj) -> bytes:
+    """序列化为一行 UTF-8 字节（不含换行），非 ASCII 字符不转义"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # 超出 64 位的整数等 orjson 不支持的值退回标准库
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def iter_jsonl(path, skip_invalid: bool = False):
+    """逐行产出记录；空行跳过，skip_invalid=True 时打印并跳过无法解析的行"""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except ValueError as e:
+                if not skip_invalid:
+                    raise
+                print(f"[SKIP] Failed to parse line: {line.decode('utf-8', 'replace').strip()}\nError: {e}")
+
+
+def write_jsonl(path, records) -> int:
+    """流式写出记录，返回写入条数"""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    count = 0
+    with open(path, "wb") as f:
+        for item in records:
+            f.write(dumps(item))
+            f.write(b"\n")
+            count += 1
+    return count
+
+
+def count_lines(path) -> int:
+    """统计非空行数（不解析 JSON），用于进度条"""
+    count = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                count += 1
+    return count
+
+
+def _read_run(path, key):
+    with open(path, "rb") as f:
+        for line in f:
+            item = loads(line)
+            yield key(item), item
+
+
+def external_sort(records, key, buffer_bytes: int = SORT_BUFFER_BYTES, tmp_dir: str = None):
+    """
+    稳定排序任意大小的记录流：内存中积累到 buffer_bytes 就排序并落盘为一个有序段，
+    最后对各段做 k 路归并。只有一个段时不落盘。
+    """
+    run_paths = []
+    buffer, buffered = [], 0
+    work_dir = None
+
+    def spill():
+        nonlocal work_dir, buffer, buffered
+        if work_dir is None:
+            work_dir = tempfile.mkdtemp(prefix="jsonl_sort_", dir=tmp_dir)
+        buffer.sort(key=lambda entry: entry[0])
+        run_path = os.path.join(work_dir, f"run_{len(run_paths):05d}.jsonl")
+        with open(run_path, "wb") as f:
+            for _, line in buffer:
+                f.write(line)
+                f.write(b"\n")
+        run_paths.append(run_path)
+        buffer, buffered = [], 0
+
+    try:
+        for item in records:
+            line = dumps(item)
+            buffer.append((key(item), line))
+            buffered += len(line)
+            if buffered >= buffer_bytes:
+                spill()
+
+        if not run_paths:
+            buffer.sort(key=lambda entry: entry[0])
+            for _, line in buffer:
+                yield loads(line)
+            return
+
+        if buffer:
+            spill()
+        # heapq.merge 在键相同时按段顺序输出，段又按输入顺序生成，因此整体稳定
+        merged = heapq.merge(*(_read_run(p, key) for p in run_paths), key=lambda entry: entry[0])
+        for _, item in merged:
+            yield item
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
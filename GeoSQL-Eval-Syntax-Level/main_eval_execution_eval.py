@@ -1,74 +1,147 @@
-import json
+import argparse
+import functools
+import itertools
+import multiprocessing
+import multiprocessing.util
 import psycopg2
+from psycopg2.pool import PoolError
 from tqdm import tqdm
-from evaluate_execution import evaluate_sql_execution
+from jsonl_io import iter_jsonl, write_jsonl, count_lines
+from evaluate_execution import evaluate_sql_execution, EVALUATOR_VERSION
+from incremental import EvalResultCache, evaluate_incremental
+from db_pool import get_pool, close_all
+from precompute_expected_geometry import load_expected_geometry
 
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5432,
-    'dbname': 'postgres',
-    'user': 'postgres',
-    'password': '*******'
-}
+# 评测使用的数据库，连接由 db_pool 按库共享
+DB_NAME = "postgres"
 
 import os
 model_name = os.environ.get("MODEL_NAME", "default-model")
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Syntax_Level_results")
 input_path = os.path.join(base_dir, model_name, "predictions_deduplicated.jsonl")
 output_path = os.path.join(base_dir, model_name, "predictions_execution_eval.jsonl")
+cache_path = os.path.join(base_dir, model_name, "eval_cache.sqlite")
 
-def main():
-    with open(input_path, 'r', encoding='utf-8') as fin:
-        all_data = [json.loads(line) for line in fin]
+# 增量评测：这些字段与 EVALUATOR_VERSION 都未变化的记录直接复用上次结果
+HASH_FIELDS = ("pred_sql", "expected_result")
 
-    fout = open(output_path, 'w', encoding='utf-8')
+# 期望结果中几何单元格的预计算概要（由 precompute_expected_geometry.py 写入 bench 文件），
+# 评测时只需在数据库中解析模型一侧；bench 未标注时为空，按原方式两侧都解析
+_expected_geometry = None
 
+def get_expected_geometry():
+    global _expected_geometry
+    if _expected_geometry is None:
+        _expected_geometry = load_expected_geometry()
+    return _expected_geometry
+
+def evaluate_item(item):
+    pool = get_pool(DB_NAME)
     conn = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.set_client_encoding('UTF8')
-        for item in tqdm(all_data, desc="eval", ncols=80):
-            try:
-                sql = item.get("pred_sql", "")
-                expected = item.get("expected_result", None)
-
-                eval_result = evaluate_sql_execution(
-                    sql_text=sql,
-                    db_conn=conn,
-                    expected_result=expected
-                )
-
-                item.update(eval_result)
-
-            except psycopg2.InterfaceError as conn_err:
-                item["executable"] = False
-                item["execution_error"] = f"try：{str(conn_err)}"
-                item["result_correct"] = "error"
-                item["result_comparison"] = {}
-
-                try:
-                    conn = psycopg2.connect(**DB_CONFIG)
-                except Exception as re_conn_err:
-                    item["execution_error"] += f"｜fail：{str(re_conn_err)}"
-
-            except Exception as e:
-                item["executable"] = False
-                item["execution_error"] = str(e)
-                item["result_correct"] = "error"
-                item["result_comparison"] = {}
-
-            fout.write(json.dumps(item, ensure_ascii=False) + '\n')
+        sql = item.get("pred_sql", "")
+        expected = item.get("expected_result", None)
+
+        conn = pool.acquire()
+        eval_result = evaluate_sql_execution(
+            sql_text=sql,
+            db_conn=conn,
+            expected_result=expected,
+            expected_geometry=get_expected_geometry()
+        )
+
+        item.update(eval_result)
+
+    except (psycopg2.InterfaceError, psycopg2.OperationalError, PoolError) as conn_err:
+        # 后端被杀或连不上；失效连接归还时丢弃，下次取用时连接池会重连
+        item["executable"] = False
+        item["execution_error"] = f"try：{str(conn_err)}"
+        item["result_correct"] = "error"
+        item["result_comparison"] = {}
+
+    except Exception as e:
+        item["executable"] = False
+        item["execution_error"] = str(e)
+        item["result_correct"] = "error"
+        item["result_comparison"] = {}
 
     finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
-        fout.close()
+        if conn is not None:
+            pool.release(conn)
+
+    return item
+
+def _init_worker():
+    # 每个工作进程使用独立的连接池（fork 时 db_pool 会丢弃继承的连接），进程退出时关闭
+    multiprocessing.util.Finalize(None, close_all, exitpriority=10)
+
+def _imap_bounded(pool, func, records, chunksize: int, window: int):
+    """
+    分批交给 pool.imap：imap 会在后台线程中一次性取完输入迭代器，
+    直接传入流式记录会把整个文件读进内存，这里每次只放入 window 条。
+    """
+    it = iter(records)
+    while True:
+        batch = list(itertools.islice(it, window))
+        if not batch:
+            return
+        yield from pool.imap(func, batch, chunksize=chunksize)
+
+def evaluate_records(records, workers: int = 1, chunksize: int = 20):
+    """按输入顺序逐条产出评测后的记录"""
+    # 在创建进程池之前加载，工作进程 fork 时直接继承
+    get_expected_geometry()
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(processes=workers, initializer=_init_worker)
+        # imap 保持输入顺序，eval_summary_with_passn.py 依赖每 5 行一组的排列
+        results = _imap_bounded(pool, evaluate_item, records, chunksize, window=workers * chunksize * 4)
+    else:
+        results = map(evaluate_item, records)
+
+    try:
+        yield from results
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        close_all()
+
+def is_cacheable(item):
+    # 连接中断属于暂时性失败，不写入增量缓存，下次重新评测
+    return not str(item.get("execution_error") or "").startswith("try：")
+
+def evaluate_file(path, workers: int = 1, chunksize: int = 20, cache: EvalResultCache = None):
+    """评测 path 中的记录；给定 cache 时只评测新增或输入变化的记录，其余取缓存结果"""
+    evaluate = functools.partial(evaluate_records, workers=workers, chunksize=chunksize)
+    if cache is None:
+        return evaluate(iter_jsonl(path))
+    return evaluate_incremental(path, evaluate, cache, "execution", HASH_FIELDS, EVALUATOR_VERSION,
+                                cacheable=is_cacheable)
+
+def main(workers: int = 1, chunksize: int = 20, incremental: bool = False):
+    cache = EvalResultCache(cache_path) if incremental else None
+    try:
+        results = evaluate_file(input_path, workers, chunksize, cache)
+        write_jsonl(output_path, tqdm(results, total=count_lines(input_path), desc="eval", ncols=80))
+    finally:
+        if cache is not None:
+            cache.close()
 
     print(f"Complete：{output_path}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Execution-based evaluation of pred_sql against expected_result.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("EVAL_WORKERS", "1")),
+                        help="number of worker processes (default: EVAL_WORKERS or 1)")
+    parser.add_argument("--chunksize", type=int, default=20,
+                        help="items handed to a worker at a time; keep it a multiple of 5")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only evaluate records whose pred_sql / expected_result changed since the last run")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(workers=args.workers, chunksize=args.chunksize, incremental=args.incremental)
@@ -1,7 +1,10 @@
-import json
-import psycopg2
+import argparse
 from tqdm import tqdm
-from evaluate_semantic_pgtype import evaluate_function_args_dynamic
+from jsonl_io import iter_jsonl, write_jsonl
+from evaluate_semantic_pgtype import (evaluate_function_args_dynamic, load_signature_index, PgTypeofCache,
+                                      EVALUATOR_VERSION)
+from incremental import EvalResultCache, evaluate_incremental, file_fingerprint
+from db_pool import get_pool
 
 import os
 model_name = os.environ.get("MODEL_NAME", "default-model")
@@ -9,32 +12,58 @@ base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Syntax_Level_result
 input_path = os.path.join(base_dir, model_name, "predictions_deduplicated.jsonl")
 output_path = os.path.join(base_dir, model_name, "predictions_semantic_pgtype_eval.jsonl")
 signature_path = r"./GeoSQL-Eval/GeoSQL-Bench/function_signatures.json"
+cache_path = os.path.join(base_dir, model_name, "eval_cache.sqlite")
 
-# 加载函数签名
-with open(signature_path, "r", encoding="utf-8") as f:
-    function_signatures = json.load(f)
-
-# 数据库连接
-conn = psycopg2.connect(
-    dbname="postgres",
-    user="postgres",
-    password="*******",
-    host="localhost",
-    port=5432
-)
-conn.autocommit = True
-with open(input_path, "r", encoding="utf-8") as fin, open(output_path, "w", encoding="utf-8") as fout:
-    for line in tqdm(fin, desc="Evaluating function param types"):
-        item = json.loads(line)
-        try:
-            sql = item.get("pred_sql", "")
-            function = item.get("function", "")
-            eval_result = evaluate_function_args_dynamic(sql, function, conn, function_signatures)
-            item.update(eval_result)
-        except Exception as e:
-            item["error"] = str(e)
-        fout.write(json.dumps(item, ensure_ascii=False) + "\n")
-
-conn.close()
-print(f"\nParameter type semantic evaluation results have been saved to: {output_path}")
+# 增量评测：这些字段、EVALUATOR_VERSION 与函数签名文件都未变化的记录直接复用上次结果
+HASH_FIELDS = ("pred_sql", "function")
+
+# 参数表达式 -> pg_typeof 结果，跨条目共享，各轮与各模型重复的字面量参数只解析一次
+PGTYPE_CACHE_SIZE = int(os.environ.get("PGTYPE_CACHE_SIZE", "100000"))
+_type_cache = PgTypeofCache(maxsize=PGTYPE_CACHE_SIZE)
+
+def evaluate_records(records):
+    # 加载函数签名索引（首次运行时在签名文件旁生成 .index.pkl）
+    function_signatures = load_signature_index(signature_path)
+
+    # 数据库连接：逐条从共享连接池取用，失效的连接在取用前由连接池检测并重连
+    pool = get_pool("postgres", autocommit=True)
+    try:
+        for item in records:
+            try:
+                sql = item.get("pred_sql", "")
+                function = item.get("function", "")
+                with pool.connection() as conn:
+                    eval_result = evaluate_function_args_dynamic(sql, function, conn, function_signatures,
+                                                                 type_cache=_type_cache)
+                item.update(eval_result)
+            except Exception as e:
+                item["error"] = str(e)
+            yield item
+    finally:
+        pool.close()
+        print(f"pg_typeof cache: {_type_cache.stats()}")
+
+def evaluate_file(path, cache: EvalResultCache = None):
+    """评测 path 中的记录；给定 cache 时只评测新增或输入变化的记录，其余取缓存结果"""
+    if cache is None:
+        return evaluate_records(iter_jsonl(path))
+    version = f"{EVALUATOR_VERSION}:{file_fingerprint(signature_path)}"
+    return evaluate_incremental(path, evaluate_records, cache, "semantic_pgtype", HASH_FIELDS, version)
+
+def main(incremental: bool = False):
+    cache = EvalResultCache(cache_path) if incremental else None
+    try:
+        results = evaluate_file(input_path, cache)
+        write_jsonl(output_path, tqdm(results, desc="Evaluating function param types"))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    print(f"\nParameter type semantic evaluation results have been saved to: {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate parameter types of the target function in pred_sql.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only evaluate records whose pred_sql / function changed since the last run")
+    main(incremental=parser.parse_args().incremental)
 
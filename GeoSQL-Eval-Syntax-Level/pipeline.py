@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+In-process evaluation pipeline for the Syntax level.
+
+Runs reorder_data -> clean -> deduplicate -> execution / semantic pgtype
+evaluation -> summaries for one model inside a single interpreter. Every
+stage is a generator over records and records are streamed through
+jsonl_io, so peak memory does not grow with the size of predictions.jsonl.
+The preprocessed records are spilled once to a file that each evaluation
+stage re-reads. Evaluation outputs and summary JSON files are written to the
+same paths as the standalone scripts; the preprocessing intermediates
+(predictions_reorder / _cleaned / _deduplicated) only with
+keep_intermediate=True. With incremental=True only new or changed records
+are re-evaluated; the rest are taken from eval_cache.sqlite in the model
+directory (see incremental.py).
+
+    python pipeline.py --model gpt-4o [--base-dir DIR] [--keep-intermediate] [--workers N] [--incremental]
+"""
+import argparse
+import os
+
+from tqdm import tqdm
+
+from jsonl_io import iter_jsonl, write_jsonl, dumps
+from reorder_data import reorder_records
+from clean import clean_records
+from deduplicate import deduplicate_records
+from main_eval_execution_eval import evaluate_file as evaluate_execution_file
+from main_eval_semantic_pgtype_eval import evaluate_file as evaluate_semantic_file
+from eval_summary_with_passn import compute_passn_metrics
+from eval_summary_execution import analyze_results
+from eval_summary_semantic_pgtype import summarize_semantic_pgtype
+from eval_summary_resource_usage import summarize_resource_usage
+from incremental import EvalResultCache
+
+DEFAULT_BASE_DIR = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Syntax_Level_results")
+
+
+def _tee(records, path, keep):
+    # 中间结果只在需要时落盘，文件与单独运行各脚本时相同；
+    # 先序列化再交给下游，下游的就地修改不会影响已写出的内容
+    if not keep:
+        yield from records
+        return
+    with open(path, "wb") as f:
+        for item in records:
+            f.write(dumps(item) + b"\n")
+            yield item
+
+
+def run_pipeline(model_name: str, base_dir: str = DEFAULT_BASE_DIR, keep_intermediate: bool = False,
+                 workers: int = 1, chunksize: int = 20, incremental: bool = False):
+    model_dir = os.path.join(base_dir, model_name)
+
+    def path(name):
+        return os.path.join(model_dir, name)
+
+    print("Stage: reorder_data -> clean -> deduplicate")
+    records, _ = reorder_records(path("predictions.jsonl"))
+    records = _tee(records, path("predictions_reorder.jsonl"), keep_intermediate)
+    records = _tee(clean_records(records, workers=workers), path("predictions_cleaned.jsonl"), keep_intermediate)
+    records = deduplicate_records(records)
+
+    # 预处理结果写一次，后续各评测阶段分别流式重读
+    prepared_path = path("predictions_deduplicated.jsonl" if keep_intermediate else ".pipeline_prepared.jsonl")
+    total = write_jsonl(prepared_path, records)
+
+    cache = EvalResultCache(path("eval_cache.sqlite")) if incremental else None
+    try:
+        print("Stage: main_eval_execution_eval")
+        results = evaluate_execution_file(prepared_path, workers=workers, chunksize=chunksize, cache=cache)
+        write_jsonl(path("predictions_execution_eval.jsonl"), tqdm(results, total=total, desc="eval", ncols=80))
+
+        print("Stage: main_eval_semantic_pgtype_eval")
+        results = evaluate_semantic_file(prepared_path, cache=cache)
+        write_jsonl(path("predictions_semantic_pgtype_eval.jsonl"),
+                    tqdm(results, total=total, desc="Evaluating function param types"))
+    finally:
+        if cache is not None:
+            cache.close()
+        if not keep_intermediate and os.path.exists(prepared_path):
+            os.remove(prepared_path)
+
+    print("Stage: summaries")
+    execution_path = path("predictions_execution_eval.jsonl")
+    compute_passn_metrics(iter_jsonl(execution_path), output_path=path("eval_summary_with_passn.json"))
+    analyze_results(iter_jsonl(execution_path), output_path=path("eval_summary_execution.json"))
+    summarize_semantic_pgtype(iter_jsonl(path("predictions_semantic_pgtype_eval.jsonl")),
+                              output_path=path("eval_summary_semantic_pgtype.json"))
+    summarize_resource_usage(iter_jsonl(execution_path), model_name=model_name,
+                             output_path=path("eval_summary_resource_usage.json"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole Syntax-level evaluation for one model in-process.")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", "default-model"))
+    parser.add_argument("--base-dir", default=DEFAULT_BASE_DIR)
+    parser.add_argument("--keep-intermediate", action="store_true",
+                        help="also write predictions_reorder/_cleaned/_deduplicated files")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("EVAL_WORKERS", "1")),
+                        help="worker processes for SQL extraction and the execution evaluation")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-evaluate records whose inputs changed since the last run")
+    args = parser.parse_args()
+    run_pipeline(args.model, args.base_dir, keep_intermediate=args.keep_intermediate, workers=args.workers,
+                 incremental=args.incremental)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+One-time geometry normalization of the Syntax-level expected results.
+
+The execution_result of a bench item never changes, yet every round of
+every model used to send each expected geometry cell through
+to_geom_4326_sql + ST_AsEWKT (and ST_DumpPoints for the Z check). This
+script annotates every item of the bench files with "expected_geometry":
+a matrix shaped like execution_result holding, per cell, None for a
+non-geometry cell, the geometry_profile() of the cell (canonical EWKT,
+geometry type, SRID, md5 of the EWKB snapped to a 1e-5 grid and the Z
+value of every point), or {"error": ...} when PostGIS cannot parse it.
+Files are rewritten in place; run it again after editing a bench file.
+
+load_expected_geometry() turns the annotations into the expected cell ->
+profile mapping that main_eval_execution_eval.py passes to
+evaluate_sql_execution, so only the model side is normalized per item,
+also for predictions generated before the annotation existed.
+
+    python precompute_expected_geometry.py [--bench PATH ...]
+"""
+import argparse
+import json
+import os
+
+from evaluate_execution import geometry_profile, is_wkt, is_hex_wkb
+from db_pool import get_pool, close_all
+
+BENCH_PATHS = [
+    r"./GeoSQL-Eval/GeoSQL-Bench/Syntax-level_SQL_Generation_Question_Explicit.jsonl",
+    r"./GeoSQL-Eval/GeoSQL-Bench/Syntax-level_SQL_Generation_Question_Underspecified.jsonl",
+]
+
+# 与 main_eval_execution_eval.py 使用同一个库
+DB_NAME = "postgres"
+
+
+def _cell_matrix(execution_result):
+    # 与 normalize_expected_result 一致；dict 行的列顺序取决于预测结果的列名，无法预先对齐
+    if isinstance(execution_result, str):
+        return [[execution_result]]
+    if isinstance(execution_result, list) and all(isinstance(row, list) for row in execution_result):
+        return execution_result
+    return None
+
+
+def profile_cell(cursor, cell, known: dict):
+    value = str(cell).strip()
+    if not (is_wkt(value) or is_hex_wkb(value)):
+        return None
+    if value not in known:
+        try:
+            known[value] = geometry_profile(cursor, value)
+        except Exception as e:
+            known[value] = {"error": str(e).strip()}
+    return known[value]
+
+
+def annotate_file(path: str, cursor, known: dict) -> "tuple[int, int]":
+    """给 path 中每条记录加上 expected_geometry 并原地重写；返回 (记录数, 几何单元格数)"""
+    with open(path, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    n_geom = 0
+    for item in items:
+        matrix = _cell_matrix(item.get("execution_result"))
+        if matrix is None:
+            item["expected_geometry"] = None
+            continue
+        annotated = [[profile_cell(cursor, cell, known) for cell in row] for row in matrix]
+        n_geom += sum(cell is not None for row in annotated for cell in row)
+        item["expected_geometry"] = annotated
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+    return len(items), n_geom
+
+
+def load_expected_geometry(paths=BENCH_PATHS) -> dict:
+    """从已标注的 bench 文件构建 期望单元格（strip 后的字符串）-> 几何概要；文件不存在或未标注时跳过"""
+    mapping = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                annotated = item.get("expected_geometry")
+                matrix = _cell_matrix(item.get("execution_result"))
+                if not annotated or matrix is None:
+                    continue
+                for row, prof_row in zip(matrix, annotated):
+                    for cell, prof in zip(row, prof_row):
+                        if prof is not None and "error" not in prof:
+                            mapping[str(cell).strip()] = prof
+    return mapping
+
+
+def main(paths):
+    known = {}
+    pool = get_pool(DB_NAME, autocommit=True)
+    try:
+        with pool.connection() as conn, conn.cursor() as cursor:
+            for path in paths:
+                n_items, n_geom = annotate_file(path, cursor, known)
+                print(f"{path}: {n_items} items, {n_geom} geometry cells annotated")
+    finally:
+        close_all()
+    errors = sum(1 for prof in known.values() if "error" in prof)
+    print(f"Distinct expected geometries: {len(known)} (unparseable: {errors})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute normalized geometries of the Syntax-level expected results.")
+    parser.add_argument("--bench", nargs="+", default=BENCH_PATHS, help="bench JSONL files to annotate in place")
+    main(parser.parse_args().bench)
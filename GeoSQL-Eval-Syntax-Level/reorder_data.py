@@ -1,40 +1,46 @@
-import json
-from collections import defaultdict
 import os
 
+from jsonl_io import iter_jsonl, write_jsonl, external_sort
+
 model_name = os.environ.get("MODEL_NAME", "default-model")
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Syntax_Level_results")
 INPUT_PATH = os.path.join(base_dir, model_name, "predictions.jsonl")
 OUTPUT_PATH = os.path.join(base_dir, model_name, "predictions_reorder.jsonl")
 
-with open(INPUT_PATH, 'r', encoding='utf-8') as f:
-    data = [json.loads(line) for line in f if line.strip()]
-
-grouped = defaultdict(list)
-for item in data:
-    key = (item['id'], item['function'], item['question'])
-    grouped[key].append(item)
-
-all_sorted_already = True
-for group_items in grouped.values():
-    rounds = [item['round'] for item in group_items]
-    if rounds != sorted(rounds):
-        all_sorted_already = False
-        break
-
-if all_sorted_already:
-    print(f"All groups are already sorted by round, no changes needed: {OUTPUT_PATH}")
-
-else:
-    all_sorted = []
-    for group_key in sorted(grouped.keys()):
-        group_items = grouped[group_key]
-        group_items_sorted = sorted(group_items, key=lambda x: x['round'])
-        all_sorted.extend(group_items_sorted)
-
-    # ===== 写回新文件 =====
-    with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
-        for entry in all_sorted:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-    print(f"Sorting completed, results saved to: {OUTPUT_PATH}")
+def sort_key(item):
+    return (item['id'], item['function'], item['question'], item['round'])
+
+def is_round_ordered(records):
+    """单遍检查每组 (id, function, question) 内 round 是否已非降序"""
+    last_round = {}
+    for item in records:
+        group = (item['id'], item['function'], item['question'])
+        prev = last_round.get(group)
+        if prev is not None and item['round'] < prev:
+            return False
+        last_round[group] = item['round']
+    return True
+
+def reorder_records(path):
+    """
+    按 (id, function, question) 分组、组内按 round 排序；返回 (records 迭代器, 是否原本已有序)。
+    原本有序时原样流式返回，否则做外部归并排序，内存占用与文件大小无关。
+    """
+    if is_round_ordered(iter_jsonl(path)):
+        return iter_jsonl(path), True
+    return external_sort(iter_jsonl(path), key=sort_key), False
+
+def main():
+    all_sorted, all_sorted_already = reorder_records(INPUT_PATH)
+
+    if all_sorted_already:
+        print(f"All groups are already sorted by round, no changes needed: {OUTPUT_PATH}")
+
+    else:
+        # ===== 写回新文件 =====
+        write_jsonl(OUTPUT_PATH, all_sorted)
+        print(f"Sorting completed, results saved to: {OUTPUT_PATH}")
+
+if __name__ == "__main__":
+    main()
 
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark and equivalence check for clean.extract_last_sql.
+
+Compares the linear extractor in clean.py with the previous regex-based
+implementation (kept below as legacy_extract_last_sql). The corpus is built
+from the gold SQL of the bench files: every statement is wrapped in the
+response shapes models produce (closed / unclosed fences, <think> blocks,
+free text with and without a terminating semicolon), plus long unfenced
+think traces that mention SQL keywords many times, which is where the old
+lazy scans go quadratic. Existing prediction files can be added with
+--predictions. The script exits with status 1 if any output differs.
+
+    python bench_clean.py [--bench PATH ...] [--predictions PATH ...] [--think-chars N]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from jsonl_io import iter_jsonl
+from clean import extract_last_sql
+
+BENCH_PATHS = [
+    r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Explicit.jsonl",
+    r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Underspecified.jsonl",
+]
+SQL_FIELDS = ("sql", "query", "pred_sql")
+
+
+def legacy_extract_last_sql(text: str) -> str:
+    text = re.sub(r"(?is)<think>.*?</think>", "", text).strip()
+
+    fences = re.findall(
+        r"```(?:sql)?\s*([\s\S]*?)```",
+        text,
+        flags=re.IGNORECASE
+    )
+    if fences:
+        return fences[-1].strip()
+
+    text_for_2b = re.sub(r"`+$", "", text)
+    m = re.search(r"```(?:sql)?\s*([\s\S]*)$", text_for_2b, flags=re.IGNORECASE)
+    if m:
+        return m.group(1).strip()
+
+    pattern_end_semicolon = re.compile(
+        r"(?i)"
+        r"((?:SELECT|WITH|UPDATE|DELETE|INSERT|CREATE|DROP|ALTER)\b"
+        r"[\s\S]*?;)"
+        r"(?=\s*(?:\r?\n|$))"
+    )
+    candidates = pattern_end_semicolon.findall(text)
+    if candidates:
+        return candidates[-1].rstrip().strip()
+
+    pattern_to_end = re.compile(
+        r"(?i)"
+        r"((?:SELECT|WITH|UPDATE|DELETE|INSERT|"
+        r"CREATE|DROP|ALTER)\b[\s\S]*?)"
+        r"$",
+        flags=re.MULTILINE
+    )
+    candidates2 = pattern_to_end.findall(text)
+    if candidates2:
+        return candidates2[-1].strip()
+
+    return ""
+
+
+def think_trace(rng, sqls, chars):
+    # 模拟推理模型的长输出：反复提到 SQL 关键字，但没有代码块、也没有可用的结尾分号
+    words = ["we", "need", "select", "the", "geometry", "with", "srid", "then", "update", "alter",
+             "maybe", "create", "index;", "drop", "it", "because", "ST_Buffer", "insert", "delete"]
+    parts, size = [], 0
+    while size < chars:
+        if rng.random() < 0.02:
+            piece = rng.choice(sqls).rstrip(";") + " -- draft"
+        else:
+            piece = rng.choice(words)
+        parts.append(piece)
+        size += len(piece) + 1
+    return " ".join(parts)
+
+
+def build_corpus(bench_paths, prediction_paths, think_chars, long_count, seed=0):
+    rng = random.Random(seed)
+    sqls = []
+    for path in bench_paths:
+        for obj in iter_jsonl(path):
+            for field in SQL_FIELDS:
+                if isinstance(obj.get(field), str) and obj[field].strip():
+                    sqls.append(obj[field])
+                    break
+    if not sqls:
+        raise SystemExit("No SQL found in the bench files")
+
+    shaped = []
+    for sql in sqls:
+        shaped.append(sql)
+        shaped.append(f"Here is the query:\n```sql\n{sql}\n```\nDone.")
+        shaped.append(f"<think>select the columns; draft:\n```sql\nSELECT 1;\n```\n</think>\n```SQL\n{sql}\n```")
+        shaped.append(f"```sql\n{sql}\n``")
+        shaped.append(f"Answer:\n{sql}\nThis uses PostGIS.")
+        shaped.append(f"Answer: {sql.rstrip(';')} with the default SRID")
+        shaped.append(f"<think>\n{sql}\n")
+
+    for path in prediction_paths:
+        for obj in iter_jsonl(path):
+            if isinstance(obj.get("pred_sql"), str):
+                shaped.append(obj["pred_sql"])
+
+    long_records = []
+    for _ in range(long_count):
+        trace = think_trace(rng, sqls, think_chars)
+        long_records.append(trace)
+        long_records.append(f"<think>{trace}</think>\n{rng.choice(sqls)}")
+    return shaped, long_records
+
+
+def timed(func, texts):
+    start = time.perf_counter()
+    outputs = [func(t) for t in texts]
+    return outputs, time.perf_counter() - start
+
+
+def compare(name, texts):
+    new_out, new_sec = timed(extract_last_sql, texts)
+    old_out, old_sec = timed(legacy_extract_last_sql, texts)
+    mismatches = [i for i, (a, b) in enumerate(zip(old_out, new_out)) if a != b]
+    speedup = old_sec / new_sec if new_sec else float("inf")
+    print(f"{name:<14} records={len(texts):<7} legacy={old_sec:8.3f}s  new={new_sec:8.3f}s  "
+          f"speedup={speedup:6.1f}x  mismatches={len(mismatches)}")
+    for i in mismatches[:5]:
+        print(f"  [mismatch] input={texts[i][:120]!r}\n    legacy={old_out[i][:120]!r}\n    new={new_out[i][:120]!r}")
+    return not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare clean.extract_last_sql with the legacy regex extractor.")
+    parser.add_argument("--bench", nargs="+", default=BENCH_PATHS, help="bench JSONL files with gold SQL")
+    parser.add_argument("--predictions", nargs="*", default=[], help="prediction JSONL files (pred_sql)")
+    parser.add_argument("--think-chars", type=int, default=200000, help="length of each synthetic think trace")
+    parser.add_argument("--long-count", type=int, default=10, help="number of synthetic think traces")
+    args = parser.parse_args()
+
+    shaped, long_records = build_corpus(args.bench, args.predictions, args.think_chars, args.long_count)
+    ok = compare("bench shapes", shaped)
+    ok = compare("think traces", long_records) and ok
+    print("Outputs identical." if ok else "Outputs differ!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Consistency check and benchmark of local_geometry.local_geometry_flags
+against PostGIS.
+
+Builds synthetic gold / predicted geometry pairs of every kind the
+execution evaluation sees: identical geometries, coordinates moved below
+and above the 1e-5 snapping grid, reversed linestrings, polygons whose ring
+starts at another vertex, reordered multipoints, 3D geometries with equal,
+nearly equal and different Z, 3D against 2D, and types the local engine
+must leave to PostGIS (curves, TIN, geometry collections, EMPTY, XYZM).
+Both sides are normalized with ST_AsEWKT as _column_ewkts does; every pair
+the local engine decides is then also decided by PostGIS
+(_postgis_geometry_flags, the path used without the fast path), and the
+timings of both are reported for those pairs. Any pair the local engine
+decides differently from PostGIS is printed and the script exits with
+status 1.
+
+    python bench_local_geometry.py [--db NAME] [--rows N] [--seed N]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+from db_pool import get_pool, close_all
+from evaluate_execution import _postgis_geometry_flags
+from local_geometry import local_geometry_flags, shapely
+
+_NORMALIZE_SQL = """
+    SELECT ST_AsEWKT(ST_SetSRID(ST_GeomFromEWKT(t.v), 4326))
+    FROM unnest(%s::text[]) WITH ORDINALITY AS t(v, ord)
+    ORDER BY t.ord
+"""
+
+
+def _coords(pts):
+    return ",".join(" ".join(f"{c:.8f}" for c in pt) for pt in pts)
+
+
+def _jitter(pts, rng, amount):
+    return [tuple(c + rng.uniform(-amount, amount) for c in pt[:2]) + tuple(pt[2:]) for pt in pts]
+
+
+def _random_points(rng, n, z=False):
+    x0, y0 = rng.uniform(-170, 170), rng.uniform(-80, 80)
+    pts = [(x0 + rng.uniform(0, 0.5), y0 + rng.uniform(0, 0.5)) for _ in range(n)]
+    return [pt + (round(rng.uniform(0, 500), 3),) for pt in pts] if z else pts
+
+
+def _ring(rng, n):
+    # 凸多边形：按极角排序的随机点，首尾闭合
+    cx, cy = rng.uniform(-170, 170), rng.uniform(-80, 80)
+    angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(n))
+    pts = [(cx + 0.1 * math.cos(a), cy + 0.1 * math.sin(a)) for a in angles]
+    return pts + [pts[0]]
+
+
+def make_pair(rng, kind):
+    """(gold, pred) EWKT 文本"""
+    srid = "SRID=4326;"
+    if kind == "point_same":
+        pt = _random_points(rng, 1)
+        return srid + f"POINT({_coords(pt)})", srid + f"POINT({_coords(pt)})"
+    if kind == "point_below_grid":
+        pt = _random_points(rng, 1)
+        return srid + f"POINT({_coords(pt)})", srid + f"POINT({_coords(_jitter(pt, rng, 2e-6))})"
+    if kind == "point_above_grid":
+        pt = _random_points(rng, 1)
+        return srid + f"POINT({_coords(pt)})", srid + f"POINT({_coords(_jitter(pt, rng, 1e-3))})"
+    if kind == "line_reversed":
+        pts = _random_points(rng, rng.randint(2, 8))
+        return srid + f"LINESTRING({_coords(pts)})", srid + f"LINESTRING({_coords(pts[::-1])})"
+    if kind == "line_jitter":
+        pts = _random_points(rng, rng.randint(2, 8))
+        return srid + f"LINESTRING({_coords(pts)})", srid + f"LINESTRING({_coords(_jitter(pts, rng, 3e-6))})"
+    if kind == "polygon_rotated":
+        ring = _ring(rng, rng.randint(3, 10))
+        k = rng.randint(0, len(ring) - 2)
+        rotated = ring[k:-1] + ring[:k] + [ring[k]]
+        return srid + f"POLYGON(({_coords(ring)}))", srid + f"POLYGON(({_coords(rotated)}))"
+    if kind == "polygon_different":
+        return srid + f"POLYGON(({_coords(_ring(rng, 6))}))", srid + f"POLYGON(({_coords(_ring(rng, 6))}))"
+    if kind == "multipoint_reordered":
+        pts = _random_points(rng, rng.randint(2, 6))
+        shuffled = pts[:]
+        rng.shuffle(shuffled)
+        return srid + f"MULTIPOINT({_coords(pts)})", srid + f"MULTIPOINT({_coords(shuffled)})"
+    if kind == "multipolygon_same":
+        body = ",".join(f"(({_coords(_ring(rng, 5))}))" for _ in range(rng.randint(1, 3)))
+        return srid + f"MULTIPOLYGON({body})", srid + f"MULTIPOLYGON({body})"
+    if kind == "z_equal":
+        pts = _random_points(rng, rng.randint(1, 4), z=True)
+        return srid + f"LINESTRING({_coords(pts * 2)})", srid + f"LINESTRING({_coords(pts * 2)})"
+    if kind == "z_constant_near":
+        pts = [pt[:2] + (12.5,) for pt in _random_points(rng, 3)]
+        near = [pt[:2] + (12.5 + rng.uniform(-5e-7, 5e-7),) for pt in pts]
+        return srid + f"LINESTRING({_coords(pts)})", srid + f"LINESTRING({_coords(near)})"
+    if kind == "z_different":
+        pts = _random_points(rng, 1, z=True)
+        moved = [pts[0][:2] + (pts[0][2] + 1.0,)]
+        return srid + f"POINT({_coords(pts)})", srid + f"POINT({_coords(moved)})"
+    if kind == "z_vs_2d":
+        pts = _random_points(rng, 1, z=True)
+        return srid + f"POINT({_coords(pts)})", srid + f"POINT({_coords([pts[0][:2]])})"
+    if kind == "curve":
+        return (srid + "CIRCULARSTRING(0 0,1 1,2 0)", srid + "CIRCULARSTRING(2 0,1 1,0 0)")
+    if kind == "tin":
+        tin = "TIN(((0 0 0,0 1 0,1 1 0,0 0 0)))"
+        return srid + tin, srid + tin
+    if kind == "collection":
+        pt = _random_points(rng, 1)
+        return srid + f"GEOMETRYCOLLECTION(POINT({_coords(pt)}))", srid + f"POINT({_coords(pt)})"
+    if kind == "empty":
+        return srid + "POINT EMPTY", srid + "POINT EMPTY"
+    if kind == "xyzm":
+        return srid + "POINT(1 2 3 4)", srid + "POINT(1 2 3 5)"
+    raise ValueError(kind)
+
+
+KINDS = ["point_same", "point_below_grid", "point_above_grid", "line_reversed", "line_jitter",
+         "polygon_rotated", "polygon_different", "multipoint_reordered", "multipolygon_same",
+         "z_equal", "z_constant_near", "z_different", "z_vs_2d",
+         "curve", "tin", "collection", "empty", "xyzm"]
+
+
+def normalize(cursor, values):
+    cursor.execute(_NORMALIZE_SQL, (values,))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the local geometry engine against PostGIS.")
+    parser.add_argument("--db", default="postgres", help="database to run PostGIS in")
+    parser.add_argument("--rows", type=int, default=5000, help="synthetic geometry pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if shapely is None:
+        print("shapely is not installed; nothing to check.")
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    kinds = [rng.choice(KINDS) for _ in range(args.rows)]
+    pairs = [make_pair(rng, k) for k in kinds]
+
+    try:
+        with get_pool(args.db, autocommit=True).connection() as conn, conn.cursor() as cursor:
+            g_ewkts = normalize(cursor, [g for g, _ in pairs])
+            p_ewkts = normalize(cursor, [p for _, p in pairs])
+
+            start = time.perf_counter()
+            local_flags = local_geometry_flags(g_ewkts, p_ewkts)
+            local_sec = time.perf_counter() - start
+
+            rows = [i for i, f in enumerate(local_flags) if f is not None]
+            start = time.perf_counter()
+            pg_flags = _postgis_geometry_flags(cursor, [(g_ewkts[i], p_ewkts[i]) for i in rows])
+            pg_sec = time.perf_counter() - start
+    finally:
+        close_all()
+
+    decided, mismatches = Counter(), []
+    for i, pg in zip(rows, pg_flags):
+        decided[kinds[i]] += 1
+        if local_flags[i] != pg:
+            mismatches.append((kinds[i], g_ewkts[i], p_ewkts[i], pg, local_flags[i]))
+
+    total = Counter(kinds)
+    for kind in KINDS:
+        print(f"{kind:<22} pairs={total[kind]:<6} decided locally={decided[kind]:<6}")
+    print(f"{len(rows)}/{len(pairs)} pairs decided locally ({len(rows) / max(len(pairs), 1):.1%}): "
+          f"local {local_sec:.3f}s (all pairs), PostGIS {pg_sec:.3f}s (decided pairs)")
+
+    for kind, g, p, pg, loc in mismatches[:20]:
+        print(f"MISMATCH [{kind}] PostGIS={pg} local={loc}\n  gold={g}\n  pred={p}")
+    print("Local engine agrees with PostGIS." if not mismatches else f"{len(mismatches)} pairs differ!")
+    sys.exit(0 if not mismatches else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,143 @@
-import json
+import argparse
+import bisect
+import itertools
+import multiprocessing
 import re
 import os
 
+from jsonl_io import iter_jsonl, write_jsonl
+
 model_name  = os.environ.get("MODEL_NAME", "default-model")
 base_dir    = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
 input_path  = os.path.join(base_dir, model_name, "predictions_reorder.jsonl")
 output_path = os.path.join(base_dir, model_name, "predictions_cleaned.jsonl")
 
+# 预编译的正则；extract_last_sql 只用它们定位边界，扫描本身是线性的
+_THINK_OPEN_RE = re.compile(r"(?i)<think>")
+_THINK_CLOSE_RE = re.compile(r"(?i)</think>")
+_FENCE_PREFIX_RE = re.compile(r"(?i)(?:sql)?\s*")
+_SQL_KEYWORD_RE = re.compile(r"(?i)(?:SELECT|WITH|UPDATE|DELETE|INSERT|CREATE|DROP|ALTER)\b")
+_SEMICOLON_RE = re.compile(";")
+_SPACE_RUN_RE = re.compile(r"\s*")
+
+def _strip_think(text: str) -> str:
+    # 等价于 re.sub(r"(?is)<think>.*?</think>", "", text)
+    opens = [m.start() for m in _THINK_OPEN_RE.finditer(text)]
+    if not opens:
+        return text
+    closes = [m.start() for m in _THINK_CLOSE_RE.finditer(text)]
+    pieces, pos = [], 0
+    for start in opens:
+        if start < pos:
+            continue
+        idx = bisect.bisect_left(closes, start + 7)
+        if idx == len(closes):
+            # 后面再也没有闭合标签，之后的 <think> 同样无法匹配
+            break
+        pieces.append(text[pos:start])
+        pos = closes[idx] + 8
+    pieces.append(text[pos:])
+    return "".join(pieces)
+
+def _valid_semicolons(text: str):
+    """分号后的空白段内含换行或一直延续到文本末尾时才算语句结束，返回这些分号的位置"""
+    positions = []
+    n = len(text)
+    for m in _SEMICOLON_RE.finditer(text):
+        i = m.start()
+        run_end = _SPACE_RUN_RE.match(text, i + 1).end()
+        if run_end == n or text.find("\n", i + 1, run_end) >= 0:
+            positions.append(i)
+    return positions
+
 def extract_last_sql(text: str) -> str:
-    # 1) Remove <think>...</think> and its content
-    text = re.sub(r"(?is)<think>.*?</think>", "", text).strip()
-
-    # 2a) Extract fully closed ```...``` code blocks
-    fences = re.findall(
-        r"```(?:sql)?\s*([\s\S]*?)```",
-        text,
-        flags=re.IGNORECASE
-    )
-    if fences:
-        return fences[-1].strip()
-
-    # 2b) Remove trailing backticks first, then extract unclosed ```sql... (until the end of text)
-    text_for_2b = re.sub(r"`+$", "", text)
-    m = re.search(r"```(?:sql)?\s*([\s\S]*)$", text_for_2b, flags=re.IGNORECASE)
-    if m:
-        return m.group(1).strip()
-
-    # 3a) Free text extraction: start with keywords (SELECT/WITH/UPDATE/...)
-    #     and end with a semicolon followed by line break or end of text
-    pattern_end_semicolon = re.compile(
-        r"(?i)"                            # case insensitive
-        r"((?:SELECT|WITH|UPDATE|DELETE|INSERT|CREATE|DROP|ALTER)\b"  # start
-        r"[\s\S]*?;)"                      # end at semicolon
-        r"(?=\s*(?:\r?\n|$))"              # semicolon must be followed by newline or end of text
-    )
-    candidates = pattern_end_semicolon.findall(text)
-    if candidates:
-        return candidates[-1].rstrip().strip()
-
-    # 3b) Fallback: if no semicolon found, match from keyword to the end of text (semicolon optional)
-    pattern_to_end = re.compile(
-        r"(?i)"                                       # case insensitive
-        r"((?:SELECT|WITH|UPDATE|DELETE|INSERT|"      # start keywords
-        r"CREATE|DROP|ALTER)\b[\s\S]*?)"              # until the end
-        r"$",                                         # end of text
-        flags=re.MULTILINE
-    )
-    candidates2 = pattern_to_end.findall(text)
-    if candidates2:
-        return candidates2[-1].strip()
-
-    # If nothing matched, return empty string
-    return ""
+    text = _strip_think(text).strip()
+
+    # 1) 闭合的 ``` 代码块，取最后一个
+    last_fence = None
+    pos = 0
+    while True:
+        start = text.find("```", pos)
+        if start < 0:
+            break
+        body = _FENCE_PREFIX_RE.match(text, start + 3).end()
+        end = text.find("```", body)
+        if end < 0:
+            break
+        last_fence = (body, end)
+        pos = end + 3
+    if last_fence is not None:
+        return text[last_fence[0]:last_fence[1]].strip()
+
+    # 2) 未闭合的 ```sql ...（到文本末尾），先去掉结尾的反引号
+    text_for_2b = text.rstrip("`")
+    start = text_for_2b.find("```")
+    if start >= 0:
+        body = _FENCE_PREFIX_RE.match(text_for_2b, start + 3).end()
+        return text_for_2b[body:].strip()
+
+    keywords = list(_SQL_KEYWORD_RE.finditer(text))
+    if not keywords:
+        return ""
+
+    # 3a) 关键字开头、以“分号 + 换行/文本结束”收尾的最后一条语句
+    semicolons = _valid_semicolons(text)
+    last, pos = None, 0
+    for m in keywords:
+        if m.start() < pos:
+            continue
+        idx = bisect.bisect_left(semicolons, m.end())
+        if idx == len(semicolons):
+            break
+        last = (m.start(), semicolons[idx] + 1)
+        pos = last[1]
+    if last is not None:
+        return text[last[0]:last[1]].strip()
+
+    # 3b) 没有分号：从最后一个被选中的关键字到该行末尾
+    last, pos = None, 0
+    for m in keywords:
+        if m.start() < pos:
+            continue
+        end = text.find("\n", m.end())
+        if end < 0:
+            end = len(text)
+        last = (m.start(), end)
+        pos = end
+    return text[last[0]:last[1]].strip()
+
+def clean_records(records, workers: int = 1, chunksize: int = 64):
+    """逐条把 pred_sql 替换为抽取出的最后一条 SQL；workers > 1 时按批交给进程池抽取"""
+    if workers <= 1:
+        for item in records:
+            raw_sql = item.get("pred_sql", "")
+            item["pred_sql"] = extract_last_sql(raw_sql)
+            yield item
+        return
+
+    # 每批只取 window 条，进程池不会把整个输入读进内存；imap 保持输入顺序
+    window = workers * chunksize * 4
+    it = iter(records)
+    with multiprocessing.Pool(processes=workers) as pool:
+        while True:
+            batch = list(itertools.islice(it, window))
+            if not batch:
+                return
+            texts = [item.get("pred_sql", "") for item in batch]
+            for item, sql in zip(batch, pool.imap(extract_last_sql, texts, chunksize=chunksize)):
+                item["pred_sql"] = sql
+                yield item
 
 # —— Main cleaning process —— #
-with open(input_path, 'r', encoding='utf-8') as f:
-    data = [json.loads(line) for line in f if line.strip()]
+def main(workers: int = 1):
+    write_jsonl(output_path, clean_records(iter_jsonl(input_path), workers=workers))
 
-for item in data:
-    raw_sql = item.get("pred_sql", "")
-    item["pred_sql"] = extract_last_sql(raw_sql)
+    print(f"SQL cleaning completed, output saved to: {output_path}")
 
-with open(output_path, 'w', encoding='utf-8') as f:
-    for item in data:
-        f.write(json.dumps(item, ensure_ascii=False) + '\n')
 
-print(f"SQL cleaning completed, output saved to: {output_path}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the final SQL statement from every pred_sql.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("CLEAN_WORKERS", "1")),
+                        help="number of extraction processes (default: CLEAN_WORKERS or 1)")
+    args = parser.parse_args()
+    main(workers=args.workers)
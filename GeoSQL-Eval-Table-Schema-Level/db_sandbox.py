@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Per-worker clones of the benchmark databases for parallel execution.
+
+evaluate_sql_execution rolls every item back, but concurrent DDL from
+several workers on the same db_id still queues on table locks (an
+AddGeometryColumn holds an ACCESS EXCLUSIVE lock until the item's
+rollback). With cloning enabled, each worker process evaluates against its
+own copy of db_id, created with CREATE DATABASE ... TEMPLATE db_id on first
+use and dropped when the process exits:
+
+    from db_sandbox import sandbox_db
+    pool = get_pool(sandbox_db(db_id))
+
+CREATE DATABASE ... TEMPLATE fails while other sessions are connected to
+the template, so nothing should hold connections to db_id itself while the
+clones are made (warm the gold result store beforehand).
+"""
+import hashlib
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import errors, sql
+
+from db_pool import BASE_DB_CONFIG, close_all
+
+MAINTENANCE_DB = os.environ.get("DB_MAINTENANCE_DB", "postgres")
+CLONE_PREFIX = "evalclone_"
+# 模板库被其他会话占用（例如另一个进程正在连接）时的重试次数与间隔
+CLONE_RETRIES = 10
+CLONE_RETRY_SEC = 1.0
+
+_lock = threading.Lock()
+_clones = {}   # db_id -> 本进程的克隆库名
+
+
+def clone_name(db_id: str, pid: int = None) -> str:
+    """库名最长 63 字节，过长的 db_id 截断后附加哈希"""
+    suffix = f"_{pid or os.getpid()}"
+    name = f"{CLONE_PREFIX}{db_id}{suffix}"
+    if len(name) > 63:
+        digest = hashlib.sha1(db_id.encode("utf-8")).hexdigest()[:8]
+        keep = 63 - len(CLONE_PREFIX) - len(suffix) - len(digest) - 1
+        name = f"{CLONE_PREFIX}{db_id[:keep]}_{digest}{suffix}"
+    return name
+
+
+def _maintenance_conn():
+    conn = psycopg2.connect(**dict(BASE_DB_CONFIG, dbname=MAINTENANCE_DB))
+    # CREATE / DROP DATABASE 不能在事务块中执行
+    conn.autocommit = True
+    return conn
+
+
+def sandbox_db(db_id: str) -> str:
+    """返回本进程 db_id 的克隆库名，首次调用时创建"""
+    with _lock:
+        name = _clones.get(db_id)
+        if name is not None:
+            return name
+
+        name = clone_name(db_id)
+        conn = _maintenance_conn()
+        try:
+            with conn.cursor() as cursor:
+                # 上次异常退出留下的同名库可能来自旧模板，先删除
+                cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+                create = sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(sql.Identifier(name), sql.Identifier(db_id))
+                for attempt in range(CLONE_RETRIES):
+                    try:
+                        cursor.execute(create)
+                        break
+                    except errors.ObjectInUse:
+                        if attempt == CLONE_RETRIES - 1:
+                            raise
+                        time.sleep(CLONE_RETRY_SEC)
+        finally:
+            conn.close()
+        _clones[db_id] = name
+        return name
+
+
+def drop_clones():
+    """关闭本进程的连接池并删除本进程创建的克隆库"""
+    with _lock:
+        names = list(_clones.values())
+        _clones.clear()
+    if not names:
+        return
+    close_all()
+    try:
+        conn = _maintenance_conn()
+    except psycopg2.Error as e:
+        print(f"Warning: could not drop sandbox databases {names}: {e}")
+        return
+    try:
+        with conn.cursor() as cursor:
+            for name in names:
+                try:
+                    cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+                except psycopg2.Error as e:
+                    print(f"Warning: could not drop sandbox database {name}: {e}")
+    finally:
+        conn.close()
+
+
+def _forget_inherited_clones():
+    # 子进程使用以自己 pid 命名的克隆库，父进程的克隆由父进程删除
+    global _lock
+    _lock = threading.Lock()
+    _clones.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_clones)
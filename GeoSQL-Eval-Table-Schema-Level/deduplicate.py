@@ -1,25 +1,31 @@
-import json
 import os
 
+from jsonl_io import iter_jsonl, write_jsonl
+
 model_name = os.environ.get("MODEL_NAME", "default-model")
 
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
 input_file = os.path.join(base_dir, model_name, "predictions_cleaned.jsonl")
 output_file = os.path.join(base_dir, model_name, "predictions_deduplicated.jsonl")
 
-# Store already seen unique_key
-seen_keys = set()
-
-# Start processing
-with open(input_file, 'r', encoding='utf-8') as fin, open(output_file, 'w', encoding='utf-8') as fout:
-    for line in fin:
-        try:
-            data = json.loads(line)
-            key = data.get("unique_key")
-            if key and key not in seen_keys:
-                seen_keys.add(key)
-                fout.write(json.dumps(data, ensure_ascii=False) + '\n')
-        except json.JSONDecodeError as e:
-            print(f"[Skipped] Failed to parse line: {line.strip()}\nError: {e}")
-
-print(f"Deduplication completed, {len(seen_keys)} records retained. Output file: {output_file}")
+
+def deduplicate_records(records):
+    """按 unique_key 去重，保留首次出现的记录；没有 unique_key 的记录丢弃"""
+    # Store already seen unique_key
+    seen_keys = set()
+    for data in records:
+        key = data.get("unique_key")
+        if key and key not in seen_keys:
+            seen_keys.add(key)
+            yield data
+
+
+def main():
+    # Start processing
+    retained = write_jsonl(output_file, deduplicate_records(iter_jsonl(input_file, skip_invalid=True)))
+
+    print(f"Deduplication completed, {retained} records retained. Output file: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,23 @@ import json
 from collections import Counter
 
 import os
+
+from jsonl_io import iter_jsonl
+
 model_name = os.environ.get("MODEL_NAME", "default-model")
 
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
 input_path = os.path.join(base_dir, model_name, "predictions_execution_eval.jsonl")
 output_path = os.path.join(base_dir, model_name, "eval_summary_execution.json")
 
-def analyze_results():
-    with open(input_path, 'r', encoding='utf-8') as f:
-        all_data = [json.loads(line) for line in f]
+def analyze_results(all_data=None, output_path=output_path):
+    if all_data is None:
+        all_data = iter_jsonl(input_path)
 
     stats = Counter()
 
 
-    stats["total_sql"] = len(all_data)
+    stats["total_sql"] = 0
     stats["total_columns"] = 0
     stats["geometry_columns"] = 0
     stats["text_columns"] = 0
@@ -28,6 +31,7 @@ def analyze_results():
     stats["executable_sql_count"] = 0
 
     for item in all_data:
+        stats["total_sql"] += 1
         if item.get("executable", False):
             stats["executable_sql_count"] += 1
         if item.get("result_correct") == "correct":
@@ -79,6 +83,7 @@ def analyze_results():
         json.dump(dict(stats), fout, ensure_ascii=False, indent=2)
 
     print(f"Summary statistics have been saved to: {output_path}")
+    return dict(stats)
 
 if __name__ == "__main__":
     analyze_results()
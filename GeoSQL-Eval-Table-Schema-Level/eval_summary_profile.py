@@ -0,0 +1,99 @@
+import os
+import json
+import heapq
+
+import numpy as np
+
+from jsonl_io import iter_jsonl
+
+model_name = os.environ.get("MODEL_NAME", "default-model")
+base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
+input_path = os.path.join(base_dir, model_name, "predictions_execution_eval.jsonl")
+output_path = os.path.join(base_dir, model_name, "eval_profile.json")
+
+PERCENTILES = (50, 90, 99)
+TOP_N = 20
+
+
+def _distribution(values):
+    arr = np.asarray(values, dtype=float)
+    stats = {"count": int(arr.size), "sum": round(float(arr.sum()), 6), "mean": round(float(arr.mean()), 6)}
+    for p, v in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+        stats[f"p{p}"] = round(float(v), 6)
+    stats["max"] = round(float(arr.max()), 6)
+    return stats
+
+
+def summarize_profile(lines, model_name=model_name, output_path=output_path, top_n=TOP_N):
+    """
+    Aggregate item["profile"] (written by main_eval_execution_eval.py with
+    --profile) into percentiles of the item time, of every phase and of the
+    DB round trips, plus the top_n slowest items with their slowest phase.
+    Items without a profile, including those an --incremental run served
+    from the result cache, are skipped and counted as unprofiled_items;
+    nothing is written when no item has a profile.
+    """
+    # 单遍累加，lines 可以是流式读取的迭代器；最慢的条目用小顶堆保留 top_n 条
+    totals, round_trips = [], []
+    phases = {}
+    slowest = []
+    unprofiled = 0
+    for idx, item in enumerate(lines):
+        prof = item.get("profile")
+        if not prof:
+            unprofiled += 1
+            continue
+        total = prof.get("total_sec", 0.0)
+        item_phases = prof.get("phases", {})
+        totals.append(total)
+        round_trips.append(prof.get("round_trips", 0))
+        for name, sec in item_phases.items():
+            phases.setdefault(name, []).append(sec)
+
+        slowest_phase = max(item_phases, key=item_phases.get) if item_phases else None
+        entry = (total, idx, {
+            "line": idx,
+            "unique_key": item.get("unique_key"),
+            "db_id": item.get("db_id"),
+            "total_sec": total,
+            "round_trips": prof.get("round_trips", 0),
+            "slowest_phase": slowest_phase,
+            "slowest_phase_sec": item_phases.get(slowest_phase, 0.0),
+            "result_correct": item.get("result_correct")
+        })
+        if len(slowest) < top_n:
+            heapq.heappush(slowest, entry)
+        else:
+            heapq.heappushpop(slowest, entry)
+
+    if not totals:
+        print("No profiled items; run main_eval_execution_eval.py with --profile (or EVAL_PROFILE=1).")
+        return None
+
+    phase_stats = {name: _distribution(values) for name, values in phases.items()}
+    summary = {
+        "model_name": model_name,
+        "profiled_items": len(totals),
+        "unprofiled_items": unprofiled,
+        "item_total_sec": _distribution(totals),
+        "round_trips": _distribution(round_trips),
+        # 按总耗时从高到低排列各阶段
+        "phases": dict(sorted(phase_stats.items(), key=lambda kv: kv[1]["sum"], reverse=True)),
+        "slowest_items": [e[2] for e in sorted(slowest, reverse=True)]
+    }
+
+    print("====== Execution Evaluation Profile ======")
+    print(f"profiled items: {summary['profiled_items']} (unprofiled / cached: {unprofiled})  "
+          f"p50={summary['item_total_sec']['p50']}s  p99={summary['item_total_sec']['p99']}s  "
+          f"round trips p50={summary['round_trips']['p50']}")
+    for name, stats in summary["phases"].items():
+        print(f"  {name:<20} sum={stats['sum']:>10.3f}s  p50={stats['p50']:.4f}s  p99={stats['p99']:.4f}s")
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f"\n Profile written to {output_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    summarize_profile(iter_jsonl(input_path))
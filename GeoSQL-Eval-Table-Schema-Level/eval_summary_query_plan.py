@@ -0,0 +1,86 @@
+import os
+import json
+
+import numpy as np
+
+from jsonl_io import iter_jsonl
+
+model_name = os.environ.get("MODEL_NAME", "default-model")
+base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
+input_path = os.path.join(base_dir, model_name, "predictions_query_plan_eval.jsonl")
+output_path = os.path.join(base_dir, model_name, "eval_summary_query_plan.json")
+
+# pred 代价超过 gold 的这个倍数时计为"明显更慢"
+SLOW_RATIO = 10.0
+
+
+def _ratio_stats(ratios):
+    if not ratios:
+        return None
+    arr = np.asarray(ratios, dtype=float)
+    # 比值取几何平均，pred 快 2 倍与慢 2 倍相互抵消
+    positive = arr[arr > 0]
+    return {
+        "count": int(arr.size),
+        "geomean": round(float(np.exp(np.log(positive).mean())), 4) if positive.size else None,
+        "median": round(float(np.median(arr)), 4),
+        "p90": round(float(np.percentile(arr, 90)), 4),
+        "max": round(float(arr.max()), 4),
+        f"share_over_{SLOW_RATIO:g}x": round(float((arr > SLOW_RATIO).mean()), 4)
+    }
+
+
+def summarize_query_plan(lines, model_name=model_name, output_path=output_path):
+    # 单遍累加，lines 可以是流式读取的迭代器
+    total = 0
+    compared = 0
+    gold_errors = pred_errors = 0
+    cost_ratios, time_ratios = [], []
+    gold_spatial = pred_spatial = spatial_missed = 0
+    for item in lines:
+        total += 1
+        if item.get("gold_plan_error"):
+            gold_errors += 1
+        if item.get("pred_plan_error"):
+            pred_errors += 1
+        gold_plan, pred_plan = item.get("gold_plan"), item.get("pred_plan")
+        if not gold_plan or not pred_plan:
+            continue
+
+        compared += 1
+        if item.get("cost_ratio") is not None:
+            cost_ratios.append(item["cost_ratio"])
+        if item.get("time_ratio") is not None:
+            time_ratios.append(item["time_ratio"])
+        gold_spatial += bool(gold_plan.get("spatial_index_used"))
+        pred_spatial += bool(pred_plan.get("spatial_index_used"))
+        # gold 用到了空间索引而 pred 没有，常见于 WHERE 中用 ST_Distance 代替 ST_DWithin
+        if gold_plan.get("spatial_index_used") and not pred_plan.get("spatial_index_used"):
+            spatial_missed += 1
+
+    summary = {
+        "model_name": model_name,
+        "total": total,
+        "plans_compared": compared,
+        "gold_plan_errors": gold_errors,
+        "pred_plan_errors": pred_errors,
+        # 效率比：pred / gold，越接近 1 越好，大于 1 表示 pred 更慢
+        "cost_ratio": _ratio_stats(cost_ratios),
+        "time_ratio": _ratio_stats(time_ratios),
+        "gold_spatial_index_rate": round(gold_spatial / compared, 4) if compared else 0.0,
+        "pred_spatial_index_rate": round(pred_spatial / compared, 4) if compared else 0.0,
+        "spatial_index_missed": spatial_missed
+    }
+
+    print("====== Query Plan Efficiency Summary ======")
+    for k, v in summary.items():
+        print(f"{k}: {v}")
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f"\n Summary written to {output_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    summarize_query_plan(iter_jsonl(input_path))
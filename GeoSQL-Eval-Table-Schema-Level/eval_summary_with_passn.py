@@ -1,27 +1,33 @@
 import json
 import math
 import statistics
+from itertools import islice
 
 import os
+
+from jsonl_io import iter_jsonl
+
 model_name = os.environ.get("MODEL_NAME", "default-model")
 
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
 input_path = os.path.join(base_dir, model_name, "predictions_execution_eval.jsonl")
 output_path = os.path.join(base_dir, model_name, "eval_summary_with_passn.json")
 
-def compute_passn_metrics():
-    with open(input_path, 'r', encoding='utf-8') as f:
-        all_data = [json.loads(line) for line in f]
+def compute_passn_metrics(all_data=None, output_path=output_path):
+    if all_data is None:
+        all_data = iter_jsonl(input_path)
 
     group_size = 5
-    num_groups = len(all_data) // group_size
-
     pass1_list = []
     pass3_list = []
     pass5_list = []
 
-    for i in range(num_groups):
-        group = all_data[i * group_size : (i + 1) * group_size]
+    # 逐组读取，每次只保留 5 条记录；末尾不足 5 条的残组不计入
+    records = iter(all_data)
+    while True:
+        group = list(islice(records, group_size))
+        if len(group) < group_size:
+            break
 
         results = [item.get("result_correct") == "correct" for item in group]
 
@@ -33,6 +39,7 @@ def compute_passn_metrics():
         pass3_list.append(pass3)
         pass5_list.append(pass5)
 
+    num_groups = len(pass1_list)
     pass1_rate = round(sum(pass1_list) / num_groups, 4)
     pass3_rate = round(sum(pass3_list) / num_groups, 4)
     pass5_rate = round(sum(pass5_list) / num_groups, 4)
@@ -67,6 +74,7 @@ def compute_passn_metrics():
         json.dump(summary, fout, indent=2)
 
     print(f"Multi-round accuracy metrics have been saved to: {output_path}")
+    return summary
 
 
 if __name__ == "__main__":
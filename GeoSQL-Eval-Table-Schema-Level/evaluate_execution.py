@@ -1,7 +1,23 @@
+import os
 import time
 import re
+import hashlib
 from typing import Union, Dict, Any
 import pandas as pd
+from psycopg2.extensions import QueryCanceledError
+from db_pool import STATEMENT_TIMEOUT_MS
+from sql_analysis import strip_transaction_control
+from profiling import lap
+from lru_cache import LRUCache
+from local_geometry import LOCAL_GEOMETRY, local_geometry_flags
+
+# 评测逻辑（比较规则、返回字段）变化时递增，使增量评测缓存中的旧结果失效
+EVALUATOR_VERSION = "5"
+
+
+# 原始单元格 -> _column_ewkts 解析出的 (is_geom, EWKT)；跨条目共享，同一问题的各轮不再重复解析相同几何
+GeometryNormalizationCache = LRUCache
+
 def _normalize_for_order_strict(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return pd.DataFrame()
@@ -9,7 +25,8 @@ def _normalize_for_order_strict(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = _deduplicate_columns(list(df.columns))
     return df
 
-def _columns_equal(cursor, series_gold: pd.Series, series_pred: pd.Series) -> Dict[str, Any]:
+def _columns_equal(cursor, series_gold: pd.Series, series_pred: pd.Series,
+                   geom_cache: GeometryNormalizationCache = None) -> Dict[str, Any]:
     """
     Compare whether two columns are "row-by-row equal":
     - Automatically determine if they are geometry columns
@@ -33,58 +50,22 @@ def _columns_equal(cursor, series_gold: pd.Series, series_pred: pd.Series) -> Di
 
     g_vals = series_gold.tolist()
     p_vals = series_pred.tolist()
-    n = len(g_vals)
+    g_ewkts = _column_ewkts(cursor, g_vals, geom_cache)
+    p_ewkts = _column_ewkts(cursor, p_vals, geom_cache)
+    return _column_details(cursor, g_vals, p_vals, g_ewkts, p_ewkts)
 
-    is_g_gold = _is_geometry_column_via_exec(cursor, g_vals)
-    is_g_pred = _is_geometry_column_via_exec(cursor, p_vals)
-    is_geom = is_g_gold and is_g_pred
+def _column_details(cursor, g_vals: list, p_vals: list, g_ewkts, p_ewkts) -> Dict[str, Any]:
+    """
+    Body of _columns_equal for columns that were already normalized with
+    _column_ewkts (None for a non-geometry column).
+    """
+    n = len(g_vals)
+    is_geom = g_ewkts is not None and p_ewkts is not None
 
     st_astext_pass = st_equals_pass = st_z_pass = value_match_pass = 0
 
     if is_geom:
-        for i in range(n):
-            gv, pv = g_vals[i], p_vals[i]
-            try:
-                g_is, g_ewkt = _cell_to_ewkt(cursor, gv)
-                p_is, p_ewkt = _cell_to_ewkt(cursor, pv)
-                if g_is and p_is and g_ewkt and p_ewkt:
-                    # AsText（EWKT）全等
-                    if (g_ewkt or "").strip().lower() == (p_ewkt or "").strip().lower():
-                        st_astext_pass += 1
-                    # ST_Equals
-                    cursor.execute("""
-                        SELECT ST_Equals(
-                            ST_SnapToGrid(ST_GeomFromEWKT(%s), 1e-5),
-                            ST_SnapToGrid(ST_GeomFromEWKT(%s), 1e-5)
-                        )
-                    """, (g_ewkt, p_ewkt))
-                    if cursor.fetchone()[0] is True:
-                        st_equals_pass += 1
-
-                    try:
-                        cursor.execute("""
-                            WITH 
-                            gpts AS (SELECT ST_Z(dp.geom) AS z FROM ST_DumpPoints(ST_GeomFromEWKT(%s)) dp),
-                            ppts AS (SELECT ST_Z(dp.geom) AS z FROM ST_DumpPoints(ST_GeomFromEWKT(%s)) dp)
-                            SELECT ARRAY_AGG(g.z), ARRAY_AGG(p.z) FROM gpts g, ppts p;
-                        """, (g_ewkt, p_ewkt))
-                        z_g, z_p = cursor.fetchone()
-                        if z_g is not None and z_p is not None and len(z_g) == len(z_p):
-                            if all(a is None for a in z_g) and all(b is None for b in z_p):
-                                st_z_pass += 1
-                            else:
-                                all_z_match = all(
-                                    (a is None and b is None) or
-                                    (a is not None and b is not None and abs(a - b) <= 1e-6)
-                                    for a, b in zip(z_g, z_p)
-                                )
-                                if all_z_match:
-                                    st_z_pass += 1
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-
+        st_astext_pass, st_equals_pass, st_z_pass = _compare_geometry_column(cursor, g_ewkts, p_ewkts)
 
         col_equal = (st_astext_pass == n) or ((st_equals_pass == n) and (st_z_pass == n))
         return {
@@ -116,6 +97,149 @@ def _columns_equal(cursor, series_gold: pd.Series, series_pred: pd.Series) -> Di
             }
         }
 
+# 整列一次往返：unnest WITH ORDINALITY 逐行返回 ST_Equals 结果与两侧的 Z 序列
+_GEOM_BATCH_COMPARE_SQL = """
+    SELECT
+        t.ord,
+        ST_Equals(
+            ST_SnapToGrid(ST_GeomFromEWKT(t.g), 1e-5),
+            ST_SnapToGrid(ST_GeomFromEWKT(t.p), 1e-5)
+        ),
+        ARRAY(SELECT ST_Z(dp.geom) FROM ST_DumpPoints(ST_GeomFromEWKT(t.g)) dp),
+        ARRAY(SELECT ST_Z(dp.geom) FROM ST_DumpPoints(ST_GeomFromEWKT(t.p)) dp)
+    FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS t(g, p, ord)
+    ORDER BY t.ord
+"""
+
+def _z_sequences_match(z_g, z_p) -> bool:
+    """
+    Z check with the same semantics as the original per-cell query, which
+    aggregated Z over the cross join of both point sets: every (gold, pred)
+    point pair must be both None or within 1e-6 of each other.
+    """
+    if not z_g or not z_p:
+        return False
+    if all(a is None for a in z_g) and all(b is None for b in z_p):
+        return True
+    return all(
+        (a is None and b is None) or
+        (a is not None and b is not None and abs(a - b) <= 1e-6)
+        for a in z_g for b in z_p
+    )
+
+def _fetchall_isolated(cursor, savepoint: str, sql: str, params) -> list:
+    # 非 autocommit 时用 SAVEPOINT 包裹，语句失败后事务仍可继续使用（逐行回退、后续列的归一化）
+    in_tx = not getattr(cursor.connection, "autocommit", False)
+    if in_tx:
+        cursor.execute(f"SAVEPOINT {savepoint}")
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    except Exception:
+        if in_tx:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+        raise
+    if in_tx:
+        cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+    return rows
+
+def _row_geometry_flags(cursor, g_ewkt: str, p_ewkt: str) -> "tuple[bool, bool]":
+    # 逐行回退路径，仅在整列批量比较失败时使用
+    equals_ok = z_ok = False
+    try:
+        equals_ok = _fetchall_isolated(cursor, "geom_row_compare", """
+            SELECT ST_Equals(
+                ST_SnapToGrid(ST_GeomFromEWKT(%s), 1e-5),
+                ST_SnapToGrid(ST_GeomFromEWKT(%s), 1e-5)
+            )
+        """, (g_ewkt, p_ewkt))[0][0] is True
+        try:
+            z_g, z_p = _fetchall_isolated(cursor, "geom_row_compare", """
+                SELECT
+                    ARRAY(SELECT ST_Z(dp.geom) FROM ST_DumpPoints(ST_GeomFromEWKT(%s)) dp),
+                    ARRAY(SELECT ST_Z(dp.geom) FROM ST_DumpPoints(ST_GeomFromEWKT(%s)) dp)
+            """, (g_ewkt, p_ewkt))[0]
+            z_ok = _z_sequences_match(z_g, z_p)
+        except Exception:
+            pass
+    except Exception:
+        pass
+    return equals_ok, z_ok
+
+def _batch_geometry_flags(cursor, g_ewkts: list, p_ewkts: list) -> "list[tuple[bool, bool]]":
+    rows = _fetchall_isolated(cursor, "geom_batch_compare", _GEOM_BATCH_COMPARE_SQL, (g_ewkts, p_ewkts))
+    return [(eq is True, _z_sequences_match(z_g, z_p)) for _, eq, z_g, z_p in rows]
+
+def _postgis_geometry_flags(cursor, pairs: list) -> "list[tuple[bool, bool]]":
+    try:
+        return _batch_geometry_flags(cursor, [g for g, _ in pairs], [p for _, p in pairs])
+    except Exception:
+        return [_row_geometry_flags(cursor, g, p) for g, p in pairs]
+
+def _compare_geometry_column(cursor, g_ewkts: list, p_ewkts: list,
+                             local: bool = LOCAL_GEOMETRY) -> "tuple[int, int, int]":
+    """
+    Row-by-row geometry comparison of two EWKT-normalized columns.
+    Returns (ST_AsText_pass, ST_Equals_pass, ST_Z_pass); rows where either
+    side is empty never pass. With local=True the rows that
+    local_geometry_flags can decide skip PostGIS.
+    """
+    pairs = [(g, p) for g, p in zip(g_ewkts, p_ewkts) if g and p]
+    if not pairs:
+        return 0, 0, 0
+
+    st_astext_pass = sum(1 for g, p in pairs if g.strip().lower() == p.strip().lower())
+
+    if local:
+        flags = local_geometry_flags([g for g, _ in pairs], [p for _, p in pairs])
+        rest = [i for i, f in enumerate(flags) if f is None]
+        if rest:
+            for i, f in zip(rest, _postgis_geometry_flags(cursor, [pairs[i] for i in rest])):
+                flags[i] = f
+    else:
+        flags = _postgis_geometry_flags(cursor, pairs)
+
+    st_equals_pass = sum(1 for eq, _ in flags if eq)
+    st_z_pass = sum(1 for _, z_ok in flags if z_ok)
+    return st_astext_pass, st_equals_pass, st_z_pass
+
+def _fingerprint(values) -> str:
+    # 规范化文本（strip + lower）的长度前缀哈希，与逐行比较的判等口径一致
+    h = hashlib.sha1()
+    for v in values:
+        b = str(v).strip().lower().encode("utf-8", "surrogatepass")
+        h.update(len(b).to_bytes(8, "little"))
+        h.update(b)
+    return h.hexdigest()
+
+def _profile_column(values: list, ewkts) -> Dict[str, Any]:
+    return {
+        "values": values,
+        "ewkts": ewkts,
+        "text_fp": _fingerprint(values),
+        "geom_fp": _fingerprint(ewkts) if ewkts is not None else None,
+        "has_empty": ewkts is not None and not all(ewkts)
+    }
+
+def _fingerprint_equal(cursor, g_prof: Dict[str, Any], p_prof: Dict[str, Any]) -> "tuple[bool, dict | None]":
+    """
+    Column equality decided from fingerprints wherever that is exact:
+    - not both geometry: equal iff the text fingerprints are equal;
+    - geometry with an empty cell on either side: never equal, since such a
+      row can pass no strategy;
+    - equal EWKT fingerprints: every row passes ST_AsText.
+    Only the remaining geometry pairs pay for the ST_Equals/Z comparison,
+    whose details are returned so they need not be recomputed.
+    """
+    if g_prof["ewkts"] is None or p_prof["ewkts"] is None:
+        return g_prof["text_fp"] == p_prof["text_fp"], None
+    if g_prof["has_empty"] or p_prof["has_empty"]:
+        return False, None
+    if g_prof["geom_fp"] == p_prof["geom_fp"]:
+        return True, None
+    details = _column_details(cursor, g_prof["values"], p_prof["values"], g_prof["ewkts"], p_prof["ewkts"])
+    return details["equal"], details
+
 def _max_bipartite_match(pred_to_gold_ok: Dict[int, list], gold_count: int) -> Dict[int, int]:
 
     match_gold = {}
@@ -203,6 +327,15 @@ def _normalize_table(df: pd.DataFrame, sql_text: str = None) -> pd.DataFrame:
 
     return df.reset_index(drop=True)
 
+def _geometry_kind(value: str) -> str:
+    """Input kind of a geometry string, matching the branches of to_geom_4326_sql."""
+    if is_hex_wkb(value):
+        return "wkb"
+    elif value.strip().upper().startswith("SRID=4326;"):
+        return "ewkt4326"
+    else:
+        return "wkt"
+
 def to_geom_4326_sql(value: str, param: str = "%s") -> str:
     if is_hex_wkb(value):
         return f"(ST_SetSRID(ST_GeomFromWKB(decode({param}, 'hex')), 4326))"
@@ -234,45 +367,289 @@ def is_hex_wkb(value: str) -> bool:
         return False
     return re.fullmatch(r"[0-9A-Fa-f]{16,}", value) is not None
 
-def _cell_to_ewkt(cursor, cell) -> "tuple[bool, str]":
-    if cell is None:
-        return (False, "")
+# 整列一次往返：unnest WITH ORDINALITY 逐行返回 EWKT；CASE 的三个分支与 to_geom_4326_sql 一致
+_GEOM_BATCH_NORMALIZE_SQL = """
+    SELECT ST_AsEWKT(CASE t.kind
+        WHEN 'wkb' THEN ST_SetSRID(ST_GeomFromWKB(decode(t.v, 'hex')), 4326)
+        WHEN 'ewkt4326' THEN (t.v)::geography::geometry
+        ELSE ST_SetSRID(ST_GeomFromText(t.v), 4326)
+    END)
+    FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS t(v, kind, ord)
+    ORDER BY t.ord
+"""
+
+def _geometry_input(cell) -> "tuple | None":
+    """(cache key, kind, value) for a cell that looks like WKB / WKT / EWKT, None otherwise"""
+    if isinstance(cell, (bytes, memoryview)):
+        value = (cell.tobytes() if isinstance(cell, memoryview) else cell).hex()
+        return ("wkb", value), "wkb", value
+    value = str(cell).strip()
+    if not value:
+        return None
+    if not (is_hex_wkb(value) or is_wkt(value) or value.upper().startswith("SRID=")):
+        return None
+    return ("text", value), _geometry_kind(value), value
+
+def _normalize_geometries(cursor, inputs: list, errors: list = None) -> "list | None":
+    """
+    EWKT of every (key, kind, value) in inputs, or None as soon as one of
+    them does not parse. All inputs go to PostGIS in one
+    _GEOM_BATCH_NORMALIZE_SQL statement; only if that statement fails are
+    they retried one per statement, to tell a cell that does not parse from
+    an error of the batch itself. Every statement runs under a savepoint,
+    so a failure never aborts the surrounding transaction; its message is
+    appended to errors.
+    """
+    values = [v for _, _, v in inputs]
+    kinds = [k for _, k, _ in inputs]
     try:
-        if isinstance(cell, (bytes, memoryview)):
-            hex_str = (cell.tobytes() if isinstance(cell, memoryview) else cell).hex()
-            geom_sql = to_geom_4326_sql(hex_str)
-            cursor.execute(f"SELECT ST_AsEWKT({geom_sql})", (hex_str,))
-            ewkt = cursor.fetchone()[0]
-            return (True, ewkt or "")
-        s = str(cell).strip()
-        if not s:
-            return (False, "")
-        if is_hex_wkb(s) or is_wkt(s) or s.upper().startswith("SRID="):
-            geom_sql = to_geom_4326_sql(s)
-            cursor.execute(f"SELECT ST_AsEWKT({geom_sql})", (s,))
-            ewkt = cursor.fetchone()[0]
-            return (True, ewkt or "")
-        return (False, "")
-    except Exception:
-        return (False, "")
+        rows = _fetchall_isolated(cursor, "geom_batch_normalize", _GEOM_BATCH_NORMALIZE_SQL, (values, kinds))
+        return [r[0] for r in rows]
+    except Exception as e:
+        if errors is not None:
+            errors.append(str(e).strip())
 
-def _is_geometry_column_via_exec(cursor, col_values) -> bool:
-    any_geom = False
+    ewkts = []
+    for _, kind, value in inputs:
+        try:
+            rows = _fetchall_isolated(cursor, "geom_cell_normalize", _GEOM_BATCH_NORMALIZE_SQL, ([value], [kind]))
+        except Exception as e:
+            if errors is not None:
+                errors.append(str(e).strip())
+            return None
+        ewkts.append(rows[0][0])
+    return ewkts
+
+def _column_ewkts(cursor, col_values, geom_cache: GeometryNormalizationCache = None,
+                  errors: list = None) -> "list | None":
+    """
+    Normalize a whole column to EWKT. Returns None if the column is not a
+    geometry column (some non-empty cell does not parse, or all cells are
+    empty); otherwise one EWKT per row, "" for empty cells. Distinct cells
+    missing from geom_cache are normalized in one round trip (see
+    _normalize_geometries, which also explains errors).
+    """
+    inputs = []
     for v in col_values:
         if v is None or str(v).strip() == "":
+            inputs.append(None)
             continue
-        isg, ewkt = _cell_to_ewkt(cursor, v)
-        if isg and ewkt:
-            any_geom = True
+        inp = _geometry_input(v)
+        if inp is None:
+            return None
+        inputs.append(inp)
+    if all(inp is None for inp in inputs):
+        return None
+
+    resolved = {}
+    missing = {}
+    for inp in inputs:
+        if inp is None or inp[0] in resolved or inp[0] in missing:
+            continue
+        cached = geom_cache.get(inp[0]) if geom_cache is not None else None
+        if cached is not None:
+            resolved[inp[0]] = cached[1]
         else:
-            return False
-    return any_geom
+            missing[inp[0]] = inp
+
+    if missing:
+        todo = list(missing.values())
+        ewkts = _normalize_geometries(cursor, todo, errors)
+        if ewkts is None:
+            return None
+        for (key, _, _), ewkt in zip(todo, ewkts):
+            if not ewkt:
+                return None
+            resolved[key] = ewkt
+            # 只缓存成功的解析结果；失败可能是暂时性的（超时等），不能当作确定结论
+            if geom_cache is not None:
+                geom_cache.put(key, (True, ewkt))
+
+    return ["" if inp is None else resolved[inp[0]] for inp in inputs]
+
+def _is_geometry_column_via_exec(cursor, col_values, geom_cache: GeometryNormalizationCache = None) -> bool:
+    return _column_ewkts(cursor, col_values, geom_cache) is not None
+
+# gold 结果存储中条目的版本：gold 的执行方式或 _column_ewkts 的归一化口径变化时递增，旧条目视为未命中
+GOLD_RESULT_VERSION = "2"
+
+def prepare_gold_result(cursor, gold_sql: str, geom_cache: GeometryNormalizationCache = None) -> Dict[str, Any]:
+    """
+    Execute gold_sql and build the entry kept by the gold result store:
+    fetched rows, column names, gold timing and, per column, the EWKT
+    normalization from _column_ewkts (None for non-geometry columns).
+    normalize_errors lists the normalization statements that failed; such
+    an entry must not be stored, since the failure may be transient.
+    Raises whatever the execution raises.
+    """
+    t0 = time.time()
+    cursor.execute(gold_sql)
+    rows = cursor.fetchall()
+    desc = cursor.description or []
+    elapsed = time.time() - t0
+    columns = [d[0] for d in desc]
+    # 与比较阶段一致：基于 DataFrame 的列值做归一化
+    df = pd.DataFrame(rows, columns=columns)
+    errors = []
+    geom_ewkt = [
+        _column_ewkts(cursor, df.iloc[:, i].tolist(), geom_cache, errors)
+        for i in range(df.shape[1])
+    ]
+    return {
+        "columns": columns,
+        "rows": rows,
+        "geom_ewkt": geom_ewkt,
+        "execution_time": round(elapsed, 6),
+        "normalize_errors": errors
+    }
+
+# 预测 SQL 结果集的保护阈值（0 表示不限制）：超过时停止取数，不再构造完整结果。
+# PRED_MAX_ROWS 只在 gold 行数未知时使用；gold 已知时字节上限至少为 gold 大小的 PRED_BYTES_FACTOR 倍
+PRED_MAX_ROWS = int(os.environ.get("PRED_MAX_ROWS", "100000"))
+PRED_MAX_BYTES = int(os.environ.get("PRED_MAX_BYTES", str(64 * 1024 * 1024)))
+PRED_BYTES_FACTOR = 4
+# 服务端游标每次 FETCH 的行数
+FETCH_ITERSIZE = int(os.environ.get("PRED_FETCH_ITERSIZE", "2000"))
+# 取数前先执行 SELECT count(*) FROM (pred) q，行数超出时不再取数（预测 SQL 会多执行一次）
+PRED_COUNT_PROBE = os.environ.get("PRED_COUNT_PROBE", "0") == "1"
+
+_LEADING_COMMENTS = re.compile(r"^(\s*(--[^\n]*(\n|$)|/\*.*?\*/))*", re.DOTALL)
+_QUERY_START = re.compile(r"^[\s(]*(SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+_NOT_STREAMABLE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|INTO)\b", re.IGNORECASE)
+
+def _streamable_query(sql_text: str):
+    """单条只读查询返回去掉首部注释与末尾分号的 SQL（可用于 DECLARE CURSOR 和子查询），否则返回 None"""
+    body = _LEADING_COMMENTS.sub("", sql_text or "", count=1).strip().rstrip(";").rstrip()
+    if not body or ";" in body or not _QUERY_START.match(body) or _NOT_STREAMABLE.search(body):
+        return None
+    return body
+
+def _rows_size(rows) -> int:
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for row in rows for v in row)
+
+def _pred_limits(gold_rows, gold_bytes: int = 0):
+    """
+    (row_limit, max_bytes) for fetch_pred_rows. With a known gold result
+    the row limit is its row count and the byte cap is never below
+    PRED_BYTES_FACTOR times its size, so a prediction identical to gold is
+    always compared; the absolute caps only bound predictions whose gold
+    size is unknown.
+    """
+    if gold_rows is None:
+        return PRED_MAX_ROWS or None, PRED_MAX_BYTES
+    max_bytes = max(PRED_MAX_BYTES, PRED_BYTES_FACTOR * gold_bytes) if PRED_MAX_BYTES else 0
+    return gold_rows, max_bytes
+
+def _probe_row_count(db_conn, query: str):
+    """SELECT count(*) FROM (query) q；失败时返回 None（事务内用保存点隔离错误）"""
+    in_tx = not db_conn.autocommit
+    with db_conn.cursor() as cursor:
+        if in_tx:
+            cursor.execute("SAVEPOINT pred_count_probe")
+        try:
+            cursor.execute(f"SELECT count(*) FROM ({query}\n) AS q")
+            count = cursor.fetchone()[0]
+        except Exception:
+            if in_tx:
+                cursor.execute("ROLLBACK TO SAVEPOINT pred_count_probe")
+            return None
+        if in_tx:
+            cursor.execute("RELEASE SAVEPOINT pred_count_probe")
+        return count
+
+def fetch_pred_rows(db_conn, sql_text: str, row_limit: int = None, max_bytes: int = PRED_MAX_BYTES,
+                    itersize: int = FETCH_ITERSIZE, count_probe: bool = PRED_COUNT_PROBE,
+                    timeout_sec: float = None):
+    """
+    Execute sql_text and fetch at most row_limit rows (None: no limit).
+    Returns (rows, description, exceeded): exceeded is "" when the whole
+    result was read, otherwise "rows" or "bytes" and rows holds what was
+    read before stopping. A single read-only query runs through a named
+    server-side cursor and is fetched itersize rows at a time, so an
+    oversized result is abandoned on the server; other statements (and
+    autocommit connections) use a plain cursor, where libpq buffers the
+    whole result and only the row limit is checked (via rowcount) before
+    the rows are converted. With count_probe, SELECT count(*) over the
+    query runs first and the fetch is skipped when it exceeds row_limit.
+
+    statement_timeout applies to every FETCH of the server-side cursor
+    separately, so timeout_sec (None: no limit) bounds the wall time of the
+    whole streamed fetch: once it is exceeded between two FETCHes the
+    fetch stops with QueryCanceledError, as a statement timeout would.
+    """
+    query = _streamable_query(sql_text)
+    if query is not None and count_probe and row_limit is not None:
+        count = _probe_row_count(db_conn, query)
+        if count is not None and count > row_limit:
+            return [], None, "rows"
+
+    if query is None or db_conn.autocommit:
+        with db_conn.cursor() as cursor:
+            cursor.execute(sql_text)
+            if row_limit is not None and cursor.description is not None and cursor.rowcount > row_limit:
+                return [], cursor.description, "rows"
+            return cursor.fetchall(), cursor.description, ""
+
+    itersize = max(1, itersize)
+    deadline = time.monotonic() + timeout_sec if timeout_sec else None
+    with db_conn.cursor(name="pred_stream") as cursor:
+        cursor.itersize = itersize
+        cursor.execute(query)
+        rows, size = [], 0
+        while True:
+            want = itersize if row_limit is None else min(itersize, row_limit + 1 - len(rows))
+            chunk = cursor.fetchmany(want)
+            if not chunk:
+                return rows, cursor.description, ""
+            rows.extend(chunk)
+            if row_limit is not None and len(rows) > row_limit:
+                return rows[:row_limit], cursor.description, "rows"
+            if max_bytes:
+                size += _rows_size(chunk)
+                if size > max_bytes:
+                    return rows, cursor.description, "bytes"
+            if deadline is not None and time.monotonic() > deadline:
+                raise QueryCanceledError(
+                    f"canceling statement due to statement timeout (pred fetch took over {timeout_sec:g}s)"
+                )
+
 def evaluate_sql_execution(
         sql_text: str,
         db_conn,
-        timeout_sec: int = 5,
-        gold_sql: str = None
+        timeout_sec: int = None,
+        gold_sql: str = None,
+        geom_cache: GeometryNormalizationCache = None,
+        gold_store=None,
+        db_id: str = None,
+        count_probe: bool = PRED_COUNT_PROBE,
+        profile=None
 ) -> Dict[str, Union[bool, str, float, str, list]]:
+    """
+    gold_store: optional GoldResultStore (see gold_result_store.py). Gold
+    results are read from it by (db_id, gold_sql) instead of re-executing
+    gold_sql; on a miss gold_sql is executed once and stored, unless a
+    geometry normalization statement failed. db_id defaults to the database
+    name of db_conn.
+
+    The pred result is fetched through fetch_pred_rows: at most one row more
+    than the gold result is read, and at most PRED_BYTES_FACTOR times its
+    size (PRED_MAX_ROWS / PRED_MAX_BYTES when gold could not run; see
+    _pred_limits). More rows than gold is reported as incorrect; hitting a
+    byte or absolute cap leaves result_correct as "unknown". Either way
+    pred_truncated is set.
+
+    On a transactional connection every item runs inside one transaction
+    that is always rolled back: gold_sql runs under a savepoint that is
+    rolled back before pred_sql, so neither sees the other's side effects
+    (and a failing gold_sql no longer aborts pred_sql), and pred_sql's own
+    changes are undone when the item finishes. Top-level BEGIN / COMMIT in
+    pred_sql are dropped (see sql_analysis.strip_transaction_control).
+    Autocommit connections are not sandboxed.
+
+    profile: optional profiling.ItemProfile; the function records laps for
+    gold, pred_fetch, dataframe, geometry_normalize, column_match and
+    column_details (see profiling.py).
+    """
 
     if not gold_sql:
         raise ValueError("gold_sql is required.")
@@ -293,8 +670,13 @@ def evaluate_sql_execution(
         "gold_executable": False,
         "gold_execution_time": 0.0,
         "gold_error": "",
-        "pred_error": ""
+        "gold_cached": False,
+        "pred_error": "",
+        "pred_truncated": False,
+        "geom_cache": {"hits": 0, "misses": 0}
     }
+    cache_hits0 = geom_cache.hits if geom_cache is not None else 0
+    cache_misses0 = geom_cache.misses if geom_cache is not None else 0
 
     try:
         try:
@@ -302,38 +684,104 @@ def evaluate_sql_execution(
         except:
             pass
         with db_conn.cursor() as cursor:
-            cursor.execute(f"SET statement_timeout = {timeout_sec * 1000};")
+            # db_pool 的连接建立时已设置 statement_timeout，只在显式指定时覆盖（回滚后恢复）
+            if timeout_sec is not None:
+                cursor.execute(f"SET statement_timeout = {timeout_sec * 1000};")
+            fetch_timeout = timeout_sec if timeout_sec is not None else STATEMENT_TIMEOUT_MS / 1000
+            sandboxed = not db_conn.autocommit
+            if sandboxed:
+                cursor.execute("SAVEPOINT eval_gold")
 
             df_gold = pd.DataFrame()
             gold_cols = []
-            try:
-                t0 = time.time()
-                cursor.execute(gold_sql)
-                gold_rows = cursor.fetchall()
-                gold_desc = cursor.description or []
-                gold_time = time.time() - t0
-                gold_cols = [d[0] for d in gold_desc]
-                df_gold = pd.DataFrame(gold_rows, columns=gold_cols)
+            gold_geom = None
+            store_db_id = None
+            gold_entry = None
+            if gold_store is not None:
+                store_db_id = db_id or db_conn.info.dbname
+                gold_entry = gold_store.get(store_db_id, gold_sql)
+
+            if gold_entry is not None:
+                gold_cols = gold_entry["columns"]
+                gold_geom = gold_entry["geom_ewkt"]
+                df_gold = pd.DataFrame(gold_entry["rows"], columns=gold_cols)
                 result["gold_executable"] = True
-                result["gold_execution_time"] = round(gold_time, 6)
-            except Exception as ge:
-                result["gold_error"] = str(ge)
-
-            df_pred = pd.DataFrame()
+                result["gold_execution_time"] = gold_entry["execution_time"]
+                result["gold_cached"] = True
+            elif gold_store is not None:
+                try:
+                    gold_entry = prepare_gold_result(cursor, gold_sql, geom_cache)
+                    gold_cols = gold_entry["columns"]
+                    gold_geom = gold_entry["geom_ewkt"]
+                    df_gold = pd.DataFrame(gold_entry["rows"], columns=gold_cols)
+                    result["gold_executable"] = True
+                    result["gold_execution_time"] = gold_entry["execution_time"]
+                    if not gold_entry["normalize_errors"]:
+                        gold_store.put(store_db_id, gold_sql, gold_entry)
+                except Exception as ge:
+                    result["gold_error"] = str(ge)
+            else:
+                try:
+                    t0 = time.time()
+                    cursor.execute(gold_sql)
+                    gold_rows = cursor.fetchall()
+                    gold_desc = cursor.description or []
+                    gold_time = time.time() - t0
+                    gold_cols = [d[0] for d in gold_desc]
+                    df_gold = pd.DataFrame(gold_rows, columns=gold_cols)
+                    result["gold_executable"] = True
+                    result["gold_execution_time"] = round(gold_time, 6)
+                except Exception as ge:
+                    result["gold_error"] = str(ge)
+
+            if sandboxed:
+                # 撤销 gold 的副作用（gold 出错时事务也随之恢复），pred 在干净的状态上执行
+                cursor.execute("ROLLBACK TO SAVEPOINT eval_gold")
+                cursor.execute("RELEASE SAVEPOINT eval_gold")
+            lap(profile, "gold")
+
+            pred_sql = sql_text
+            if sandboxed:
+                pred_sql, tx_error = strip_transaction_control(sql_text)
+                if tx_error:
+                    result["pred_error"] = tx_error
+                    return result
+
+            if result["gold_executable"]:
+                gold_rows = len(df_gold)
+                gold_bytes = _rows_size(df_gold.itertuples(index=False, name=None))
+            else:
+                gold_rows, gold_bytes = None, 0
+            row_limit, max_bytes = _pred_limits(gold_rows, gold_bytes)
             try:
                 t1 = time.time()
-                cursor.execute(sql_text)
-                pred_rows = cursor.fetchall()
-                pred_desc = cursor.description or []
+                pred_rows, pred_desc, exceeded = fetch_pred_rows(db_conn, pred_sql, row_limit, max_bytes,
+                                                                 count_probe=count_probe, timeout_sec=fetch_timeout)
                 pred_time = time.time() - t1
-                pred_cols = [d[0] for d in pred_desc]
-                df_pred = pd.DataFrame(pred_rows, columns=pred_cols)
 
                 result["executable"] = True
                 result["execution_time"] = round(pred_time, 6)
             except Exception as pe:
                 result["pred_error"] = str(pe)
                 return result
+            finally:
+                lap(profile, "pred_fetch")
+
+            if exceeded:
+                result["pred_truncated"] = True
+                if exceeded == "rows" and gold_rows is not None:
+                    result["execution_error"] = (
+                        f"Row count mismatch (strict comparison, order preserved): pred > {gold_rows} rows vs gold {gold_rows}"
+                    )
+                    result["result_correct"] = "incorrect"
+                elif exceeded == "rows":
+                    result["execution_error"] = f"Pred result exceeds the {row_limit}-row limit; not compared"
+                else:
+                    result["execution_error"] = f"Pred result exceeds the {max_bytes}-byte limit; not compared"
+                return result
+
+            pred_cols = [d[0] for d in pred_desc or []]
+            df_pred = pd.DataFrame(pred_rows, columns=pred_cols)
 
             if not result["gold_executable"]:
                 return result
@@ -343,6 +791,7 @@ def evaluate_sql_execution(
 
             df_gold_n = _normalize_for_order_strict(df_gold)
             df_pred_n = _normalize_for_order_strict(df_pred)
+            lap(profile, "dataframe")
 
             if df_gold_n.shape[0] != df_pred_n.shape[0]:
                 result["execution_error"] = (
@@ -360,26 +809,51 @@ def evaluate_sql_execution(
             col_compare_cache = {}
 
             with db_conn.cursor() as cursor_cmp:
-                for p_idx, p_name in enumerate(pred_cols):
+                # 每列只归一化一次，之后用列指纹筛选候选列对
+                gold_profiles = []
+                for g_idx, g_name in enumerate(gold_cols):
+                    g_vals = df_gold_n[g_name].tolist()
+                    if gold_geom is not None:
+                        g_ewkts = gold_geom[g_idx]
+                    else:
+                        g_ewkts = _column_ewkts(cursor_cmp, g_vals, geom_cache)
+                    gold_profiles.append(_profile_column(g_vals, g_ewkts))
+                pred_profiles = []
+                for p_name in pred_cols:
+                    p_vals = df_pred_n[p_name].tolist()
+                    pred_profiles.append(_profile_column(p_vals, _column_ewkts(cursor_cmp, p_vals, geom_cache)))
+                lap(profile, "geometry_normalize")
+
+                for p_idx in range(len(pred_cols)):
                     ok_list = []
-                    for g_idx, g_name in enumerate(gold_cols):
-                        key = (p_idx, g_idx)
-                        details = _columns_equal(cursor_cmp, df_gold_n[g_name], df_pred_n[p_name])
-                        col_compare_cache[key] = details
-                        if details["equal"]:
+                    for g_idx in range(len(gold_cols)):
+                        equal, details = _fingerprint_equal(cursor_cmp, gold_profiles[g_idx], pred_profiles[p_idx])
+                        if details is not None:
+                            col_compare_cache[(p_idx, g_idx)] = details
+                        if equal:
                             ok_list.append(g_idx)
                     pred_to_gold_ok[p_idx] = ok_list
 
-            pred2gold = _max_bipartite_match(pred_to_gold_ok, len(gold_cols))
-            if len(pred2gold) != len(pred_cols):
-
-                not_matched = [pred_cols[i] for i in range(len(pred_cols)) if i not in pred2gold]
-                result["execution_error"] = (
-                    "Column subset match failed: some pred columns could not find an equal value counterpart in gold."
-                    f" Unmatched pred columns: {not_matched}"
-                )
-                result["result_correct"] = "incorrect"
-                return result
+                pred2gold = _max_bipartite_match(pred_to_gold_ok, len(gold_cols))
+                lap(profile, "column_match")
+                if len(pred2gold) != len(pred_cols):
+
+                    not_matched = [pred_cols[i] for i in range(len(pred_cols)) if i not in pred2gold]
+                    result["execution_error"] = (
+                        "Column subset match failed: some pred columns could not find an equal value counterpart in gold."
+                        f" Unmatched pred columns: {not_matched}"
+                    )
+                    result["result_correct"] = "incorrect"
+                    return result
+
+                # 完整的逐行统计只对最终匹配上的列对计算
+                for p_idx, g_idx in pred2gold.items():
+                    if (p_idx, g_idx) not in col_compare_cache:
+                        g_prof, p_prof = gold_profiles[g_idx], pred_profiles[p_idx]
+                        col_compare_cache[(p_idx, g_idx)] = _column_details(
+                            cursor_cmp, g_prof["values"], p_prof["values"], g_prof["ewkts"], p_prof["ewkts"]
+                        )
+                lap(profile, "column_details")
 
             comparison = []
             col_types = []
@@ -434,11 +908,18 @@ def evaluate_sql_execution(
             result["result_correct"] = "correct"
 
     except Exception as e:
+        result["execution_error"] = str(e)
+    finally:
+        # 条目结束时总是回滚，pred 的副作用不会留给下一条
         try:
             db_conn.rollback()
         except:
             pass
-        result["execution_error"] = str(e)
+        if geom_cache is not None:
+            result["geom_cache"] = {
+                "hits": geom_cache.hits - cache_hits0,
+                "misses": geom_cache.misses - cache_misses0
+            }
 
     return result
 
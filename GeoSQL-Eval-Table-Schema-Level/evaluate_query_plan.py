@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+EXPLAIN-based cost profile of predicted vs gold SQL (Table-Schema level).
+
+Correct results can still come from pathologically slow PostGIS queries,
+e.g. ST_Distance(a, b) < d in WHERE instead of ST_DWithin(a, b, d), which
+cannot use a GiST index. evaluate_query_plan() runs EXPLAIN (VERBOSE,
+FORMAT JSON) for gold_sql and pred_sql, or EXPLAIN (ANALYZE, BUFFERS,
+VERBOSE, FORMAT JSON) with analyze=True, and records per side the planner
+cost and estimated rows, the plan node types, the indexes used and whether
+any of them is a spatial index, i.e. has an operator class on geometry or
+geography (a GiST index on a range or a BRIN index on a timestamp is not);
+indexes are looked up in the schema EXPLAIN reports for their scan. With
+ANALYZE also the actual execution time, actual rows and shared buffer
+hits / reads. cost_ratio (and time_ratio) is
+pred over gold; eval_summary_query_plan.py aggregates them per model.
+
+Like evaluate_sql_execution, every EXPLAIN runs under a savepoint that is
+rolled back, so ANALYZE of DDL/DML leaves nothing behind and gold and pred
+do not see each other's side effects.
+"""
+import json
+from typing import Any, Dict
+
+from sql_analysis import strip_transaction_control
+
+# 评测逻辑（记录字段、比值定义）变化时递增，使增量评测缓存中的旧结果失效
+EVALUATOR_VERSION = "2"
+
+# 操作符类的输入类型属于这些类型的索引才算空间索引
+SPATIAL_TYPES = ("geometry", "geography")
+
+# (schema, 索引名) -> 是否有 geometry / geography 操作符类；schema 为 NULL 时按 search_path 解析
+_SPATIAL_INDEX_SQL = """
+    SELECT q.schema, q.name, bool_or(t.typname = ANY(%s))
+    FROM unnest(%s::text[], %s::text[]) AS q(schema, name)
+    JOIN pg_class c ON c.oid = COALESCE(
+        to_regclass(quote_ident(q.schema) || '.' || quote_ident(q.name)),
+        to_regclass(quote_ident(q.name)))
+    JOIN pg_index i ON i.indexrelid = c.oid
+    JOIN pg_opclass oc ON oc.oid = ANY(i.indclass::oid[])
+    JOIN pg_type t ON t.oid = oc.opcintype
+    GROUP BY q.schema, q.name
+"""
+
+
+def _walk(plan, schema=None):
+    # Bitmap Index Scan 节点没有 Schema，沿用上层 Bitmap Heap Scan 的
+    schema = plan.get("Schema", schema)
+    yield plan, schema
+    for child in plan.get("Plans", ()):
+        yield from _walk(child, schema)
+
+
+def _spatial_indexes(cursor, indexes) -> set:
+    """indexes 中有 geometry / geography 操作符类的 (schema, 索引名)"""
+    if not indexes:
+        return set()
+    indexes = sorted(indexes, key=lambda k: (k[0] or "", k[1]))
+    cursor.execute(_SPATIAL_INDEX_SQL, (list(SPATIAL_TYPES), [k[0] for k in indexes], [k[1] for k in indexes]))
+    return {(schema, name) for schema, name, spatial in cursor.fetchall() if spatial}
+
+
+def summarize_plan(cursor, explain_output) -> Dict[str, Any]:
+    top = explain_output[0]
+    root = top["Plan"]
+    walked = list(_walk(root))
+    nodes = [n for n, _ in walked]
+    indexes = {(schema, n["Index Name"]) for n, schema in walked if n.get("Index Name")}
+    index_names = {name for _, name in indexes}
+    spatial = sorted({name for _, name in _spatial_indexes(cursor, indexes)})
+
+    info = {
+        "total_cost": root.get("Total Cost"),
+        "startup_cost": root.get("Startup Cost"),
+        "plan_rows": root.get("Plan Rows"),
+        "node_types": sorted({n["Node Type"] for n in nodes}),
+        "seq_scans": sum(1 for n in nodes if n["Node Type"] == "Seq Scan"),
+        "indexes_used": sorted(index_names),
+        "spatial_index_used": bool(spatial),
+        "spatial_indexes": spatial
+    }
+    if "Execution Time" in top:
+        # EXPLAIN ANALYZE, BUFFERS：根节点的缓冲区计数包含所有子节点
+        info.update({
+            "actual_time_ms": top["Execution Time"],
+            "planning_time_ms": top.get("Planning Time"),
+            "actual_rows": root.get("Actual Rows"),
+            "shared_hit_blocks": root.get("Shared Hit Blocks"),
+            "shared_read_blocks": root.get("Shared Read Blocks")
+        })
+    return info
+
+
+def explain_sql(cursor, sql_text: str, analyze: bool = False) -> Dict[str, Any]:
+    """EXPLAIN 单条语句并返回 summarize_plan 的结果；出错时抛出异常"""
+    # VERBOSE 使扫描节点带上 Schema，按 schema 区分同名索引
+    options = "ANALYZE, BUFFERS, VERBOSE, FORMAT JSON" if analyze else "VERBOSE, FORMAT JSON"
+    cursor.execute(f"EXPLAIN ({options}) {sql_text.strip().rstrip(';')}")
+    output = cursor.fetchone()[0]
+    if isinstance(output, str):
+        output = json.loads(output)
+    return summarize_plan(cursor, output)
+
+
+def _ratio(pred_value, gold_value):
+    if pred_value is None or not gold_value:
+        return None
+    return round(pred_value / gold_value, 4)
+
+
+def evaluate_query_plan(sql_text: str, db_conn, gold_sql: str, analyze: bool = False) -> Dict[str, Any]:
+    """
+    Plan gold_sql and sql_text on db_conn (one statement each). A side that
+    cannot be explained gets its error in gold_plan_error / pred_plan_error
+    and no ratio is computed.
+    """
+    result = {
+        "plan_analyzed": analyze,
+        "gold_plan": None,
+        "pred_plan": None,
+        "gold_plan_error": "",
+        "pred_plan_error": "",
+        "cost_ratio": None,
+        "time_ratio": None
+    }
+
+    try:
+        db_conn.rollback()
+    except:
+        pass
+    sandboxed = not db_conn.autocommit
+    try:
+        with db_conn.cursor() as cursor:
+            for side, sql in (("gold", gold_sql), ("pred", sql_text)):
+                stmt, tx_error = strip_transaction_control(sql or "")
+                if tx_error:
+                    result[f"{side}_plan_error"] = tx_error
+                    continue
+                if sandboxed:
+                    cursor.execute("SAVEPOINT explain_plan")
+                try:
+                    result[f"{side}_plan"] = explain_sql(cursor, stmt, analyze)
+                except Exception as e:
+                    result[f"{side}_plan_error"] = str(e).strip()
+                if sandboxed:
+                    cursor.execute("ROLLBACK TO SAVEPOINT explain_plan")
+    finally:
+        try:
+            db_conn.rollback()
+        except:
+            pass
+
+    gold_plan, pred_plan = result["gold_plan"], result["pred_plan"]
+    if gold_plan and pred_plan:
+        result["cost_ratio"] = _ratio(pred_plan["total_cost"], gold_plan["total_cost"])
+        result["time_ratio"] = _ratio(pred_plan.get("actual_time_ms"), gold_plan.get("actual_time_ms"))
+    return result
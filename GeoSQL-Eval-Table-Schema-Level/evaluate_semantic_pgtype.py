@@ -1,36 +1,173 @@
 # evaluate_semantic_pgtype.py
 
-from typing import Dict, Union, List
-from pglast import parse_sql
-from pglast.visitors import Visitor
-from pglast.stream import RawStream
-
-class FunctionCallVisitor(Visitor):
-    def __init__(self, target_func):
-        super().__init__()
-        self.target_func = target_func.lower()
-        self.matches = []
-
-    def visit_FuncCall(self, ancestors, node):
-        func_name = ".".join(n.sval for n in node.funcname)
-        if func_name.lower() == self.target_func:
-            self.matches.append(node)
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, Union, List, Tuple
+import psycopg2
+from sql_analysis import analyze_sql
+from lru_cache import LRUCache
+
+# 评测逻辑（比较规则、返回字段）变化时递增，使增量评测缓存中的旧结果失效
+EVALUATOR_VERSION = "2"
+
+# 签名索引的结构变化时递增，使 function_signatures.index.pkl 重建
+SIGNATURE_INDEX_VERSION = "1"
+
+# 函数签名文件中的类型写法 -> pg_typeof 返回的规范名
+TYPE_ALIASES = {
+    "varchar": "character varying",
+    "char": "character",
+    "bpchar": "character",
+    "int": "integer",
+    "int4": "integer",
+    "int2": "smallint",
+    "int8": "bigint",
+    "float": "double precision",
+    "float8": "double precision",
+    "double": "double precision",
+    "float4": "real",
+    "bool": "boolean",
+    "timestamp": "timestamp without time zone",
+    "timestamptz": "timestamp with time zone",
+}
+
+# 小写函数名 -> [(参数个数, 是否可变参数, 规范化后的参数类型, 原始参数类型)]
+SignatureIndex = Dict[str, List[Tuple[int, bool, Tuple[str, ...], List[str]]]]
+
+
+def canonical_type(type_name: str) -> str:
+    t = " ".join(str(type_name).strip().lower().split())
+    suffix = ""
+    while t.endswith("[]"):
+        t = t[:-2].rstrip()
+        suffix += "[]"
+    return TYPE_ALIASES.get(t, t) + suffix
+
+
+def build_signature_index(function_signatures: List[Dict]) -> SignatureIndex:
+    index = {}
+    for sig in function_signatures:
+        input_types = list(sig.get("input_types") or [])
+        is_variadic = str(sig.get("variadic", "False")).lower() == "true"
+        index.setdefault(sig["function_name"].lower(), []).append(
+            (len(input_types), is_variadic, tuple(canonical_type(t) for t in input_types), input_types)
+        )
+    return index
+
+
+def load_signature_index(signature_path: str) -> SignatureIndex:
+    """
+    读取 function_signatures.json 的预编译索引（同目录下的 .index.pkl）；
+    JSON 内容或索引结构变化时重建并写回，目录不可写时只在内存中使用。
+    """
+    with open(signature_path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha1(SIGNATURE_INDEX_VERSION.encode("utf-8") + raw).hexdigest()
+    index_path = os.path.splitext(signature_path)[0] + ".index.pkl"
 
-def get_pg_typeof(expr_sql: str, db_conn) -> str:
+    try:
+        with open(index_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("digest") == digest:
+            return cached["index"]
+    except Exception:
+        pass
+
+    index = build_signature_index(json.loads(raw.decode("utf-8")))
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"digest": digest, "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return index
+
+
+# 参数表达式文本 -> pg_typeof 结果；跨条目共享，各轮、各模型重复出现的字面量参数只解析一次
+PgTypeofCache = LRUCache
+
+
+def _rollback_if_needed(db_conn):
+    # autocommit 关闭时失败的语句会使事务中止，后续查询全部报错
+    if not db_conn.autocommit:
+        try:
+            db_conn.rollback()
+        except Exception:
+            pass
+
+
+def _typeof_one(expr_sql: str, db_conn):
+    """返回 (类型或错误信息, 是否可缓存)；连接类错误是暂时性的，不缓存"""
     try:
         with db_conn.cursor() as cursor:
             cursor.execute(f"SELECT pg_typeof({expr_sql})")
-            return cursor.fetchone()[0]
+            return cursor.fetchone()[0], True
     except Exception as e:
-        return f"ERROR: {e}"
+        _rollback_if_needed(db_conn)
+        transient = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        return f"ERROR: {e}", not transient
+
+
+def get_pg_typeof(expr_sql: str, db_conn) -> str:
+    return _typeof_one(expr_sql, db_conn)[0]
+
+
+def resolve_pg_types(arg_exprs: List[str], db_conn, type_cache: PgTypeofCache = None) -> List[str]:
+    """
+    一条 SELECT pg_typeof(a1), pg_typeof(a2), ... 解析一次调用的全部参数类型，
+    整条语句出错时才逐个参数回退，以得到各参数各自的错误信息。
+    """
+    resolved = {}
+    pending = []
+    for expr in arg_exprs:
+        if expr in resolved or expr in pending:
+            continue
+        cached = type_cache.get(expr) if type_cache is not None else None
+        if cached is not None:
+            resolved[expr] = cached
+        else:
+            pending.append(expr)
+
+    fetched = []
+    if len(pending) == 1:
+        fetched = [_typeof_one(pending[0], db_conn)]
+    elif pending:
+        try:
+            with db_conn.cursor() as cursor:
+                cursor.execute("SELECT " + ", ".join(f"pg_typeof({expr})" for expr in pending))
+                fetched = [(t, True) for t in cursor.fetchone()]
+        except Exception:
+            _rollback_if_needed(db_conn)
+            fetched = [_typeof_one(expr, db_conn) for expr in pending]
+
+    for expr, (pg_type, cacheable) in zip(pending, fetched):
+        resolved[expr] = pg_type
+        if cacheable and type_cache is not None:
+            type_cache.put(expr, pg_type)
+
+    return [resolved[expr] for expr in arg_exprs]
 
 
 def evaluate_function_args_dynamic(
     sql_text: str,
     function_name: str,
     db_conn,
-    function_signatures: List[Dict]
+    function_signatures: Union[SignatureIndex, List[Dict]],
+    type_cache: PgTypeofCache = None
 ) -> Dict[str, Union[bool, float, List[str], str]]:
+    """
+    function_signatures: load_signature_index() 的结果；传入原始签名列表时
+    每次调用都会重建索引，仅为兼容旧调用方式。
+    参数类型按 TYPE_ALIASES 规范化后比较（如 varchar 与 character varying）。
+    """
+    if isinstance(function_signatures, list):
+        function_signatures = build_signature_index(function_signatures)
     result = {
         "structure_valid": False,
         "function_hit": False,
@@ -40,83 +177,71 @@ def evaluate_function_args_dynamic(
         "param_type_match_detail": [],
         "error": ""
     }
-    # 1. AST parse
-    try:
-        tree = parse_sql(sql_text)
-        result["structure_valid"] = True
-    except Exception as e:
-        result["error"] = f"AST parse failed: {e}"
+    # 1. AST parse (shared with the table/column hit evaluator, see sql_analysis.py)
+    analysis = analyze_sql(sql_text)
+    if analysis.error:
+        result["error"] = f"AST parse failed: {analysis.error}"
         return result
+    result["structure_valid"] = True
 
     # 2. Find function call
-    visitor = FunctionCallVisitor(function_name)
-    visitor(tree)
-    if not visitor.matches:
+    target_func = function_name.lower()
+    matches = [call for call in analysis.func_calls if call.name == target_func]
+    if not matches:
         result["error"] = "Function not found"
         return result
 
     result["function_hit"] = True
-    func_node = visitor.matches[0]
-    args = func_node.args or []
-    arg_exprs = [RawStream()(arg).strip() for arg in args]
-    actual_types = [get_pg_typeof(expr, db_conn) for expr in arg_exprs]
+    arg_exprs = list(matches[0].args)
+    actual_types = resolve_pg_types(arg_exprs, db_conn, type_cache)
     result["actual_arg_types"] = actual_types
 
     # 3. Match all signature overloads and keep the best match
     best_ratio = 0
     best_detail = []
     best_expected = []
+    actual_canon = [canonical_type(a) for a in actual_types]
+    n_actual = len(actual_types)
 
-    for sig in function_signatures:
-        if sig["function_name"].lower() != function_name.lower():
-            continue
-        expected_types = sig["input_types"]
-        is_variadic = str(sig.get("variadic", "False")).lower() == "true"
-
-        if not is_variadic and len(actual_types) != len(expected_types):
+    for arity, is_variadic, expected_canon, expected_types in function_signatures.get(function_name.lower(), ()):
+        if not is_variadic and n_actual != arity:
             continue
 
         if is_variadic:
-            if len(actual_types) < len(expected_types):
+            if n_actual < arity:
                 continue
-            fixed_len = len(expected_types)
             match_count = 0
             match_detail = []
-            all_match = True
 
-            for i in range(fixed_len):
+            for i in range(arity):
                 a, e = actual_types[i], expected_types[i]
-                if a == e:
+                if actual_canon[i] == expected_canon[i]:
                     match_count += 1
                     match_detail.append(f"✔ {a}")
                 else:
                     match_detail.append(f"✘ {a} ≠ {e}")
-                    all_match = False
 
-            variadic_type = expected_types[-1]
-            for i in range(fixed_len, len(actual_types)):
+            variadic_type, variadic_canon = expected_types[-1], expected_canon[-1]
+            for i in range(arity, n_actual):
                 a = actual_types[i]
-                if a == variadic_type:
+                if actual_canon[i] == variadic_canon:
                     match_count += 1
                     match_detail.append(f"✔ {a}")
                 else:
                     match_detail.append(f"✘ {a} ≠ {variadic_type}")
-                    all_match = False
 
-            ratio = match_count / len(actual_types)
+            ratio = match_count / n_actual
 
         else:
             match_count = 0
             match_detail = []
-            all_match = True
-            for a, e in zip(actual_types, expected_types):
-                if a == e:
+            for a, e, a_canon, e_canon in zip(actual_types, expected_types, actual_canon, expected_canon):
+                if a_canon == e_canon:
                     match_count += 1
                     match_detail.append(f"✔ {a}")
                 else:
                     match_detail.append(f"✘ {a} ≠ {e}")
-                    all_match = False
-            ratio = match_count / len(expected_types)
+            ratio = match_count / arity
 
         if ratio > best_ratio:
             best_ratio = ratio
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent store of gold_sql results for the Table-Schema level.
+
+Every question is evaluated for 5 rounds and for every model, but its gold_sql
+never changes. Entries are keyed by (db_id, sha1(gold_sql)) and hold the
+fetched rows, column names, the per-column EWKT normalization used by
+_columns_equal and the gold timing. evaluate_sql_execution reads from the
+store instead of re-executing gold_sql.
+
+Every entry records the evaluate_execution.GOLD_RESULT_VERSION it was built
+with; entries of another version are treated as missing and rebuilt. The
+store cannot notice that a database was reloaded: clear it (all entries, or
+only those of the reloaded db_ids) with --clear.
+
+Warm-up (fills the store for the whole benchmark):
+    python gold_result_store.py [--workers N] [--bench PATH] [--store PATH]
+    python gold_result_store.py --clear [--db DB_ID ...]   # then warm up again
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import time
+
+from tqdm import tqdm
+
+from evaluate_execution import GOLD_RESULT_VERSION, prepare_gold_result
+
+base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
+DEFAULT_STORE_PATH = os.environ.get("GOLD_STORE_PATH", os.path.join(base_dir, "gold_results.sqlite"))
+BENCH_PATH = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Explicit.jsonl"
+
+
+def gold_sql_hash(gold_sql: str) -> str:
+    return hashlib.sha1((gold_sql or "").strip().encode("utf-8")).hexdigest()
+
+
+def _picklable_rows(rows):
+    # psycopg2 以 memoryview 返回 bytea，memoryview 无法 pickle
+    return [tuple(v.tobytes() if isinstance(v, memoryview) else v for v in row) for row in rows]
+
+
+class GoldResultStore:
+    """SQLite-backed (db_id, gold_sql) -> gold result entry mapping."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, version: str = GOLD_RESULT_VERSION):
+        self.path = path
+        self.version = version
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(gold_results)")]
+        if columns and "version" not in columns:
+            # 旧格式的表没有版本列，其中的条目都不可信
+            self.conn.execute("DROP TABLE gold_results")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS gold_results (
+                db_id          TEXT NOT NULL,
+                sql_hash       TEXT NOT NULL,
+                gold_sql       TEXT NOT NULL,
+                columns        TEXT NOT NULL,
+                rows           BLOB NOT NULL,
+                geom_ewkt      BLOB NOT NULL,
+                execution_time REAL NOT NULL,
+                created_at     REAL NOT NULL,
+                version        TEXT NOT NULL,
+                PRIMARY KEY (db_id, sql_hash)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, db_id: str, gold_sql: str):
+        row = self.conn.execute(
+            "SELECT columns, rows, geom_ewkt, execution_time FROM gold_results "
+            "WHERE db_id = ? AND sql_hash = ? AND version = ?",
+            (db_id, gold_sql_hash(gold_sql), self.version)
+        ).fetchone()
+        if row is None:
+            return None
+        columns, rows, geom_ewkt, execution_time = row
+        return {
+            "columns": json.loads(columns),
+            "rows": pickle.loads(rows),
+            "geom_ewkt": pickle.loads(geom_ewkt),
+            "execution_time": execution_time
+        }
+
+    def contains(self, db_id: str, gold_sql: str) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM gold_results WHERE db_id = ? AND sql_hash = ? AND version = ?",
+            (db_id, gold_sql_hash(gold_sql), self.version)
+        ).fetchone() is not None
+
+    def put(self, db_id: str, gold_sql: str, entry: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO gold_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                db_id,
+                gold_sql_hash(gold_sql),
+                gold_sql,
+                json.dumps(entry["columns"], ensure_ascii=False),
+                pickle.dumps(_picklable_rows(entry["rows"]), protocol=pickle.HIGHEST_PROTOCOL),
+                pickle.dumps(entry["geom_ewkt"], protocol=pickle.HIGHEST_PROTOCOL),
+                entry["execution_time"],
+                time.time(),
+                self.version
+            )
+        )
+        self.conn.commit()
+
+    def clear(self, db_ids=None) -> int:
+        """删除全部条目（或只删除 db_ids 中数据库的条目），返回删除的条数；数据库重新导入后使用"""
+        if db_ids:
+            placeholders = ",".join("?" * len(db_ids))
+            cur = self.conn.execute(f"DELETE FROM gold_results WHERE db_id IN ({placeholders})", list(db_ids))
+        else:
+            cur = self.conn.execute("DELETE FROM gold_results")
+        self.conn.commit()
+        return cur.rowcount
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+# ===== Warm-up =====
+
+_worker_store = None
+
+
+def _init_warmup_worker(store_path):
+    global _worker_store
+    _worker_store = GoldResultStore(store_path)
+
+
+def _warm_one(task):
+    from db_pool import get_pool
+
+    db_id, gold_sql = task
+    if _worker_store.contains(db_id, gold_sql):
+        return db_id, "cached", ""
+    try:
+        # 连接池的连接自带 statement_timeout；归还时回滚，丢弃 gold_sql 可能的副作用（如 AddGeometryColumn）
+        with get_pool(db_id).connection() as conn:
+            with conn.cursor() as cursor:
+                entry = prepare_gold_result(cursor, gold_sql)
+        if entry["normalize_errors"]:
+            # 归一化失败可能是暂时性的，不写入存储，评测时重新执行
+            return db_id, "not stored", entry["normalize_errors"][0]
+        _worker_store.put(db_id, gold_sql, entry)
+        return db_id, "stored", ""
+    except Exception as e:
+        return db_id, "failed", str(e)
+
+
+def load_gold_tasks(bench_path: str):
+    tasks, seen = [], set()
+    with open(bench_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            db_id = (obj.get("db_id") or "").strip()
+            gold_sql = obj.get("query") or ""
+            if not db_id or not gold_sql:
+                continue
+            key = (db_id, gold_sql_hash(gold_sql))
+            if key not in seen:
+                seen.add(key)
+                tasks.append((db_id, gold_sql))
+    return tasks
+
+
+def warm_up(bench_path: str = BENCH_PATH, store_path: str = DEFAULT_STORE_PATH, workers: int = 4):
+    tasks = load_gold_tasks(bench_path)
+    print(f"Distinct gold queries: {len(tasks)}")
+
+    counts = {"stored": 0, "cached": 0, "not stored": 0, "failed": 0}
+    failures = []
+    with multiprocessing.Pool(processes=max(1, workers), initializer=_init_warmup_worker,
+                              initargs=(store_path,)) as pool:
+        for db_id, status, err in tqdm(pool.imap_unordered(_warm_one, tasks, chunksize=8),
+                                       total=len(tasks), desc="gold warm-up", ncols=80):
+            counts[status] += 1
+            if err:
+                failures.append((db_id, err))
+
+    for db_id, err in failures[:20]:
+        print(f"[failed / not stored] {db_id}: {err}")
+    print(f"Gold warm-up completed: {counts}, store: {store_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the gold result store for the whole benchmark.")
+    parser.add_argument("--bench", default=BENCH_PATH, help="benchmark JSONL with db_id and query")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="SQLite store path")
+    parser.add_argument("--workers", type=int, default=4, help="number of worker processes")
+    parser.add_argument("--clear", action="store_true",
+                        help="delete stored entries before warming up, e.g. after the databases were reloaded")
+    parser.add_argument("--db", nargs="+", default=None, help="with --clear, only delete the entries of these db_ids")
+    args = parser.parse_args()
+    if args.clear:
+        store = GoldResultStore(args.store)
+        print(f"Cleared {store.clear(args.db)} gold entries from {args.store}")
+        store.close()
+    warm_up(args.bench, args.store, args.workers)
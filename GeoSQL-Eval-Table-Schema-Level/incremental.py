@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental evaluation: only re-evaluate records whose inputs changed.
+
+For every evaluation stage the cache keeps, per unique_key, a hash of the
+fields the evaluator reads plus the evaluator version, and the fields the
+evaluator added or changed. evaluate_incremental() re-runs the evaluator
+only for new or changed records and merges the cached fields into the
+current records for the rest, so topping up a model with a few new rounds
+does not re-execute everything. Bump EVALUATOR_VERSION in the evaluator
+module whenever its logic changes; that invalidates the stage.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from jsonl_io import iter_jsonl, dumps, loads
+
+# 每写入多少条提交一次
+COMMIT_EVERY = 500
+
+
+def input_hash(record: dict, fields, version: str) -> str:
+    payload = [version] + [record.get(f) for f in fields]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+                        .encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: str) -> str:
+    """评测依赖的外部文件（如函数签名）变化时也应使缓存失效"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def _changed_fields(before: dict, after: dict) -> dict:
+    return {k: v for k, v in after.items() if k not in before or before[k] != v}
+
+
+class EvalResultCache:
+    """SQLite-backed (stage, unique_key) -> (input hash, evaluator output fields) mapping."""
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS eval_results (
+                stage      TEXT NOT NULL,
+                unique_key TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                fields     BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (stage, unique_key)
+            )
+        """)
+        self.conn.commit()
+
+    def hashes(self, stage: str) -> dict:
+        return dict(self.conn.execute(
+            "SELECT unique_key, input_hash FROM eval_results WHERE stage = ?", (stage,)))
+
+    def get(self, stage: str, unique_key: str, digest: str):
+        row = self.conn.execute(
+            "SELECT fields FROM eval_results WHERE stage = ? AND unique_key = ? AND input_hash = ?",
+            (stage, unique_key, digest)
+        ).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def put(self, stage: str, unique_key: str, digest: str, fields: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO eval_results VALUES (?, ?, ?, ?, ?)",
+            (stage, unique_key, digest, dumps(fields), time.time())
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        try:
+            self.conn.commit()
+            self.conn.close()
+        except Exception:
+            pass
+
+
+def evaluate_incremental(path: str, evaluate, cache: EvalResultCache, stage: str, hash_fields, version: str,
+                         cacheable=None, volatile=()):
+    """
+    按 path 中的记录顺序产出评测结果。
+    evaluate: 接收记录迭代器、按顺序产出评测后记录的函数（各 main_eval 的 evaluate_records）
+    cacheable: 可选，判断某条结果能否写入缓存（如连接错误这类暂时性失败不应缓存）
+    volatile: 只属于本次运行的字段（如 profile 计时），不写入缓存，只出现在本次重新评测的记录上
+    """
+    known = cache.hashes(stage)
+
+    # 第一遍：找出新增或输入变化的记录，落到临时文件
+    fd, miss_path = tempfile.mkstemp(prefix=f".{stage}_pending_", suffix=".jsonl",
+                                     dir=os.path.dirname(path) or None)
+    total = misses = 0
+    seen, duplicates = set(), set()
+    with os.fdopen(fd, "wb") as f:
+        for index, record in enumerate(iter_jsonl(path)):
+            total += 1
+            key = record.get("unique_key")
+            if key:
+                if key in seen:
+                    duplicates.add(key)
+                seen.add(key)
+            if key and known.get(key) == input_hash(record, hash_fields, version):
+                continue
+            misses += 1
+            f.write(dumps([index, record]) + b"\n")
+    known = seen = None
+    print(f"[incremental] {stage}: {total - misses} cached, {misses} to evaluate")
+    if duplicates:
+        # 缓存按 (stage, unique_key) 存一份结果，重复 key 的后一条会覆盖前一条，这些记录的结果只保存在内存里
+        print(f"[incremental] {stage}: WARNING {len(duplicates)} unique_key values appear more than once, "
+              f"their results are not cached (e.g. {next(iter(duplicates))})")
+
+    # 第二步：只评测这些记录；不能缓存的结果（或没有 unique_key、unique_key 重复的记录）与 volatile 字段暂存在内存里
+    fresh = {}
+    run_only = {}
+    try:
+        if misses:
+            originals = iter_jsonl(miss_path)
+            results = evaluate(record for _, record in iter_jsonl(miss_path))
+            stored = 0
+            try:
+                for (index, before), after in zip(originals, results):
+                    fields = _changed_fields(before, after)
+                    volatile_fields = {k: fields.pop(k) for k in volatile if k in fields}
+                    if volatile_fields:
+                        run_only[index] = volatile_fields
+                    key = before.get("unique_key")
+                    if key and key not in duplicates and (cacheable is None or cacheable(after)):
+                        cache.put(stage, key, input_hash(before, hash_fields, version), fields)
+                        stored += 1
+                        if stored % COMMIT_EVERY == 0:
+                            cache.commit()
+                    else:
+                        fresh[index] = fields
+            finally:
+                # 关闭评测生成器，释放其进程池与数据库连接
+                results.close()
+                cache.commit()
+    finally:
+        os.remove(miss_path)
+
+    # 第三遍：按原顺序合并
+    for index, record in enumerate(iter_jsonl(path)):
+        fields = fresh.pop(index, None)
+        if fields is None:
+            fields = cache.get(stage, record.get("unique_key"), input_hash(record, hash_fields, version))
+        if fields:
+            record.update(fields)
+        record.update(run_only.pop(index, {}))
+        yield record
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Local (shapely) fast path for the geometry column comparison.
+
+_compare_geometry_column in evaluate_execution.py decides, per row of two
+EWKT-normalized columns, ST_Equals of both sides snapped to a 1e-5 grid and
+the Z check over ST_DumpPoints, which costs a PostGIS round trip per
+column. Most geometries in the benchmark are 2D/3D points, linestrings and
+polygons (or their MULTI variants) in SRID 4326, for which GEOS through
+shapely gives the same answer. local_geometry_flags() parses the EWKTs in
+bulk, snaps x/y exactly like ST_SnapToGrid (rint(x / 1e-5) * 1e-5), runs the
+vectorized equality and reduces the Z values of every geometry to
+min / max / NULL counts in NumPy. Rows it cannot decide are returned as
+None and go to PostGIS as before: curves, TIN, polyhedral surfaces,
+geometry collections, M coordinates, EMPTY, mismatching SRIDs, and
+geometries that become invalid after snapping (ST_SnapToGrid would drop
+collapsed parts instead).
+
+The fast path is off unless shapely (>= 2.0) is installed and
+EVAL_LOCAL_GEOMETRY=1; bench_local_geometry.py checks it against PostGIS.
+"""
+import os
+import re
+
+import numpy as np
+
+try:
+    import shapely
+except ImportError:  # shapely 为可选依赖
+    shapely = None
+
+LOCAL_GEOMETRY = shapely is not None and os.environ.get("EVAL_LOCAL_GEOMETRY", "0") == "1"
+
+# 与 _GEOM_BATCH_COMPARE_SQL 中的 ST_SnapToGrid(..., 1e-5) 及 Z 容差一致
+GRID_SIZE = 1e-5
+Z_TOLERANCE = 1e-6
+
+# ST_AsEWKT 的输出：3D 不带 Z 关键字，3DM 为 POINTM(...)，不匹配 "\s*\(" 的类型（含 EMPTY）一律交给 PostGIS
+_SIMPLE_EWKT_RE = re.compile(r"^(?:SRID=(\d+);)?((?:MULTI)?(?:POINT|LINESTRING|POLYGON))\s*\(", re.IGNORECASE)
+_FIRST_COORD_RE = re.compile(r"\(([^(),]+)[,)]")
+
+
+def split_ewkt(ewkt: str):
+    """(srid, wkt) for a 2D/3D point / linestring / polygon EWKT (or MULTI), None otherwise"""
+    ewkt = ewkt.strip()
+    m = _SIMPLE_EWKT_RE.match(ewkt)
+    if m is None:
+        return None
+    # 4D（XYZM）坐标也写成不带关键字的形式，按首个坐标的分量数排除
+    coord = _FIRST_COORD_RE.search(ewkt, m.end() - 1)
+    if coord is None or len(coord.group(1).split()) not in (2, 3):
+        return None
+    return int(m.group(1) or 0), ewkt[m.start(2):]
+
+
+def _snap(coords):
+    # 与 ST_SnapToGrid 相同的浮点运算：rint((x - 0) / size) * size
+    return np.rint(coords / GRID_SIZE) * GRID_SIZE
+
+
+def _z_ranges(geoms) -> "tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]":
+    """每个几何的 (点数, Z 为 NULL 的点数, Z 最小值, Z 最大值)；2D 几何的 Z 为 NaN"""
+    k = len(geoms)
+    coords, index = shapely.get_coordinates(geoms, include_z=True, return_index=True)
+    z = coords[:, 2]
+    null = np.isnan(z)
+    n_points = np.bincount(index, minlength=k)
+    n_null = np.bincount(index, weights=null, minlength=k)
+    z_min = np.full(k, np.inf)
+    z_max = np.full(k, -np.inf)
+    np.minimum.at(z_min, index[~null], z[~null])
+    np.maximum.at(z_max, index[~null], z[~null])
+    return n_points, n_null, z_min, z_max
+
+
+def local_geometry_flags(g_ewkts: list, p_ewkts: list) -> list:
+    """
+    Per row (equals_ok, z_ok) with the semantics of _batch_geometry_flags,
+    or None where PostGIS has to decide.
+
+    The Z check of _z_sequences_match compares every (gold, pred) point pair,
+    so it only depends on the number of points, the number of NULL Z values
+    and the Z range of each side: it passes when both sides are all NULL, or
+    when neither side has a NULL and max|zg - zp| over all pairs, i.e.
+    max(zg_max - zp_min, zp_max - zg_min), is within Z_TOLERANCE.
+    """
+    n = len(g_ewkts)
+    flags = [None] * n
+    if shapely is None or n == 0:
+        return flags
+
+    g_parts = [split_ewkt(e) for e in g_ewkts]
+    p_parts = [split_ewkt(e) for e in p_ewkts]
+    rows = [i for i in range(n) if g_parts[i] and p_parts[i] and g_parts[i][0] == p_parts[i][0]]
+    if not rows:
+        return flags
+
+    m = len(rows)
+    geoms = shapely.from_wkt([g_parts[i][1] for i in rows] + [p_parts[i][1] for i in rows], on_invalid="ignore")
+    snapped = shapely.transform(geoms, _snap)
+    ok = shapely.is_valid(snapped) & ~shapely.is_empty(snapped)
+    decided = ok[:m] & ok[m:]
+    if not decided.any():
+        return flags
+
+    equals = np.zeros(m, dtype=bool)
+    equals[decided] = shapely.equals(snapped[:m][decided], snapped[m:][decided])
+
+    n_points, n_null, z_min, z_max = _z_ranges(np.where(np.concatenate([decided, decided]), geoms, None))
+    g, p = np.arange(m), np.arange(m, 2 * m)
+    all_null = (n_null[g] == n_points[g]) & (n_null[p] == n_points[p])
+    no_null = (n_null[g] == 0) & (n_null[p] == 0)
+    with np.errstate(invalid="ignore"):
+        # 含 NULL 的一侧范围为 ±inf，相减得到的 NaN 已由 no_null 排除
+        within = np.maximum(z_max[g] - z_min[p], z_max[p] - z_min[g]) <= Z_TOLERANCE
+    z_ok = (n_points[g] > 0) & (n_points[p] > 0) & (all_null | (no_null & within))
+
+    for j, i in enumerate(rows):
+        if decided[j]:
+            flags[i] = (bool(equals[j]), bool(z_ok[j]))
+    return flags
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Bounded LRU cache with hit / miss counters, shared by the evaluators."""
+from collections import OrderedDict
+from typing import Dict
+
+
+class LRUCache:
+    """
+    Bounded LRU mapping. None is never a valid value: get() returns None for
+    a miss. One instance can be shared across items so that values repeated
+    across rounds and models are computed once.
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
@@ -1,91 +1,218 @@
-import json
+import argparse
+import functools
+import itertools
+import multiprocessing
+import multiprocessing.util
 import os
 import psycopg2
+from psycopg2.pool import PoolError
 from tqdm import tqdm
-from evaluate_execution import evaluate_sql_execution
-
-BASE_DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5432,
-    'user': 'postgres',
-    'password': '*******'
-}
+from jsonl_io import iter_jsonl, write_jsonl, count_lines
+from evaluate_execution import evaluate_sql_execution, GeometryNormalizationCache, EVALUATOR_VERSION
+from gold_result_store import GoldResultStore, DEFAULT_STORE_PATH
+from incremental import EvalResultCache, evaluate_incremental
+from db_pool import get_pool, close_all
+from db_sandbox import sandbox_db, drop_clones
+from profiling import ItemProfile, lap, profiled
+from eval_summary_profile import summarize_profile
 
 model_name = os.environ.get("MODEL_NAME", "default-model")
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
 
 input_path = os.path.join(base_dir, model_name, "predictions_deduplicated_with_dbid.jsonl")
 output_path = os.path.join(base_dir, model_name, "predictions_execution_eval.jsonl")
+cache_path = os.path.join(base_dir, model_name, "eval_cache.sqlite")
+profile_path = os.path.join(base_dir, model_name, "eval_profile.json")
+
+# 增量评测：这些字段与 EVALUATOR_VERSION 都未变化的记录直接复用上次结果
+HASH_FIELDS = ("pred_sql", "gold_sql", "db_id")
+# 计时只属于产生它的那次运行，不写入增量缓存；复用缓存结果的记录不带 profile
+VOLATILE_FIELDS = ("profile",)
+
+# 同一问题的 5 轮预测返回的几何大多相同，跨条目共享几何解析缓存
+GEOM_CACHE_SIZE = int(os.environ.get("GEOM_CACHE_SIZE", "200000"))
+_geom_cache = GeometryNormalizationCache(maxsize=GEOM_CACHE_SIZE)
+
+# gold_sql 结果库：每个问题的 gold 只执行一次（可用 gold_result_store.py 预热）
+_gold_store_path = os.environ.get("GOLD_STORE_PATH", DEFAULT_STORE_PATH)
+_gold_store = None
+
+# 每个工作进程在 db_id 的克隆库（CREATE DATABASE ... TEMPLATE）上评测，多进程可同时评测同一 db_id
+_clone_dbs = os.environ.get("EVAL_CLONE_DB", "0") == "1"
 
-_conn_cache = {}
+# 记录每条的分阶段耗时与数据库往返次数（item["profile"]），汇总到 eval_profile.json
+_profile = os.environ.get("EVAL_PROFILE", "0") == "1"
 
-def get_connection_for_db(db_id):
-    if db_id in _conn_cache:
-        return _conn_cache[db_id]
-    cfg = BASE_DB_CONFIG.copy()
-    cfg['dbname'] = db_id
-    conn = psycopg2.connect(**cfg)
-    conn.set_client_encoding('UTF8')
-    _conn_cache[db_id] = conn
-    return conn
+def get_gold_store():
+    global _gold_store
+    if _gold_store is None and _gold_store_path:
+        _gold_store = GoldResultStore(_gold_store_path)
+    return _gold_store
 
-def main():
-    with open(input_path, 'r', encoding='utf-8') as fin:
-        all_data = [json.loads(line) for line in fin]
+def evaluate_item(item):
+    db_id = ""
+    profile = ItemProfile() if _profile else None
+    try:
+        pred_sql = item.get("pred_sql", "")
+        gold_sql = item.get("gold_sql", "")
+        db_id = (item.get("db_id") or "").strip()
 
-    with open(output_path, 'w', encoding='utf-8') as fout:
-        for item in tqdm(all_data, desc="eval", ncols=80):
+        if not pred_sql or not gold_sql or not db_id:
+            item.update({
+                "executable": False,
+                "execution_error": "missing pred_sql / gold_sql / db_id",
+                "result_correct": "error",
+                "result_comparison": {}
+            })
+        else:
+            # 每个 db_id 一个连接池；取用前检测连接是否存活，失效则重连。
+            # 条目在回滚的事务中执行；开启克隆时连接本进程的克隆库，gold 结果库仍按原 db_id 查找
+            pool = get_pool(sandbox_db(db_id) if _clone_dbs else db_id)
+            conn = pool.acquire()
+            lap(profile, "acquire")
             try:
-                pred_sql = item.get("pred_sql", "")
-                gold_sql = item.get("gold_sql", "")
-                expected = item.get("expected_result", None)
-                db_id = item.get("db_id", "").strip()
-
-                if not pred_sql or not gold_sql or not db_id:
-                    item.update({
-                        "executable": False,
-                        "execution_error": "missing pred_sql / gold_sql / db_id",
-                        "result_correct": "error",
-                        "result_comparison": {}
-                    })
-                else:
-                    conn = get_connection_for_db(db_id)
+                with profiled(conn, profile):
                     eval_result = evaluate_sql_execution(
                         sql_text=pred_sql,
                         db_conn=conn,
-                        expected_result=expected,
-                        gold_sql=gold_sql
+                        gold_sql=gold_sql,
+                        geom_cache=_geom_cache,
+                        gold_store=get_gold_store(),
+                        db_id=db_id,
+                        profile=profile
                     )
-                    item.update(eval_result)
-
-            except psycopg2.InterfaceError as conn_err:
-                item.update({
-                    "executable": False,
-                    "execution_error": f"connection error: {str(conn_err)}",
-                    "result_correct": "error",
-                    "result_comparison": {}
-                })
-                # 下次 get_connection_for_db 会重新连接
-                _conn_cache.pop(db_id, None)
-
-            except Exception as e:
-                item.update({
-                    "executable": False,
-                    "execution_error": str(e),
-                    "result_correct": "error",
-                    "result_comparison": {}
-                })
-
-            fout.write(json.dumps(item, ensure_ascii=False) + '\n')
-
-    # 最后关闭所有缓存连接
-    for conn in _conn_cache.values():
-        try:
-            conn.close()
-        except:
-            pass
+            finally:
+                pool.release(conn)
+            item.update(eval_result)
+
+    except (psycopg2.InterfaceError, psycopg2.OperationalError, PoolError) as conn_err:
+        item.update({
+            "executable": False,
+            "execution_error": f"connection error: {str(conn_err)}",
+            "result_correct": "error",
+            "result_comparison": {}
+        })
+        # 失效连接归还时已被丢弃，下次取用时连接池会重连
+
+    except Exception as e:
+        item.update({
+            "executable": False,
+            "execution_error": str(e),
+            "result_correct": "error",
+            "result_comparison": {}
+        })
+
+    if profile is not None:
+        item["profile"] = profile.as_dict()
+    return item
+
+def _init_worker(gold_store_path, clone_dbs, profile):
+    global _gold_store_path, _gold_store, _clone_dbs, _profile
+    # 每个工作进程各自维护 db_id -> 连接池（fork 时 db_pool 会丢弃继承的连接）与 gold 结果库连接，进程退出时关闭
+    _gold_store_path, _gold_store, _clone_dbs, _profile = gold_store_path, None, clone_dbs, profile
+    multiprocessing.util.Finalize(None, close_all, exitpriority=10)
+    if clone_dbs:
+        # 先于 close_all 执行：关闭连接池后删除本进程的克隆库
+        multiprocessing.util.Finalize(None, drop_clones, exitpriority=11)
+
+def _imap_bounded(pool, func, records, chunksize: int, window: int):
+    """
+    分批交给 pool.imap：imap 会在后台线程中一次性取完输入迭代器，
+    直接传入流式记录会把整个文件读进内存，这里每次只放入 window 条。
+    """
+    it = iter(records)
+    while True:
+        batch = list(itertools.islice(it, window))
+        if not batch:
+            return
+        yield from pool.imap(func, batch, chunksize=chunksize)
+
+def evaluate_records(records, workers: int = 1, chunksize: int = 20, gold_store_path: str = None,
+                     clone_dbs: bool = None, profile: bool = None):
+    """按输入顺序逐条产出评测后的记录，结束（或提前关闭）时释放连接、克隆库与进程池"""
+    global _gold_store_path, _gold_store, _clone_dbs, _profile
+    if gold_store_path is not None:
+        _gold_store_path = gold_store_path
+    if clone_dbs is not None:
+        _clone_dbs = clone_dbs
+    if profile is not None:
+        _profile = profile
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(processes=workers, initializer=_init_worker,
+                                    initargs=(_gold_store_path, _clone_dbs, _profile))
+        # imap 保持输入顺序，eval_summary_with_passn.py 依赖每 5 行一组的排列；
+        # chunksize 取 5 的倍数，让同一问题的各轮落在同一进程以复用几何缓存
+        results = _imap_bounded(pool, evaluate_item, records, chunksize, window=workers * chunksize * 4)
+    else:
+        results = map(evaluate_item, records)
+
+    try:
+        yield from results
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        # 最后关闭所有连接池（并删除单进程模式下创建的克隆库）
+        drop_clones()
+        close_all()
+        if _gold_store is not None:
+            _gold_store.close()
+            _gold_store = None
+
+        if pool is None:
+            print(f"Geometry cache: {_geom_cache.stats()}")
+
+def is_cacheable(item):
+    # 连接中断属于暂时性失败，不写入增量缓存，下次重新评测
+    return not str(item.get("execution_error") or "").startswith("connection error")
+
+def evaluate_file(path, workers: int = 1, chunksize: int = 20, gold_store_path: str = None,
+                  cache: EvalResultCache = None, clone_dbs: bool = None, profile: bool = None):
+    """评测 path 中的记录；给定 cache 时只评测新增或输入变化的记录，其余取缓存结果"""
+    evaluate = functools.partial(evaluate_records, workers=workers, chunksize=chunksize,
+                                 gold_store_path=gold_store_path, clone_dbs=clone_dbs, profile=profile)
+    if cache is None:
+        return evaluate(iter_jsonl(path))
+    return evaluate_incremental(path, evaluate, cache, "execution", HASH_FIELDS, EVALUATOR_VERSION,
+                                cacheable=is_cacheable, volatile=VOLATILE_FIELDS)
+
+def main(workers: int = 1, chunksize: int = 20, gold_store_path: str = None, incremental: bool = False,
+         clone_dbs: bool = None, profile: bool = None):
+    cache = EvalResultCache(cache_path) if incremental else None
+    try:
+        results = evaluate_file(input_path, workers, chunksize, gold_store_path, cache, clone_dbs, profile)
+        write_jsonl(output_path, tqdm(results, total=count_lines(input_path), desc="eval", ncols=80))
+    finally:
+        if cache is not None:
+            cache.close()
 
     print(f"Complete: {output_path}")
+    if _profile:
+        summarize_profile(iter_jsonl(output_path), model_name=model_name, output_path=profile_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Execution-based evaluation of pred_sql against gold_sql.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("EVAL_WORKERS", "1")),
+                        help="number of worker processes (default: EVAL_WORKERS or 1)")
+    parser.add_argument("--chunksize", type=int, default=20,
+                        help="items handed to a worker at a time; keep it a multiple of 5")
+    parser.add_argument("--gold-store", default=None,
+                        help=f"gold result store path (default: GOLD_STORE_PATH or {DEFAULT_STORE_PATH})")
+    parser.add_argument("--no-gold-store", action="store_true",
+                        help="execute gold_sql for every item instead of using the store")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only evaluate records whose pred_sql / gold_sql / db_id changed since the last run")
+    parser.add_argument("--clone-db", action="store_true", default=None,
+                        help="evaluate each worker against its own template clone of every db_id (default: EVAL_CLONE_DB)")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="record per-phase timings and DB round trips and write eval_profile.json (default: EVAL_PROFILE)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(workers=args.workers, chunksize=args.chunksize,
+         gold_store_path="" if args.no_gold_store else args.gold_store, incremental=args.incremental,
+         clone_dbs=args.clone_db, profile=args.profile)
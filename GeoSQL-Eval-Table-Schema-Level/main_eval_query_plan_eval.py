@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import argparse
+import functools
+import os
+import psycopg2
+from psycopg2.pool import PoolError
+from tqdm import tqdm
+from jsonl_io import iter_jsonl, write_jsonl, count_lines
+from evaluate_query_plan import evaluate_query_plan, EVALUATOR_VERSION
+from incremental import EvalResultCache, evaluate_incremental
+from db_pool import get_pool, close_all
+
+model_name = os.environ.get("MODEL_NAME", "default-model")
+base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
+
+input_path = os.path.join(base_dir, model_name, "predictions_deduplicated_with_dbid.jsonl")
+output_path = os.path.join(base_dir, model_name, "predictions_query_plan_eval.jsonl")
+cache_path = os.path.join(base_dir, model_name, "eval_cache.sqlite")
+
+# 增量评测：这些字段、EVALUATOR_VERSION 与是否 ANALYZE 都未变化的记录直接复用上次结果
+HASH_FIELDS = ("pred_sql", "gold_sql", "db_id")
+
+# EXPLAIN ANALYZE 会真正执行 gold 与 pred（在回滚的保存点内），默认只取计划代价
+EXPLAIN_ANALYZE = os.environ.get("EXPLAIN_ANALYZE", "0") == "1"
+
+def evaluate_item(item, analyze: bool = EXPLAIN_ANALYZE):
+    try:
+        pred_sql = item.get("pred_sql", "")
+        gold_sql = item.get("gold_sql", "")
+        db_id = (item.get("db_id") or "").strip()
+
+        if not pred_sql or not gold_sql or not db_id:
+            item["plan_error"] = "missing pred_sql / gold_sql / db_id"
+        else:
+            with get_pool(db_id).connection() as conn:
+                item.update(evaluate_query_plan(pred_sql, conn, gold_sql, analyze=analyze))
+
+    except (psycopg2.InterfaceError, psycopg2.OperationalError, PoolError) as conn_err:
+        item["plan_error"] = f"connection error: {str(conn_err)}"
+
+    except Exception as e:
+        item["plan_error"] = f"{type(e).__name__}: {e}"
+
+    return item
+
+def evaluate_records(records, analyze: bool = EXPLAIN_ANALYZE):
+    """逐条对 gold_sql 与 pred_sql 执行 EXPLAIN，产出带计划代价的记录"""
+    try:
+        for item in records:
+            yield evaluate_item(item, analyze)
+    finally:
+        close_all()
+
+def is_cacheable(item):
+    # 连接中断属于暂时性失败，不写入增量缓存，下次重新评测
+    return not str(item.get("plan_error") or "").startswith("connection error")
+
+def evaluate_file(path, cache: EvalResultCache = None, analyze: bool = EXPLAIN_ANALYZE):
+    """评测 path 中的记录；给定 cache 时只评测新增或输入变化的记录，其余取缓存结果"""
+    evaluate = functools.partial(evaluate_records, analyze=analyze)
+    if cache is None:
+        return evaluate(iter_jsonl(path))
+    version = f"{EVALUATOR_VERSION}:{'analyze' if analyze else 'plan'}"
+    return evaluate_incremental(path, evaluate, cache, "query_plan", HASH_FIELDS, version,
+                                cacheable=is_cacheable)
+
+def main(incremental: bool = False, analyze: bool = EXPLAIN_ANALYZE):
+    cache = EvalResultCache(cache_path) if incremental else None
+    try:
+        results = evaluate_file(input_path, cache, analyze)
+        write_jsonl(output_path, tqdm(results, total=count_lines(input_path), desc="explain", ncols=80))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    print(f"Complete: {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN-based cost profile of pred_sql against gold_sql.")
+    parser.add_argument("--analyze", action="store_true", default=EXPLAIN_ANALYZE,
+                        help="run EXPLAIN (ANALYZE, BUFFERS) instead of a plain EXPLAIN (default: EXPLAIN_ANALYZE)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only evaluate records whose pred_sql / gold_sql / db_id changed since the last run")
+    args = parser.parse_args()
+    main(incremental=args.incremental, analyze=args.analyze)
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
+import argparse
 import json
 import os
-import psycopg2
 from tqdm import tqdm
-from evaluate_semantic_pgtype import evaluate_function_args_dynamic
+from jsonl_io import iter_jsonl, write_jsonl
+from evaluate_semantic_pgtype import (evaluate_function_args_dynamic, load_signature_index, PgTypeofCache,
+                                      EVALUATOR_VERSION)
+from incremental import EvalResultCache, evaluate_incremental, file_fingerprint
+from db_pool import get_pool
 
 model_name = os.environ.get("MODEL_NAME", "default-model")
 base_dir = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results")
@@ -16,6 +20,15 @@ schema_dataset_path = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Questi
 # 函数签名文件
 signature_path = r"./GeoSQL-Eval/GeoSQL-Bench/function_signatures.json"
 
+cache_path = os.path.join(base_dir, model_name, "eval_cache.sqlite")
+
+# 增量评测：这些字段、EVALUATOR_VERSION、函数签名与 id->函数映射文件都未变化的记录直接复用上次结果
+HASH_FIELDS = ("pred_sql", "id", "function_name", "function")
+
+# 参数表达式 -> pg_typeof 结果，跨条目共享，各轮与各模型重复的字面量参数只解析一次
+PGTYPE_CACHE_SIZE = int(os.environ.get("PGTYPE_CACHE_SIZE", "100000"))
+_type_cache = PgTypeofCache(maxsize=PGTYPE_CACHE_SIZE)
+
 def load_jsonl(path):
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
@@ -36,26 +49,17 @@ def build_id_to_function_map(schema_dataset_path):
             missing += 1
     return mapping
 
-def main():
-    with open(signature_path, "r", encoding="utf-8") as f:
-        function_signatures = json.load(f)
+def evaluate_records(records):
+    """逐条评估 pred_sql 中目标函数的参数类型，产出带评估结果的记录"""
+    function_signatures = load_signature_index(signature_path)
 
     id2func = build_id_to_function_map(schema_dataset_path)
 
-    conn = psycopg2.connect(
-        dbname="postgres",
-        user="postgres",
-        password="*******",
-        host="localhost",
-        port=5432
-    )
-    conn.autocommit = True
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    # 逐条从共享连接池取用连接，失效的连接在取用前由连接池检测并重连
+    pool = get_pool("postgres", autocommit=True)
 
-    with open(input_path, "r", encoding="utf-8") as fin, open(output_path, "w", encoding="utf-8") as fout:
-        for line in tqdm(fin, desc="Evaluating function param types"):
-            item = json.loads(line)
+    try:
+        for item in records:
             try:
                 sql = item.get("pred_sql", "") or ""
                 sample_id = item.get("id")
@@ -72,7 +76,9 @@ def main():
                 if not function_name:
                     raise ValueError("Missing function_name (id->new_id mapping or fallback failed)")
 
-                eval_result = evaluate_function_args_dynamic(sql, function_name, conn, function_signatures)
+                with pool.connection() as conn:
+                    eval_result = evaluate_function_args_dynamic(sql, function_name, conn, function_signatures,
+                                                                 type_cache=_type_cache)
 
                 item["function_name_used"] = function_name
                 item.update(eval_result)
@@ -80,10 +86,33 @@ def main():
             except Exception as e:
                 item["error"] = f"{type(e).__name__}: {e}"
 
-            fout.write(json.dumps(item, ensure_ascii=False) + "\n")
+            yield item
+    finally:
+        pool.close()
+        print(f"pg_typeof cache: {_type_cache.stats()}")
+
+def evaluate_file(path, cache: EvalResultCache = None):
+    """评测 path 中的记录；给定 cache 时只评测新增或输入变化的记录，其余取缓存结果"""
+    if cache is None:
+        return evaluate_records(iter_jsonl(path))
+    version = f"{EVALUATOR_VERSION}:{file_fingerprint(signature_path)}:{file_fingerprint(schema_dataset_path)}"
+    return evaluate_incremental(path, evaluate_records, cache, "semantic_pgtype", HASH_FIELDS, version)
+
+def main(incremental: bool = False):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    cache = EvalResultCache(cache_path) if incremental else None
+    try:
+        results = evaluate_file(input_path, cache)
+        write_jsonl(output_path, tqdm(results, desc="Evaluating function param types"))
+    finally:
+        if cache is not None:
+            cache.close()
 
-    conn.close()
     print(f"\n已保存参数类型语义评估结果至：{output_path}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Evaluate parameter types of the target function in pred_sql.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only evaluate records whose pred_sql / function changed since the last run")
+    main(incremental=parser.parse_args().incremental)
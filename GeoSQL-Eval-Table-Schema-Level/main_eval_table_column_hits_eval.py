@@ -8,11 +8,11 @@ BASE_DIR   = os.environ.get("BASE_DIR", r"./GeoSQL-Eval/GeoSQL_Table_Schema_Leve
 
 GEN_OUTPUT_PATH         = os.path.join(BASE_DIR, MODEL_NAME, "predictions_deduplicated_with_dbid.jsonl")
 SCHEMA_DATASET_PATH     = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Explicit.jsonl"
-GOLD_PICKED_PATH        = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_table&column_picked.jsonl"
 PRED_PICKED_PATH        = os.path.join(BASE_DIR, MODEL_NAME, "predictions_output_picked.jsonl")
 SUMMARY_RESULT_PATH     = os.path.join(BASE_DIR, MODEL_NAME, "eval_summary_table_column_hits.json")
 
-from pick_by_tableschema import process_record
+from pick_by_tableschema import process_record, get_schema_catalog
+from jsonl_io import iter_jsonl
 
 def load_jsonl(path):
     with open(path, 'r', encoding='utf-8') as f:
@@ -36,7 +36,11 @@ def build_schema_map(schema_dataset_items):
             out[nid] = schema_text
     return out
 
-def extract_from_predictions(gen_items, id2schema):
+def build_catalog_map(id2schema):
+    """new_id -> SchemaCatalog；schema 文本相同的问题（同一 db_id）共用一个 catalog"""
+    return {nid: get_schema_catalog(schema_text) for nid, schema_text in id2schema.items()}
+
+def extract_from_predictions(gen_items, id2catalog):
     extracted = []
     for it in gen_items:
         _id = it.get("id")
@@ -45,8 +49,8 @@ def extract_from_predictions(gen_items, id2schema):
         if _id is None or not sql:
             continue
 
-        schema_text = id2schema.get(_id)
-        if not schema_text:
+        catalog = id2catalog.get(_id)
+        if catalog is None:
             extracted.append({
                 "id": _id,
                 "db_id": db_id,
@@ -57,11 +61,10 @@ def extract_from_predictions(gen_items, id2schema):
         payload = {
             "new_id": _id,
             "db_id": db_id,
-            "query": sql,
-            "schema": schema_text
+            "query": sql
         }
         try:
-            res = process_record(payload)
+            res = process_record(payload, catalog=catalog)
             res["id"] = _id
             if "new_id" in res:
                 res.pop("new_id", None)
@@ -74,6 +77,20 @@ def extract_from_predictions(gen_items, id2schema):
             })
     return extracted
 
+def extract_from_gold(schema_items, id2catalog):
+    # gold 与 pred 用同一个 process_record 抽取，命中率不受抽取器差异影响
+    extracted = []
+    for it in schema_items:
+        nid = it.get("new_id")
+        catalog = id2catalog.get(nid)
+        if nid is None or catalog is None or not it.get("query"):
+            continue
+        try:
+            extracted.append(process_record(it, catalog=catalog))
+        except Exception as e:
+            extracted.append({"new_id": nid, "db_id": it.get("db_id"), "error": f"{type(e).__name__}: {e}"})
+    return extracted
+
 def build_lookup_map(data, prefer_id=True):
     out = {}
     for item in data:
@@ -128,36 +145,44 @@ def compute_summary_hit_rate(pred_map, gold_map):
         "column_total_count": column_total
     }
 
-def main():
-    print("Loading prediction file:", GEN_OUTPUT_PATH)
-    gen_items = load_jsonl(GEN_OUTPUT_PATH)
-
+def evaluate_table_column_hits(gen_items):
+    """从 pred_sql 抽取表/列并与 gold 对比，返回 (pred_picked, summary)"""
     print("Loading Schema dataset (with new_id, schema):", SCHEMA_DATASET_PATH)
     schema_items = load_jsonl(SCHEMA_DATASET_PATH)
-    id2schema = build_schema_map(schema_items)  # new_id -> schema
+    id2catalog = build_catalog_map(build_schema_map(schema_items))  # new_id -> SchemaCatalog
 
     print("Extracting table/column structures based on pred_sql (reusing process_record)…")
-    pred_picked = extract_from_predictions(gen_items, id2schema)
-    save_jsonl(PRED_PICKED_PATH, pred_picked)
-    print("Prediction extraction results saved:", PRED_PICKED_PATH)
+    pred_picked = extract_from_predictions(gen_items, id2catalog)
 
-    print("Loading gold standard (already extracted):", GOLD_PICKED_PATH)
-    gold_picked = load_jsonl(GOLD_PICKED_PATH)
+    print("Extracting table/column structures based on the gold query (same process_record)…")
+    gold_picked = extract_from_gold(schema_items, id2catalog)
 
     print("Calculating hit rate (tables / columns)…")
-    # Predictions use id; gold extracted file usually uses new_id
+    # Predictions use id; gold uses new_id
     pred_map = build_lookup_map(pred_picked, prefer_id=True)
     gold_map = build_lookup_map(gold_picked, prefer_id=False)
 
-    summary = compute_summary_hit_rate(pred_map, gold_map)
+    return pred_picked, compute_summary_hit_rate(pred_map, gold_map)
 
-    os.makedirs(os.path.dirname(SUMMARY_RESULT_PATH), exist_ok=True)
-    with open(SUMMARY_RESULT_PATH, 'w', encoding='utf-8') as f:
+def save_summary(path, summary):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
         json.dump(summary, f, ensure_ascii=False, indent=2)
 
-    print(f"✅ Hit rate statistics completed, results saved to: {SUMMARY_RESULT_PATH}")
+    print(f"✅ Hit rate statistics completed, results saved to: {path}")
     print("📈 Overall summary results:", summary)
 
+def main():
+    print("Loading prediction file:", GEN_OUTPUT_PATH)
+    # 预测文件可能很大，流式读取；只保留抽取出的表/列结构
+    gen_items = iter_jsonl(GEN_OUTPUT_PATH)
+
+    pred_picked, summary = evaluate_table_column_hits(gen_items)
+    save_jsonl(PRED_PICKED_PATH, pred_picked)
+    print("Prediction extraction results saved:", PRED_PICKED_PATH)
+
+    save_summary(SUMMARY_RESULT_PATH, summary)
+
 
 if __name__ == "__main__":
     main()
@@ -4,7 +4,9 @@ import sys
 import os
 import json
 import re
+import hashlib
 from collections import OrderedDict
+from sql_analysis import MANAGEMENT_FUNCS, analyze_sql, management_ref
 
 DEFAULT_INPUT = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Explicit.jsonl"
 
@@ -14,29 +16,6 @@ RESERVED = {
     'left','right','inner','outer','full','cross','union','all'
 }
 
-MANAGEMENT_FUNCS = {
-    "dropgeometrytable":        {"table_args": [(0,), (0, 1)], "col_args": []},
-    "addgeometrycolumn": {
-        "table_args": [(0,), (0, 1)],
-        "col_args": [1, 2]
-    },
-    "dropgeometrycolumn": {
-        "table_args": [(0,), (0, 1)],
-        "col_args": [1, 2]
-    },
-    "find_srid": {
-        "table_args": [(0, 1)],
-        "col_args": [2]
-    },
-    "recovergeometrycolumn":    {"table_args": [(0, 1)],       "col_args": [2]},
-    "populate_geometry_columns":{"table_args": [(0,)],         "col_args": []},
-    "updategeometrysrid": {
-    "table_args": [(0,), (0, 1)],
-    "col_args": [1, 2]
-},
-    "st_estimatedextent":       {"table_args": [(0,)],         "col_args": [1]},
-}
-
 import re
 
 def _split_args_top(args_blob: str):
@@ -75,8 +54,20 @@ def _unquote_str_like(s: str):
         return s[1:-1].replace("''", "'")
     return None
 
-def find_management_refs(sql: str, known_tables: set, table_cols_map: dict):
+def _filter_management_refs(refs, known_tables: set, table_cols_map: dict):
     out = OrderedDict()
+    for table_name, cols in refs:
+        if table_name in known_tables:
+            if table_name not in out:
+                out[table_name] = []
+            valid_cols = table_cols_map.get(table_name, ())
+            for c in cols:
+                if c in valid_cols and c not in out[table_name]:
+                    out[table_name].append(c)
+    return out
+
+def find_management_refs(sql: str, known_tables: set, table_cols_map: dict):
+    refs = []
     fn_pat = re.compile(r'\b([A-Za-z_]\w*)\s*\(', flags=re.I)
     pos, n = 0, len(sql)
     while True:
@@ -98,38 +89,12 @@ def find_management_refs(sql: str, known_tables: set, table_cols_map: dict):
         args_blob = sql[pos:j-1] if depth == 0 else ""
         args = _split_args_top(args_blob)
 
-        table_name = None
-        for combo in MANAGEMENT_FUNCS[fn]["table_args"]:
-            if max(combo, default=-1) < len(args):
-                if len(combo) == 1:
-                    t0 = _unquote_str_like(args[combo[0]])
-                    if t0:
-                        table_name = t0
-                        break
-                elif len(combo) == 2:
-                    s0 = _unquote_str_like(args[combo[0]])
-                    s1 = _unquote_str_like(args[combo[1]])
-                    if s0 and s1:
-                        table_name = s1
-                        break
-
-        cols = []
-        for k in MANAGEMENT_FUNCS[fn]["col_args"]:
-            if k < len(args):
-                c = _unquote_str_like(args[k])
-                if c:
-                    cols.append(c)
-
-        if table_name and table_name in known_tables:
-            if table_name not in out:
-                out[table_name] = []
-            valid_cols = table_cols_map.get(table_name, [])
-            for c in cols:
-                if c in valid_cols and c not in out[table_name]:
-                    out[table_name].append(c)
+        ref = management_ref(fn, [_unquote_str_like(a) for a in args])
+        if ref is not None:
+            refs.append(ref)
 
         pos = j
-    return out
+    return _filter_management_refs(refs, known_tables, table_cols_map)
 
 def sanitize_sql(sql: str) -> str:
     sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.S)
@@ -322,6 +287,46 @@ def parse_schema_text(schema_text: str):
 
     return tables
 
+class SchemaCatalog:
+    """
+    Parsed schema text with the lookups used per prediction precomputed:
+    column sets per table, a column -> owning tables inverted index and
+    case-insensitive table/column name maps.
+    """
+
+    def __init__(self, table_cols_map):
+        self.table_cols_map = table_cols_map  # OrderedDict: table -> [columns]
+        self.known_tables = frozenset(table_cols_map)
+        self.table_cols = {t: frozenset(cols) for t, cols in table_cols_map.items()}
+        owners = OrderedDict()
+        for t, cols in table_cols_map.items():
+            for c in OrderedDict.fromkeys(cols):
+                owners.setdefault(c, []).append(t)
+        self.col_owners = {c: tuple(ts) for c, ts in owners.items()}
+        self.tables_ci = {t.lower(): t for t in table_cols_map}
+        self.cols_ci = {c.lower(): c for c in self.col_owners}
+
+    @classmethod
+    def from_text(cls, schema_text: str):
+        return cls(parse_schema_text(schema_text))
+
+    def table_name(self, name: str) -> str:
+        """按 schema 中的写法还原表名（pglast 会把未加引号的标识符转成小写）"""
+        return name if name in self.table_cols else self.tables_ci.get(name.lower(), name)
+
+    def column_name(self, name: str) -> str:
+        return name if name in self.col_owners else self.cols_ci.get(name.lower(), name)
+
+_catalogs = {}
+
+def get_schema_catalog(schema_text: str) -> SchemaCatalog:
+    """按 schema 文本的哈希复用 SchemaCatalog：同一 db_id 的各问题、各轮只解析一次"""
+    key = hashlib.sha1(schema_text.encode("utf-8")).hexdigest()
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        catalog = _catalogs[key] = SchemaCatalog.from_text(schema_text)
+    return catalog
+
 
 def parse_tables_with_alias(sql: str):
     order_tables = []
@@ -342,24 +347,37 @@ def parse_tables_with_alias(sql: str):
             alias_map[alias] = base
     return order_tables, alias_map
 
-def extract_by_tableschema(sql, table_cols_map, order_tables, alias_map, include_empty_from_tables=False):
+def extract_by_tableschema(sql, table_cols_map, order_tables, alias_map, include_empty_from_tables=False,
+                           qualified_columns=None, bare_columns=None, catalog: SchemaCatalog = None):
+    """
+    qualified_columns / bare_columns 未给出时用正则从 sql 中扫描；
+    catalog 未给出时由 table_cols_map 现建
+    """
+    if catalog is None:
+        catalog = SchemaCatalog(table_cols_map)
+    table_cols = catalog.table_cols
+    order_set = set(order_tables)
     result_by_table = OrderedDict((t, []) for t in order_tables)
     seen_by_table = {t: set() for t in order_tables}
 
-    for alias_or_table, col in find_qualified_columns(sql):
+    if qualified_columns is None:
+        qualified_columns = find_qualified_columns(sql)
+    if bare_columns is None:
+        bare_columns = find_bare_columns(sql)
+
+    for alias_or_table, col in qualified_columns:
         base = alias_map.get(alias_or_table)
         if not base:
             continue
-        if base in table_cols_map and col in table_cols_map[base]:
+        if base in table_cols and col in table_cols[base]:
             if col not in seen_by_table[base]:
                 result_by_table[base].append(col)
                 seen_by_table[base].add(col)
 
-    bare_tokens = find_bare_columns(sql)
-    for tok in bare_tokens:
+    for tok in bare_columns:
         if tok in alias_map or tok.lower() in RESERVED:
             continue
-        owners = [t for t in order_tables if tok in set(table_cols_map.get(t, []))]
+        owners = [t for t in catalog.col_owners.get(tok, ()) if t in order_set]
         if len(owners) == 1:
             t = owners[0]
             if tok not in seen_by_table[t]:
@@ -370,20 +388,48 @@ def extract_by_tableschema(sql, table_cols_map, order_tables, alias_map, include
     for t in order_tables:
         if result_by_table[t]:
             out.append({"table": t, "columns": result_by_table[t]})
-        elif include_empty_from_tables and t in table_cols_map:
+        elif include_empty_from_tables and t in table_cols:
             out.append({"table": t, "columns": []})
     return out
 
-def process_record(rec: dict):
+def _resolve_ast_names(analysis, catalog: SchemaCatalog):
+    """pglast 会把未加引号的标识符转成小写，这里按 schema 中的写法还原表名和列名"""
+    table, column = catalog.table_name, catalog.column_name
+
+    order_tables = list(OrderedDict.fromkeys(table(t) for t in analysis.tables))
+    alias_map = {}
+    for key, base in analysis.alias_map.items():
+        alias_map[key] = table(base)
+        alias_map.setdefault(key.lower(), table(base))
+    for base in order_tables:
+        alias_map.setdefault(base, base)
+
+    qualified = [(left, column(col)) for left, col in analysis.qualified_columns]
+    bare = [column(col) for col in analysis.bare_columns]
+    return order_tables, alias_map, qualified, bare
+
+def process_record(rec: dict, catalog: SchemaCatalog = None):
+    """catalog 未给出时按 rec["schema"] 取（缓存的）SchemaCatalog"""
     new_id = rec.get('new_id')
     db_id = rec.get('db_id')   # 这里新增
     sql = rec.get('query', '') or ''
-    schema_text = rec.get('schema', '') or ''
-
-    table_cols_map = parse_schema_text(schema_text)
-    order_tables, alias_map = parse_tables_with_alias(sql)
 
-    mgmt_refs = find_management_refs(sql, set(table_cols_map.keys()), table_cols_map)  # OrderedDict
+    if catalog is None:
+        catalog = get_schema_catalog(rec.get('schema', '') or '')
+    table_cols_map = catalog.table_cols_map
+    table_cols = catalog.table_cols
+    known_tables = catalog.known_tables
+
+    # 与 pgtype 评测共享同一次 pglast 解析（见 sql_analysis.py）
+    analysis = analyze_sql(sql)
+    if not analysis.error:
+        order_tables, alias_map, qualified, bare = _resolve_ast_names(analysis, catalog)
+        mgmt_refs = _filter_management_refs(analysis.management_refs, known_tables, table_cols)
+    else:
+        # 模型输出的 SQL 常有语法错误，pglast 无法解析时退回正则扫描
+        order_tables, alias_map = parse_tables_with_alias(sql)
+        qualified, bare = None, None
+        mgmt_refs = find_management_refs(sql, known_tables, table_cols)  # OrderedDict
 
     order_tables_all = []
     seen = set()
@@ -394,7 +440,8 @@ def process_record(rec: dict):
 
     tables = extract_by_tableschema(
         sql, table_cols_map, order_tables_all, alias_map,
-        include_empty_from_tables=True
+        include_empty_from_tables=True,
+        qualified_columns=qualified, bare_columns=bare, catalog=catalog
     )
 
     by_table = {t["table"]: t for t in tables}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Optional per-item profiling of evaluate_sql_execution.
+
+An ItemProfile splits an item's wall time into phases with
+time.perf_counter() laps (each lap covers the time since the previous one:
+connection checkout, gold, pred fetch, DataFrame building, geometry
+normalization, column matching, ...) and counts the statements sent to
+PostgreSQL while the item runs. The counting works by switching the
+connection's cursor_factory to CountingCursor inside profiled(), so helpers
+that open their own cursors are counted too. The execution evaluator
+stores ItemProfile.as_dict() under item["profile"]; eval_summary_profile.py
+aggregates those into eval_profile.json.
+
+    profile = ItemProfile()
+    with profiled(db_conn, profile):
+        ...
+        lap(profile, "pred_fetch")
+"""
+import time
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+# 当前正在计数的 ItemProfile（每个进程同一时刻只评测一条）
+_active = None
+
+
+class ItemProfile:
+    def __init__(self):
+        self.phases = {}
+        self.round_trips = 0
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, name: str):
+        """把上一次 lap（或创建）以来的时间记入 name 阶段"""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def as_dict(self) -> dict:
+        return {
+            "total_sec": round(time.perf_counter() - self._start, 6),
+            "phases": {name: round(sec, 6) for name, sec in self.phases.items()},
+            "round_trips": self.round_trips
+        }
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Counts execute() calls, and FETCHes of named cursors, into the active ItemProfile."""
+
+    def _count(self):
+        if _active is not None:
+            _active.round_trips += 1
+
+    def execute(self, query, vars=None):
+        self._count()
+        return super().execute(query, vars)
+
+    def fetchmany(self, size=None):
+        if self.name is not None:
+            self._count()
+        return super().fetchmany(self.arraysize if size is None else size)
+
+    def fetchall(self):
+        if self.name is not None:
+            self._count()
+        return super().fetchall()
+
+
+def lap(profile, name: str):
+    """profile 为 None（未开启 profiling）时什么也不做"""
+    if profile is not None:
+        profile.lap(name)
+
+
+@contextmanager
+def profiled(db_conn, profile):
+    """在代码块内把 db_conn 上执行的语句计入 profile"""
+    global _active
+    if profile is None:
+        yield
+        return
+    prev_factory, prev_active = db_conn.cursor_factory, _active
+    db_conn.cursor_factory = CountingCursor
+    _active = profile
+    try:
+        yield
+    finally:
+        db_conn.cursor_factory = prev_factory
+        _active = prev_active
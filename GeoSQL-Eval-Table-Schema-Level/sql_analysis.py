@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass AST analysis of a predicted SQL statement.
+
+analyze_sql() parses the SQL once with pglast and collects everything the
+Table-Schema evaluators read from it: referenced tables and their aliases,
+qualified and bare column references, table/column references passed as
+string arguments to geometry management functions (AddGeometryColumn,
+Find_SRID, ...), and every function call with the text of its arguments.
+Results are memoized by SQL text, so the table/column hit evaluator
+(pick_by_tableschema.process_record) and the pgtype evaluator
+(evaluate_semantic_pgtype) share one parse per distinct prediction, also
+across the 5 rounds that often return the same SQL.
+
+Unquoted identifiers come back lowercased, as PostgreSQL folds them;
+callers match them against the schema case-insensitively. When pglast
+cannot parse the SQL, SqlAnalysis.error is set and the other fields are
+empty.
+"""
+import functools
+import os
+import re
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from pglast import parse_sql
+from pglast.enums.parsenodes import TransactionStmtKind
+from pglast.stream import RawStream
+from pglast.visitors import Visitor
+
+ANALYSIS_CACHE_SIZE = int(os.environ.get("SQL_ANALYSIS_CACHE_SIZE", "50000"))
+
+# 管理函数中以字符串参数给出表名/列名的位置：
+# table_args 依次尝试，单个下标为表名，(schema, table) 两个下标时取后者；col_args 为列名参数下标
+MANAGEMENT_FUNCS = {
+    "dropgeometrytable":        {"table_args": [(0,), (0, 1)], "col_args": []},
+    "addgeometrycolumn": {
+        "table_args": [(0,), (0, 1)],
+        "col_args": [1, 2]
+    },
+    "dropgeometrycolumn": {
+        "table_args": [(0,), (0, 1)],
+        "col_args": [1, 2]
+    },
+    "find_srid": {
+        "table_args": [(0, 1)],
+        "col_args": [2]
+    },
+    "recovergeometrycolumn":    {"table_args": [(0, 1)],       "col_args": [2]},
+    "populate_geometry_columns":{"table_args": [(0,)],         "col_args": []},
+    "updategeometrysrid": {
+    "table_args": [(0,), (0, 1)],
+    "col_args": [1, 2]
+},
+    "st_estimatedextent":       {"table_args": [(0,)],         "col_args": [1]},
+}
+
+
+class FuncCallInfo(NamedTuple):
+    name: str                          # 小写函数名，带 schema 时以 "." 连接
+    args: Tuple[str, ...]              # 各参数的 SQL 文本
+    str_args: Tuple[Optional[str], ...]  # 参数为字符串常量（可带 ::regclass 等转换）时的值，否则为 None
+    location: int
+
+
+class SqlAnalysis(NamedTuple):
+    error: str                                     # 解析失败时的错误信息
+    tables: Tuple[str, ...]                        # 按出现顺序去重的表名（不含 schema）
+    alias_map: Dict[str, str]                      # 别名 / 表名 / schema.表名 -> 表名；共享缓存，勿修改
+    qualified_columns: Tuple[Tuple[str, str], ...]  # (表名或别名, 列名)
+    bare_columns: Tuple[str, ...]                  # 未限定的列名，按出现顺序去重
+    management_refs: Tuple[Tuple[str, Tuple[str, ...]], ...]  # 管理函数引用的 (表名, 列名)，未按 schema 过滤
+    func_calls: Tuple[FuncCallInfo, ...]           # 全部函数调用，外层调用在其参数中的调用之前
+
+
+def management_ref(func_name: str, str_args):
+    """按 MANAGEMENT_FUNCS 从字符串参数中取出 (表名, 列名列表)；不是管理函数或取不到表名时返回 None"""
+    spec = MANAGEMENT_FUNCS.get(func_name)
+    if spec is None:
+        return None
+
+    table_name = None
+    for combo in spec["table_args"]:
+        if max(combo, default=-1) < len(str_args):
+            if len(combo) == 1:
+                t0 = str_args[combo[0]]
+                if t0:
+                    table_name = t0
+                    break
+            elif len(combo) == 2:
+                s0 = str_args[combo[0]]
+                s1 = str_args[combo[1]]
+                if s0 and s1:
+                    table_name = s1
+                    break
+    if not table_name:
+        return None
+
+    cols = [str_args[k] for k in spec["col_args"] if k < len(str_args) and str_args[k]]
+    return table_name, cols
+
+
+def _string_value(node) -> Optional[str]:
+    if type(node).__name__ == "TypeCast":
+        node = node.arg
+    if type(node).__name__ != "A_Const" or getattr(node, "isnull", False):
+        return None
+    val = node.val
+    return val.sval if type(val).__name__ == "String" else None
+
+
+def _names(fields):
+    return [f.sval for f in fields if type(f).__name__ == "String"]
+
+
+class _Collector(Visitor):
+    def __init__(self):
+        super().__init__()
+        self.range_vars = []     # (location, base, raw, alias)
+        self.column_refs = []    # (location, fields)
+        self.target_cols = []    # INSERT 列表、UPDATE SET 与索引中的列名
+        self.func_calls = []
+
+    def visit_RangeVar(self, ancestors, node):
+        base = node.relname
+        raw = f"{node.schemaname}.{base}" if node.schemaname else base
+        alias = node.alias.aliasname if node.alias is not None else None
+        self.range_vars.append((node.location, base, raw, alias))
+
+    def visit_ColumnRef(self, ancestors, node):
+        fields = node.fields or ()
+        if fields and all(type(f).__name__ == "String" for f in fields):
+            self.column_refs.append((node.location, _names(fields)))
+
+    def visit_InsertStmt(self, ancestors, node):
+        for target in node.cols or ():
+            self.target_cols.append(target.name)
+
+    def visit_UpdateStmt(self, ancestors, node):
+        for target in node.targetList or ():
+            self.target_cols.append(target.name)
+
+    def visit_IndexElem(self, ancestors, node):
+        if node.name:
+            self.target_cols.append(node.name)
+
+    def visit_FuncCall(self, ancestors, node):
+        args = node.args or ()
+        self.func_calls.append(FuncCallInfo(
+            name=".".join(_names(node.funcname)).lower(),
+            args=tuple(RawStream()(arg).strip() for arg in args),
+            str_args=tuple(_string_value(arg) for arg in args),
+            location=node.location
+        ))
+
+
+def _dedup(items):
+    return tuple(dict.fromkeys(items))
+
+
+@functools.lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def analyze_sql(sql: str) -> SqlAnalysis:
+    try:
+        tree = parse_sql(sql)
+    except Exception as e:
+        return SqlAnalysis(str(e), (), {}, (), (), (), ())
+
+    collector = _Collector()
+    collector(tree)
+
+    tables = []
+    alias_map = {}
+    for _, base, raw, alias in sorted(collector.range_vars, key=lambda r: r[0]):
+        tables.append(base)
+        alias_map[base] = base
+        alias_map[raw] = base
+        if alias:
+            alias_map[alias] = base
+
+    qualified, bare = [], []
+    for _, fields in sorted(collector.column_refs, key=lambda c: c[0]):
+        if len(fields) >= 2:
+            qualified.append((fields[-2], fields[-1]))
+        else:
+            bare.append(fields[0])
+    bare.extend(collector.target_cols)
+
+    management_refs = []
+    for call in collector.func_calls:
+        ref = management_ref(call.name.rsplit(".", 1)[-1], call.str_args)
+        if ref is not None:
+            management_refs.append((ref[0], tuple(ref[1])))
+
+    return SqlAnalysis(
+        error="",
+        tables=_dedup(tables),
+        alias_map=alias_map,
+        qualified_columns=tuple(qualified),
+        bare_columns=_dedup(bare),
+        management_refs=tuple(management_refs),
+        func_calls=tuple(collector.func_calls)
+    )
+
+
+# 在评测事务中可以直接忽略的事务控制语句（BEGIN 重复开启只有警告，COMMIT 会提交沙箱事务）
+_IGNORED_TX_KINDS = {
+    TransactionStmtKind.TRANS_STMT_BEGIN,
+    TransactionStmtKind.TRANS_STMT_START,
+    TransactionStmtKind.TRANS_STMT_COMMIT,
+}
+# 会结束或拆分沙箱事务、无法在评测事务内等价执行的语句
+_REJECTED_TX_KINDS = {
+    TransactionStmtKind.TRANS_STMT_ROLLBACK,
+    TransactionStmtKind.TRANS_STMT_PREPARE,
+    TransactionStmtKind.TRANS_STMT_COMMIT_PREPARED,
+    TransactionStmtKind.TRANS_STMT_ROLLBACK_PREPARED,
+}
+_TX_KEYWORDS = re.compile(r"\b(BEGIN|START|COMMIT|END|ROLLBACK|ABORT|PREPARE)\b", re.IGNORECASE)
+
+
+def strip_transaction_control(sql: str) -> Tuple[str, str]:
+    """
+    Make a prediction safe to run inside the evaluator's transaction.
+    Returns (sql, error). Top-level BEGIN / START TRANSACTION / COMMIT / END
+    statements are dropped, so "BEGIN; ...; COMMIT;" runs its body in the
+    sandbox instead of committing it; ROLLBACK / ABORT and two-phase commit
+    statements set error. SQL without such keywords, or that pglast cannot
+    parse, is returned unchanged and left to PostgreSQL.
+    """
+    if not sql or not _TX_KEYWORDS.search(sql):
+        return sql, ""
+    try:
+        stmts = parse_sql(sql)
+    except Exception:
+        return sql, ""
+
+    kept, dropped = [], False
+    for raw in stmts:
+        kind = getattr(raw.stmt, "kind", None) if type(raw.stmt).__name__ == "TransactionStmt" else None
+        if kind in _REJECTED_TX_KINDS:
+            return sql, f"transaction control statement not allowed in the evaluation sandbox: {kind.name}"
+        if kind in _IGNORED_TX_KINDS:
+            dropped = True
+            continue
+        start = raw.stmt_location
+        kept.append(sql[start:start + raw.stmt_len] if raw.stmt_len else sql[start:])
+    if not dropped:
+        return sql, ""
+    return ";\n".join(kept), ""
+
+
+def analysis_cache_stats() -> Dict[str, int]:
+    info = analyze_sql.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
@@ -7,13 +7,15 @@ from typing import List, Dict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 from tqdm.auto import tqdm
-from call_language_model import call_language_model
+from call_language_model import call_language_model, get_cache_stats
 
 
 INPUT_PATH = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Explicit.jsonl"
 # INPUT_PATH = r"./GeoSQL-Eval/GeoSQL-Bench/Table_Schema_Retrieval_Question_Underspecified.jsonl"
 OUTPUT_DIR = r"./GeoSQL-Eval/GeoSQL_Table_Schema_Level_results"
 CONFIG_PATH = r"./llm_config.yaml"
+# 响应缓存：中断或改配置后重跑时，已成功的(模型, prompt, 轮次)不再重复请求
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(OUTPUT_DIR, "llm_response_cache.sqlite"))
 
 MODELS_TO_TEST = [
     # {'provider': 'ollama', 'name': 'qwen2.5-coder:32b', 'name_simple': 'qwen2.5-coder-32b'},
@@ -43,7 +45,7 @@ MODELS_TO_TEST = [
 ]
 
 NUM_ROUNDS = 5
-MAX_WORKERS = 1
+MAX_WORKERS = 64  # 线程数上限，实际在途请求数由call_language_model中的限流器自适应控制
 TEMPERATURE = 0.2
 MAX_TOKENS = 12288
 
@@ -126,7 +128,9 @@ def run_single_prediction(item: Dict, model_cfg: Dict, round_id: int) -> Dict:
         stream=False,
         temperature=TEMPERATURE,
         max_tokens=MAX_TOKENS,
-        config_path=CONFIG_PATH
+        config_path=CONFIG_PATH,
+        cache_path=CACHE_PATH,
+        cache_seed=round_id
     )
 
     end_time = time.time()
@@ -190,7 +194,7 @@ def run_model_predictions(model_cfg: Dict, dataset: List[Dict]):
             pbar.update(1)
 
     # 多线程调度每条 item+round
-    with ThreadPoolExecutor(max_workers=64) as executor:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         futures = []
         for item in dataset:
             for r in range(1, NUM_ROUNDS + 1):
@@ -211,6 +215,8 @@ def main():
     
     for model_cfg in MODELS_TO_TEST:
         run_model_predictions(model_cfg,dataset)
+    for stats in get_cache_stats():
+        print(f"Response cache: {stats['hits']} hits, {stats['tokens_saved']} tokens saved ({stats['path']})")
     print("\nAll models finished generating SQL predictions.")
 
 if __name__ == '__main__':